@@ -0,0 +1,331 @@
+"""
+各处理阶段的吞吐量和峰值内存基准测试
+
+用法（在仓库根目录执行）:
+    python -m benchmarks.run --size small                      # 运行全部阶段，结果写入 benchmarks/results/latest.json
+    python -m benchmarks.run --save-baseline                   # 同时保存为基线 benchmarks/baseline.json
+    python -m benchmarks.run --baseline benchmarks/baseline.json --tolerance 0.15
+                                                               # 与基线比较，帧/秒、点/秒下降或峰值内存上升超过15%时返回1
+
+每个阶段先重复运行repeat次取最短耗时，再在tracemalloc下单独运行一次记录峰值内存
+（Python对象和NumPy数组，不含OpenCV/Open3D内部的原生分配）。
+缺少可选依赖（例如open3d）的阶段记为skipped，不参与比较。
+"""
+import gc
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import contextlib
+
+import numpy as np
+
+from benchmarks.synthetic import PRESETS, generate_session
+
+# 默认结果和基线文件
+DEFAULT_OUTPUT = os.path.join("benchmarks", "results", "latest.json")
+DEFAULT_BASELINE = os.path.join("benchmarks", "baseline.json")
+
+# 比较时越大越好的指标和越小越好的指标
+HIGHER_IS_BETTER = ('frames_per_sec', 'points_per_sec')
+LOWER_IS_BETTER = ('peak_mem_mb',)
+
+# 需要txt中间文件的旧流程阶段只取前若干帧，避免准备数据耗时过长
+TXT_FRAMES = 20
+
+# merge_point_clouds 每次合并的帧数，与查看器默认窗口（前后各15帧）一致
+MERGE_FRAMES = 31
+
+
+def setup_lidar_read(ctx):
+    """lidar_read.iter_lidar_frames：流式解包并解码整个雷达录制文件"""
+    from lidar_read import iter_lidar_frames
+
+    size = os.path.getsize(ctx['lidar_file'])
+
+    def run():
+        frames = points = 0
+        for _, cloud, _ in iter_lidar_frames(ctx['lidar_file']):
+            frames += 1
+            points += len(cloud)
+        return {'frames': frames, 'points': points, 'bytes_read': size}
+    return run
+
+
+def _write_txt_frames(msg_file, output_dir, count):
+    """按旧流程把前count帧写成 str(dict) 格式的txt文件"""
+    import msgpack
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    with open(msg_file, 'rb') as f:
+        for i, frame in enumerate(msgpack.Unpacker(f, raw=False)):
+            if i >= count:
+                break
+            path = os.path.join(output_dir, f"frame_{i}.txt")
+            with open(path, 'w', encoding='utf-8') as txt_file:
+                txt_file.write(str(frame))
+            paths.append(path)
+    return paths
+
+
+def setup_parse_point_cloud_data(ctx):
+    """cloud_to_ply_open3d.parse_point_cloud_data：解析旧流程的txt帧并生成Open3D点云"""
+    from cloud_to_ply_open3d import parse_point_cloud_data
+
+    paths = _write_txt_frames(ctx['lidar_file'], os.path.join(ctx['workdir'], "lidar_frames"), TXT_FRAMES)
+    size = sum(os.path.getsize(p) for p in paths)
+
+    def run():
+        points = 0
+        for path in paths:
+            points += len(parse_point_cloud_data(path).points)
+        return {'frames': len(paths), 'points': points, 'bytes_read': size}
+    return run
+
+
+def setup_process_image(ctx):
+    """rgb_read.process_image：解析旧流程的相机txt帧、绘制文字并保存JPEG"""
+    from rgb_read import process_image
+
+    image_dir = os.path.join(ctx['workdir'], "camera_frames")
+    paths = _write_txt_frames(ctx['camera_file'], os.path.join(image_dir, "frames"), TXT_FRAMES)
+    os.makedirs(os.path.join(image_dir, "pictures"), exist_ok=True)
+    size = sum(os.path.getsize(p) for p in paths)
+
+    def run():
+        # process_image 写到当前目录下的 pictures/
+        cwd = os.getcwd()
+        os.chdir(image_dir)
+        try:
+            for i, path in enumerate(paths):
+                process_image(path, i)
+        finally:
+            os.chdir(cwd)
+        written = sum(os.path.getsize(os.path.join(image_dir, "pictures", f))
+                      for f in os.listdir(os.path.join(image_dir, "pictures")))
+        return {'frames': len(paths), 'bytes_read': size, 'bytes_written': written}
+    return run
+
+
+def setup_merge_point_clouds(ctx):
+    """rgb_ply_viewer.merge_point_clouds：合并一个窗口内的多帧Open3D点云"""
+    import open3d as o3d
+    from rgb_ply_viewer import merge_point_clouds
+    from lidar_read import iter_lidar_frames
+    from utils.pointcloud2 import cloud_xyz, cloud_intensity, intensity_to_gray
+
+    pcds = []
+    for _, cloud, _ in iter_lidar_frames(ctx['lidar_file'], frames=range(min(MERGE_FRAMES, ctx['lidar_frames']))):
+        pcd = o3d.geometry.PointCloud()
+        pcd.points = o3d.utility.Vector3dVector(cloud_xyz(cloud).astype(np.float64))
+        pcd.colors = o3d.utility.Vector3dVector(intensity_to_gray(cloud_intensity(cloud)))
+        pcds.append(pcd)
+
+    def run():
+        merged = merge_point_clouds(pcds)
+        return {'frames': len(pcds), 'points': len(merged.points)}
+    return run
+
+
+def setup_save_images_as_video(ctx):
+    """video_process.save_images_as_video：把图片文件夹编码为mp4"""
+    from video_process import save_images_as_video
+    from rgb_read import iter_camera_frames
+
+    picture_dir = os.path.join(ctx['workdir'], "pictures")
+    os.makedirs(picture_dir, exist_ok=True)
+    count = 0
+    for i, img_data, _ in iter_camera_frames(ctx['camera_file']):
+        with open(os.path.join(picture_dir, f"frame_{i}.jpg"), 'wb') as f:
+            f.write(img_data)
+        count += 1
+    size = sum(os.path.getsize(os.path.join(picture_dir, f)) for f in os.listdir(picture_dir))
+    output_file = os.path.join(ctx['workdir'], "benchmark.mp4")
+
+    def run():
+        save_images_as_video(picture_dir, output_file, fps=15)
+        return {'frames': count, 'bytes_read': size, 'bytes_written': os.path.getsize(output_file)}
+    return run
+
+
+# 阶段名 -> 准备函数，准备函数返回一个无参数的运行函数，运行函数返回处理的帧数/点数/字节数
+STAGES = {
+    'lidar_read': setup_lidar_read,
+    'parse_point_cloud_data': setup_parse_point_cloud_data,
+    'process_image': setup_process_image,
+    'merge_point_clouds': setup_merge_point_clouds,
+    'save_images_as_video': setup_save_images_as_video,
+}
+
+
+def measure(run, repeat=3):
+    """
+    运行repeat次取最短耗时，再在tracemalloc下运行一次记录峰值内存
+
+    返回:
+        运行函数返回的计数加上 seconds、各项吞吐量和 peak_mem_mb
+    """
+    best = None
+    counts = None
+    # 阶段内部的进度输出不计入终端，只保留本脚本的汇总
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(max(1, repeat)):
+            gc.collect()
+            start = time.perf_counter()
+            counts = run()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        gc.collect()
+        tracemalloc.start()
+        try:
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    result = dict(counts)
+    result['seconds'] = best
+    if 'frames' in counts:
+        result['frames_per_sec'] = counts['frames'] / best
+    if 'points' in counts:
+        result['points_per_sec'] = counts['points'] / best
+    if 'bytes_read' in counts:
+        result['read_mb_per_sec'] = counts['bytes_read'] / best / (1 << 20)
+    result['peak_mem_mb'] = peak / (1 << 20)
+    return result
+
+
+def run_benchmarks(size='small', stages=None, repeat=3, workdir=None, seed=0):
+    """
+    生成合成数据并依次运行各阶段
+
+    返回:
+        结果字典: {'meta': {...}, 'stages': {阶段名: {...}}}
+    """
+    lidar_frames, points, camera_frames, width, height = PRESETS[size]
+    own_workdir = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix="rgb_point_bench_")
+    try:
+        print(f"生成合成数据 ({size}): 雷达 {lidar_frames} 帧 x {points} 点, 相机 {camera_frames} 帧 {width}x{height}")
+        lidar_file, camera_file = generate_session(workdir, lidar_frames, points, camera_frames, width, height, seed)
+        ctx = {'workdir': workdir, 'lidar_file': lidar_file, 'camera_file': camera_file,
+               'lidar_frames': lidar_frames, 'camera_frames': camera_frames}
+
+        results = {}
+        for name in stages or STAGES:
+            try:
+                run = STAGES[name](ctx)
+            except ImportError as e:
+                results[name] = {'status': 'skipped', 'reason': str(e)}
+                print(f"{name}: 跳过 ({e})")
+                continue
+            result = measure(run, repeat)
+            result['status'] = 'ok'
+            results[name] = result
+            print(format_result(name, result))
+    finally:
+        if own_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'size': size,
+            'seed': seed,
+            'repeat': repeat,
+        },
+        'stages': results,
+    }
+
+
+def format_result(name, result):
+    parts = [f"{name}: {result['seconds']:.3f}s"]
+    if 'frames_per_sec' in result:
+        parts.append(f"{result['frames_per_sec']:.1f} 帧/秒")
+    if 'points_per_sec' in result:
+        parts.append(f"{result['points_per_sec'] / 1e6:.2f}M 点/秒")
+    if 'read_mb_per_sec' in result:
+        parts.append(f"{result['read_mb_per_sec']:.1f} MB/秒")
+    parts.append(f"峰值内存 {result['peak_mem_mb']:.1f}MB")
+    return ", ".join(parts)
+
+
+def compare(current, baseline, tolerance=0.15):
+    """
+    与基线比较，返回退化项列表 [(阶段, 指标, 基线值, 当前值)]
+
+    只比较两边都成功运行的阶段；规模不同时比较没有意义，直接提示
+    """
+    if current['meta'].get('size') != baseline['meta'].get('size'):
+        print(f"警告: 基线规模 {baseline['meta'].get('size')} 与当前规模 {current['meta'].get('size')} 不同")
+
+    regressions = []
+    for name, result in current['stages'].items():
+        base = baseline['stages'].get(name)
+        if result.get('status') != 'ok' or not base or base.get('status') != 'ok':
+            continue
+        for metric in HIGHER_IS_BETTER + LOWER_IS_BETTER:
+            if metric not in result or metric not in base or base[metric] == 0:
+                continue
+            ratio = result[metric] / base[metric]
+            worse = ratio < 1 - tolerance if metric in HIGHER_IS_BETTER else ratio > 1 + tolerance
+            flag = "退化" if worse else "正常"
+            print(f"  {name}.{metric}: 基线 {base[metric]:.2f}, 当前 {result[metric]:.2f} ({ratio:.2f}x) {flag}")
+            if worse:
+                regressions.append((name, metric, base[metric], result[metric]))
+    return regressions
+
+
+def save_json(data, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='各处理阶段的吞吐量和峰值内存基准测试')
+    parser.add_argument('--size', type=str, choices=sorted(PRESETS), default='small', help='合成数据规模')
+    parser.add_argument('--stages', type=str, nargs='+', choices=sorted(STAGES), default=None,
+                        help='只运行这些阶段，默认全部')
+    parser.add_argument('--repeat', type=int, default=3, help='每个阶段重复次数，取最短耗时')
+    parser.add_argument('--seed', type=int, default=0, help='合成数据随机种子')
+    parser.add_argument('--workdir', type=str, default=None, help='合成数据目录，默认使用临时目录并在结束后删除')
+    parser.add_argument('--output', type=str, default=DEFAULT_OUTPUT, help='结果JSON文件')
+    parser.add_argument('--baseline', type=str, default=None, help='与该基线JSON比较')
+    parser.add_argument('--save-baseline', action='store_true', help=f'把本次结果保存为基线 {DEFAULT_BASELINE}')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='允许的相对退化比例')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.size, args.stages, args.repeat, args.workdir, args.seed)
+    save_json(results, args.output)
+    print(f"结果已保存到 {args.output}")
+    if args.save_baseline:
+        save_json(results, DEFAULT_BASELINE)
+        print(f"基线已保存到 {DEFAULT_BASELINE}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"与基线 {args.baseline} 比较 (容差 {args.tolerance:.0%}):")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"共 {len(regressions)} 项退化")
+            sys.exit(1)
+        print("没有退化")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import io
+import os
+import argparse
+
+import msgpack
+import numpy as np
+
+# 合成雷达帧的点布局：x/y/z/intensity float32，ring uint16，time float32，共24字节
+LIDAR_FIELDS = [
+    {'name': 'x', 'offset': 0, 'datatype': 7, 'count': 1},
+    {'name': 'y', 'offset': 4, 'datatype': 7, 'count': 1},
+    {'name': 'z', 'offset': 8, 'datatype': 7, 'count': 1},
+    {'name': 'intensity', 'offset': 12, 'datatype': 7, 'count': 1},
+    {'name': 'ring', 'offset': 16, 'datatype': 4, 'count': 1},
+    {'name': 'time', 'offset': 20, 'datatype': 7, 'count': 1},
+]
+LIDAR_POINT_STEP = 24
+LIDAR_DTYPE = np.dtype({
+    'names': ['x', 'y', 'z', 'intensity', 'ring', 'time'],
+    'formats': ['<f4', '<f4', '<f4', '<f4', '<u2', '<f4'],
+    'offsets': [0, 4, 8, 12, 16, 20],
+    'itemsize': LIDAR_POINT_STEP,
+})
+
+# 录制开始时间和两个传感器的周期（秒），与实际数据的约10Hz雷达、15Hz相机一致
+START_TIME = 1743400000.0
+LIDAR_PERIOD = 0.1
+CAMERA_PERIOD = 1.0 / 15
+
+# 预设规模：(雷达帧数, 每帧点数, 相机帧数, 图像宽, 图像高)
+PRESETS = {
+    'small': (50, 20_000, 50, 640, 480),
+    'medium': (300, 30_000, 450, 1280, 720),
+    'large': (1200, 60_000, 1800, 1920, 1080),
+}
+
+
+def lidar_frame(index, num_points, seed=0):
+    """
+    生成一帧PointCloud2风格的雷达消息字典，相同参数得到完全相同的字节
+
+    点分布在若干条扫描线上，模拟地面和周围墙面，强度与距离相关
+    """
+    rng = np.random.default_rng((seed, index))
+    rings = 16
+    ring = np.arange(num_points) % rings
+    azimuth = np.linspace(0, 2 * np.pi, num_points, endpoint=False) + index * 0.01
+    elevation = np.deg2rad(-15 + 2 * ring)
+    distance = 5 + 20 * rng.random(num_points)
+
+    cloud = np.zeros(num_points, dtype=LIDAR_DTYPE)
+    cloud['x'] = distance * np.cos(elevation) * np.cos(azimuth) + index * 0.05
+    cloud['y'] = distance * np.cos(elevation) * np.sin(azimuth)
+    cloud['z'] = distance * np.sin(elevation)
+    cloud['intensity'] = np.clip(300 / distance + rng.normal(0, 5, num_points), 0, 255)
+    cloud['ring'] = ring
+    cloud['time'] = np.linspace(0, LIDAR_PERIOD, num_points, endpoint=False)
+
+    stamp = START_TIME + index * LIDAR_PERIOD
+    return {
+        'header': {'stamp': {'sec': int(stamp), 'nanosec': int(round((stamp % 1) * 1e9))},
+                   'frame_id': 'utlidar_lidar'},
+        'height': 1,
+        'width': num_points,
+        'fields': LIDAR_FIELDS,
+        'is_bigendian': False,
+        'point_step': LIDAR_POINT_STEP,
+        'row_step': LIDAR_POINT_STEP * num_points,
+        'data': cloud.tobytes(),
+        'is_dense': True,
+        'my_time_stamp': stamp,
+    }
+
+
+def camera_frame(index, width, height, seed=0, quality=90):
+    """生成一帧相机消息字典（JPEG图像 + my_time_stamp），相同参数得到完全相同的字节"""
+    from PIL import Image
+
+    rng = np.random.default_rng((seed, index))
+    # 水平渐变背景加噪声，使JPEG大小接近真实图像
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    noise = rng.normal(0, 20, (height, width, 3)).astype(np.float32)
+    pixels = np.clip(gradient + noise + (index * 3) % 64, 0, 255).astype(np.uint8)
+
+    buffer = io.BytesIO()
+    Image.fromarray(pixels, 'RGB').save(buffer, format='JPEG', quality=quality)
+    return {'img': buffer.getvalue(), 'my_time_stamp': START_TIME + index * CAMERA_PERIOD}
+
+
+def write_lidar_msg(file_name, num_frames, num_points, seed=0):
+    """写出合成的雷达录制文件，返回写入的字节数"""
+    with open(file_name, 'wb') as f:
+        for i in range(num_frames):
+            f.write(msgpack.packb(lidar_frame(i, num_points, seed), use_bin_type=True))
+    return os.path.getsize(file_name)
+
+
+def write_camera_msg(file_name, num_frames, width, height, seed=0):
+    """写出合成的相机录制文件，返回写入的字节数"""
+    with open(file_name, 'wb') as f:
+        for i in range(num_frames):
+            f.write(msgpack.packb(camera_frame(i, width, height, seed), use_bin_type=True))
+    return os.path.getsize(file_name)
+
+
+def generate_session(output_dir, lidar_frames, points, camera_frames, width, height, seed=0):
+    """
+    在output_dir下生成 rt_utlidar_cloud_deskewed.msg 和 camera.msg
+
+    返回:
+        (雷达文件路径, 相机文件路径)
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    lidar_file = os.path.join(output_dir, "rt_utlidar_cloud_deskewed.msg")
+    camera_file = os.path.join(output_dir, "camera.msg")
+    write_lidar_msg(lidar_file, lidar_frames, points, seed)
+    write_camera_msg(camera_file, camera_frames, width, height, seed)
+    return lidar_file, camera_file
+
+
+if __name__ == "__main__":
+    # 用法: python -m benchmarks.synthetic <输出目录> --size medium
+    parser = argparse.ArgumentParser(description='生成确定性的合成相机/雷达录制文件')
+    parser.add_argument('output', type=str, help='输出目录')
+    parser.add_argument('--size', type=str, choices=sorted(PRESETS), default='small', help='预设规模')
+    parser.add_argument('--lidar-frames', type=int, default=None, help='雷达帧数，覆盖预设')
+    parser.add_argument('--points', type=int, default=None, help='每帧点数，覆盖预设')
+    parser.add_argument('--camera-frames', type=int, default=None, help='相机帧数，覆盖预设')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    args = parser.parse_args()
+
+    lidar_frames, points, camera_frames, width, height = PRESETS[args.size]
+    lidar_file, camera_file = generate_session(
+        args.output,
+        args.lidar_frames or lidar_frames,
+        args.points or points,
+        args.camera_frames or camera_frames,
+        width, height, args.seed)
+    print(f"已生成 {lidar_file} ({os.path.getsize(lidar_file) / (1 << 20):.1f}MB) 和 "
+          f"{camera_file} ({os.path.getsize(camera_file) / (1 << 20):.1f}MB)")
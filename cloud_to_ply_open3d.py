@@ -1,44 +1,36 @@
-import numpy as np
 import ast
-import struct
 import open3d as o3d
 import os
 import glob
+import argparse
+import functools
 
-def parse_point_cloud_data(file_path):
-    """从txt文件解析点云数据"""
+from lidar_read import iter_lidar_frames
+from utils.pointcloud2 import decode_point_cloud2, cloud_xyz, cloud_intensity, intensity_to_gray
+from utils.ply_io import write_cloud_ply
+from utils.instrument import stage, Progress, add_profile_argument, enable_from_args
+from utils.parallel import run_chunks
+
+def read_point_cloud_txt(file_path):
+    """从txt文件解析点云数据，返回结构化点数组"""
     with open(file_path, 'r') as f:
         data_str = f.read()
     
     # 将字符串转换为Python字典
     data_dict = ast.literal_eval(data_str)
     
-    # 从数据字典中提取关键参数
-    point_step = data_dict['point_step']
-    width = data_dict['width']
-    height = data_dict['height']
-    data_bytes = bytes(data_dict['data'])
-    
-    # 计算总点数
-    total_points = width * height
-    
-    # 创建NumPy数组以存储点云数据
-    points = np.zeros((total_points, 3), dtype=np.float32)
-    colors = np.zeros((total_points, 3), dtype=np.float32)
-    
-    for i in range(total_points):
-        offset = i * point_step
-        point_data = data_bytes[offset:offset+point_step]
-        
-        x = struct.unpack_from('f', point_data, 0)[0]
-        y = struct.unpack_from('f', point_data, 4)[0]
-        z = struct.unpack_from('f', point_data, 8)[0]
-        intensity = struct.unpack_from('f', point_data, 12)[0]
-        
-        points[i] = [x, y, z]
-        # 根据强度值设置颜色（灰度）
-        norm_intensity = min(intensity / 255.0, 1.0)
-        colors[i] = [norm_intensity, norm_intensity, norm_intensity]
+    # 按消息中的字段布局一次性解码整个data缓冲区
+    return decode_point_cloud2(data_dict)
+
+def parse_point_cloud_data(file_path):
+    """从txt文件解析点云数据"""
+    return cloud_to_pcd(read_point_cloud_txt(file_path))
+
+def cloud_to_pcd(cloud):
+    """把解码后的结构化点数组转换为Open3D点云，颜色为强度灰度"""
+    points = cloud_xyz(cloud)
+    # 根据强度值设置颜色（灰度）
+    colors = intensity_to_gray(cloud_intensity(cloud))
     
     # 创建Open3D点云对象
     pcd = o3d.geometry.PointCloud()
@@ -47,10 +39,124 @@ def parse_point_cloud_data(file_path):
     
     return pcd
 
+def save_cloud(cloud, output_file, legacy=False):
+    """
+    保存一帧点云
+    
+    默认写出float32坐标和标量intensity属性（以及ring/time等附加字段），颜色在查看时再生成；
+    legacy为True时按旧方式经Open3D写出double坐标和三通道灰度颜色
+    """
+    with stage('write_ply') as stats:
+        if legacy:
+            o3d.io.write_point_cloud(output_file, cloud_to_pcd(cloud))
+        else:
+            write_cloud_ply(output_file, cloud)
+        stats.add(frames=1, points=len(cloud), bytes_written=os.path.getsize(output_file))
+
+def convert_msg_file(msg_file, output_dir, legacy=False):
+    """
+    直接从雷达msgpack录制文件流式生成二进制PLY，不再写frame_N.txt中间文件
+    
+    参数:
+        msg_file: rt_utlidar_cloud_deskewed.msg 文件路径
+        output_dir: 输出PLY文件的目录，文件名为帧序号
+        legacy: 是否使用旧的Open3D灰度颜色PLY格式
+        
+    返回:
+        处理的帧数
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    
+    frame_count = 0
+    progress = Progress("转换雷达帧")
+    for i, cloud, _ in iter_lidar_frames(msg_file):
+        output_file = os.path.join(output_dir, f"{i}.ply")
+        save_cloud(cloud, output_file, legacy)
+        progress.update()
+        frame_count += 1
+    
+    progress.close()
+    print(f"总共处理了{frame_count}帧数据，保存到 {output_dir}")
+    return frame_count
+
+def convert_txt_file(input_file, output_file, legacy=False):
+    """解析单个frame_N.txt并保存为PLY，返回点数（供进程池调用）"""
+    with stage('parse') as stats:
+        cloud = read_point_cloud_txt(input_file)
+        stats.add(frames=1, points=len(cloud), bytes_read=os.path.getsize(input_file))
+    save_cloud(cloud, output_file, legacy)
+    return len(cloud)
+
+def _convert_task(task, legacy=False):
+    """进程池任务：task为 (序号, 输入文件, 输出文件)"""
+    _, input_file, output_file = task
+    return convert_txt_file(input_file, output_file, legacy)
+
+def convert_files_parallel(input_files, output_dir, workers=None, max_in_flight=None, legacy=False):
+    """
+    使用进程池并行转换点云文件，输出文件名与串行处理时完全一致
+    
+    参数:
+        input_files: 已排序的输入文件列表，第i个文件输出为 i.ply
+        output_dir: 输出PLY文件的目录
+        workers: 进程数，None表示使用CPU核心数
+        max_in_flight: 同时提交的最大任务数，默认为进程数的2倍，避免一次性提交全部任务
+        legacy: 是否使用旧的Open3D灰度颜色PLY格式
+        
+    返回:
+        失败的 (序号, 文件路径, 错误信息) 列表
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [(i, input_file, os.path.join(output_dir, f"{i}.ply")) for i, input_file in enumerate(input_files)]
+    
+    failures = []
+    progress = Progress("转换文件", total=len(tasks))
+    
+    # 子进程中的各阶段不计入本进程的统计，这里记录整体的墙钟时间和吞吐量
+    with stage('convert_parallel') as stats:
+        def on_result(task, num_points):
+            progress.update()
+            stats.add(frames=1, points=num_points)
+        
+        def on_error(task, error):
+            i, input_file, _ = task
+            progress.update()
+            failures.append((i, input_file, str(error)))
+            print(f"{os.path.basename(input_file)}: 处理失败: {error}")
+        
+        run_chunks(functools.partial(_convert_task, legacy=legacy), tasks, workers,
+                   on_result=on_result, on_error=on_error, max_in_flight=max_in_flight)
+    
+    progress.close()
+    if failures:
+        print(f"共有 {len(failures)} 个文件处理失败:")
+        for i, input_file, error in sorted(failures):
+            print(f"  {i}: {input_file} - {error}")
+    return failures
+
 def main():
+    parser = argparse.ArgumentParser(description='将雷达点云数据转换为PLY文件')
+    parser.add_argument('--input', type=str, default=r"D:\code\dog_data\3.31\frames_lidar",
+                        help='frame_N.txt所在目录')
+    parser.add_argument('--output', type=str, default=r"D:\code\dog_data\3.31\pictures_lidar",
+                        help='输出PLY文件的目录')
+    parser.add_argument('--msg', type=str, default='',
+                        help='直接读取雷达msgpack录制文件（指定后忽略--input）')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='并行转换使用的进程数，1表示串行，0表示使用全部CPU核心')
+    parser.add_argument('--legacy-ply', action='store_true',
+                        help='按旧格式输出（Open3D写出的double坐标和灰度颜色），默认输出float32坐标和intensity属性')
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    enable_from_args(args)
+    
     # 定义输入和输出目录
-    input_dir = r"D:\code\dog_data\3.31\frames_lidar"
-    output_dir = r"D:\code\dog_data\3.31\pictures_lidar"
+    input_dir = args.input
+    output_dir = args.output
+    
+    if args.msg:
+        convert_msg_file(args.msg, output_dir, legacy=args.legacy_ply)
+        return
     
     # 确保输出目录存在
     os.makedirs(output_dir, exist_ok=True)
@@ -60,19 +166,21 @@ def main():
     
     print(f"找到 {len(input_files)} 个点云数据文件")
     
+    if args.workers != 1:
+        convert_files_parallel(input_files, output_dir, workers=args.workers or None,
+                               legacy=args.legacy_ply)
+        print("所有文件处理完成")
+        return
+    
     # 批量处理每个文件
-    for i, input_file in enumerate(input_files):
-        print(f"正在处理文件 {os.path.basename(input_file)} ({i+1}/{len(input_files)})...")
-        
-        # 解析点云数据
-        pcd = parse_point_cloud_data(input_file)
-        
-        # 创建对应的输出文件名
-        output_file = os.path.join(output_dir, f"{i}.ply")
-        
-        # 保存为PLY文件
-        o3d.io.write_point_cloud(output_file, pcd)
-        print(f"已解析 {len(pcd.points)} 个点，保存到 {output_file}")
+    with Progress("转换文件", total=len(input_files)) as progress:
+        for i, input_file in enumerate(input_files):
+            # 创建对应的输出文件名
+            output_file = os.path.join(output_dir, f"{i}.ply")
+            
+            # 解析点云数据并保存为PLY文件
+            convert_txt_file(input_file, output_file, args.legacy_ply)
+            progress.update()
     
     print("所有文件处理完成")
 
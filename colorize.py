@@ -0,0 +1,232 @@
+import os
+import json
+import functools
+import argparse
+
+import numpy as np
+
+from utils.projection import (load_calibration, transform_points, colorize_points,
+                              DEFAULT_OCCLUSION_RADIUS, DEFAULT_DEPTH_TOLERANCE)
+from utils.ply_io import write_ply
+from utils.instrument import stage, Progress, add_profile_argument, enable_from_args
+from utils.parallel import run_chunks
+
+# 每个任务处理的相邻文件对数；任务内相邻文件对的合并窗口大部分重叠，已解码的雷达帧直接复用
+DEFAULT_CHUNK_PAIRS = 16
+
+# 输出目录（与 pictures / pictures_lidar 并列），文件名为相机帧序号
+DEFAULT_OUTPUT_DIR = "pictures_colored"
+
+
+def load_pairs(camera_msg, lidar_msg, sync_file=None, tolerance=None, offset=0.0):
+    """
+    读取相机帧与雷达帧的对应关系
+
+    sync_file存在时（pipeline.py的sync阶段输出）直接读取，否则按两个录制文件的时间戳匹配
+
+    返回:
+        (M, 2) 的 (rgb索引, ply索引) 数组
+    """
+    if sync_file and os.path.exists(sync_file):
+        with open(sync_file, 'r', encoding='utf-8') as f:
+            return np.asarray(json.load(f)['pairs'], dtype=np.int64).reshape(-1, 2)
+
+    from utils.sync import match_timestamps, print_sync_report, load_msg_stamps, DEFAULT_TOLERANCE
+    result = match_timestamps(load_msg_stamps(camera_msg), load_msg_stamps(lidar_msg),
+                              tolerance=DEFAULT_TOLERANCE if tolerance is None else tolerance, offset=offset)
+    print_sync_report(result)
+    return result['pairs']
+
+
+def decode_image(img_data):
+    """把JPEG/PNG字节解码为 (H, W, 3) uint8 RGB图像"""
+    import cv2
+    image = cv2.imdecode(np.frombuffer(img_data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("图像解码失败")
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+class WindowReader:
+    """
+    从雷达录制文件中读取以某帧为中心、前后各window帧的合并点云（与rgb_ply_viewer的合并窗口范围一致）
+
+    有位姿时把窗口内各帧变换到中心帧坐标系；已解码的帧保留到移出窗口为止，按顺序访问相邻中心帧时每帧只解码一次
+
+    用法:
+        reader = WindowReader("rt_utlidar_cloud_deskewed.msg", window=15, poses=poses)
+        points, intensity = reader.points(100)
+    """
+
+    def __init__(self, lidar_msg, window=0, poses=None):
+        from utils.msg_index import MsgFrameReader
+
+        self.reader = MsgFrameReader(lidar_msg)
+        self.window = window
+        self.poses = poses
+        self._cache = {}
+
+    def __len__(self):
+        return len(self.reader)
+
+    def _frame(self, frame_idx):
+        from utils.pointcloud2 import decode_point_cloud2, cloud_xyz, cloud_intensity
+
+        if frame_idx not in self._cache:
+            with stage('parse') as stats:
+                cloud = decode_point_cloud2(self.reader.read(frame_idx))
+                stats.add(frames=1, points=len(cloud))
+            self._cache[frame_idx] = (cloud_xyz(cloud), cloud_intensity(cloud))
+        return self._cache[frame_idx]
+
+    def points(self, center):
+        """返回中心帧坐标系下窗口内全部点的 (points, intensity)"""
+        lo, hi = max(0, center - self.window), min(len(self), center + self.window + 1)
+        for key in [k for k in self._cache if k < lo or k >= hi]:
+            del self._cache[key]
+
+        points_parts, intensity_parts = [], []
+        for k in range(lo, hi):
+            points, intensity = self._frame(k)
+            if self.poses is not None and k != center:
+                points = transform_points(points, np.linalg.inv(self.poses[center]) @ self.poses[k])
+            points_parts.append(points)
+            intensity_parts.append(intensity)
+        if len(points_parts) == 1:
+            return points_parts[0], intensity_parts[0]
+        return np.concatenate(points_parts), np.concatenate(intensity_parts)
+
+
+# 工作进程中的状态：录制文件读取器、标定和参数，由init_pair_worker在每个进程中建立一次（depth_overlay共用）
+pair_worker = {}
+
+
+def init_pair_worker(camera_msg, lidar_msg, calibration_file, poses, settings):
+    """在工作进程中打开相机和雷达录制文件并读取标定，settings['window']为雷达合并窗口"""
+    from utils.msg_index import MsgFrameReader
+
+    pair_worker['camera'] = MsgFrameReader(camera_msg)
+    pair_worker['lidar'] = WindowReader(lidar_msg, settings['window'], poses)
+    pair_worker['calib'] = load_calibration(calibration_file)
+    pair_worker['settings'] = settings
+
+
+def colorize_chunk(pairs, output_dir):
+    """
+    为一组相邻的文件对生成RGB点云（在工作进程中调用）
+
+    每对以雷达帧为中心取前后window帧合并（有位姿时先变换到中心帧坐标系），投影到对应的相机图像上取色，
+    写出 <output_dir>/<rgb索引>.ply
+
+    返回:
+        [(rgb索引, 点数, 着色点数)]
+    """
+    settings = pair_worker['settings']
+    results = []
+    for rgb_idx, ply_idx in pairs:
+        points, intensity = pair_worker['lidar'].points(ply_idx)
+
+        with stage('decode_image', frames=1):
+            image = decode_image(pair_worker['camera'].read(rgb_idx)['img'])
+        with stage('colorize', frames=1, points=len(points)):
+            colors, mask = colorize_points(points, image, pair_worker['calib'],
+                                           settings['occlusion_radius'], settings['depth_tolerance'])
+        if not settings['keep_uncolored']:
+            points, colors, intensity = points[mask], colors[mask], intensity[mask]
+
+        output_file = os.path.join(output_dir, f"{rgb_idx}.ply")
+        with stage('write_ply') as stats:
+            write_ply(output_file, points, intensity, colors=colors)
+            stats.add(frames=1, points=len(points), bytes_written=os.path.getsize(output_file))
+        results.append((int(rgb_idx), int(len(mask)), int(mask.sum())))
+    return results
+
+
+def colorize_session(camera_msg, lidar_msg, calibration_file, output_dir=DEFAULT_OUTPUT_DIR, pairs=None,
+                     window=0, poses=None, occlusion_radius=DEFAULT_OCCLUSION_RADIUS,
+                     depth_tolerance=DEFAULT_DEPTH_TOLERANCE, keep_uncolored=False, workers=None,
+                     chunk_pairs=DEFAULT_CHUNK_PAIRS):
+    """
+    批量把雷达点投影到同步的相机图像上取色，每个文件对输出一个RGB点云PLY
+
+    参数:
+        camera_msg, lidar_msg: 相机和雷达录制文件
+        calibration_file: 相机标定JSON（见utils.projection.load_calibration）
+        output_dir: 输出目录
+        pairs: (M, 2) 的 (rgb索引, ply索引) 数组，None表示按时间戳匹配
+        window: 每对合并中心雷达帧前后各window帧后再取色，0表示只用单帧
+        poses: (F, 4, 4) 雷达帧位姿（lidar_odometry.load_poses），合并窗口时用于对齐各帧
+        occlusion_radius, depth_tolerance: 遮挡判断参数（见utils.projection）
+        keep_uncolored: 为True时保留不在图像中或被遮挡的点（颜色为黑色）
+        workers: 进程数，None表示CPU核数，1表示在当前进程中处理
+        chunk_pairs: 每个任务处理的相邻文件对数
+
+    返回:
+        着色的点总数
+    """
+    if pairs is None:
+        pairs = load_pairs(camera_msg, lidar_msg)
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    if window > 0 and poses is None:
+        print("警告: 未提供位姿，合并窗口内的帧将直接叠加（运动时颜色会错位）")
+    os.makedirs(output_dir, exist_ok=True)
+
+    settings = {
+        'window': window,
+        'occlusion_radius': occlusion_radius,
+        'depth_tolerance': depth_tolerance,
+        'keep_uncolored': keep_uncolored,
+    }
+    init_args = (camera_msg, lidar_msg, calibration_file, poses, settings)
+    chunks = [pairs[i:i + chunk_pairs].tolist() for i in range(0, len(pairs), chunk_pairs)]
+
+    num_points = 0
+    num_colored = 0
+    progress = Progress("点云着色", total=len(pairs))
+
+    def on_result(chunk, results):
+        nonlocal num_points, num_colored
+        for _, n, colored in results:
+            num_points += n
+            num_colored += colored
+        progress.update(len(results))
+
+    run_chunks(functools.partial(colorize_chunk, output_dir=output_dir), chunks, workers, init_pair_worker,
+               init_args, on_result)
+    progress.close()
+
+    ratio = num_colored / num_points if num_points else 0
+    print(f"着色完成: {len(pairs)} 对, {num_colored}/{num_points} 个点在图像中可见 ({ratio:.1%}), "
+          f"已保存到 {output_dir}")
+    return num_colored
+
+
+def main():
+    parser = argparse.ArgumentParser(description='把雷达点投影到同步的相机图像上取色，输出RGB点云PLY')
+    parser.add_argument('--camera', type=str, required=True, help='相机录制文件（camera.msg）')
+    parser.add_argument('--lidar', type=str, required=True, help='雷达录制文件（rt_utlidar_cloud_deskewed.msg）')
+    parser.add_argument('--calibration', type=str, required=True, help='相机内参、畸变和雷达到相机外参的JSON文件')
+    parser.add_argument('--output', type=str, default=DEFAULT_OUTPUT_DIR, help='输出目录')
+    parser.add_argument('--sync', type=str, default=None, help='pipeline.py生成的sync.json，默认按时间戳重新匹配')
+    parser.add_argument('--window', type=int, default=0, help='合并中心雷达帧前后各多少帧后再取色')
+    parser.add_argument('--odometry', action='store_true', help='按lidar_odometry估计的位姿对齐窗口内各帧')
+    parser.add_argument('--radius', type=int, default=DEFAULT_OCCLUSION_RADIUS, help='遮挡判断的像素半径')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_DEPTH_TOLERANCE, help='遮挡判断的相对深度容差')
+    parser.add_argument('--keep-uncolored', action='store_true', help='保留不可见的点（颜色为黑色）')
+    parser.add_argument('--workers', type=int, default=None, help='进程数，默认CPU核数')
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    enable_from_args(args)
+
+    poses = None
+    if args.odometry:
+        from lidar_odometry import load_poses
+        poses = load_poses(args.lidar)
+
+    pairs = load_pairs(args.camera, args.lidar, args.sync)
+    colorize_session(args.camera, args.lidar, args.calibration, args.output, pairs, args.window, poses,
+                     args.radius, args.tolerance, args.keep_uncolored, args.workers)
+
+
+if __name__ == "__main__":
+    main()
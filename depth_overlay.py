@@ -0,0 +1,215 @@
+import os
+import argparse
+import functools
+
+import numpy as np
+
+from colorize import pair_worker, init_pair_worker, load_pairs, DEFAULT_CHUNK_PAIRS
+from utils.projection import (transform_points, project_points, visible_mask, depth_buffer,
+                              DEFAULT_OCCLUSION_RADIUS, DEFAULT_DEPTH_TOLERANCE)
+from utils.instrument import stage, Progress, add_profile_argument, enable_from_args
+from utils.parallel import run_chunks
+
+# 默认合并窗口：中心雷达帧前后各15帧，与rgb_ply_viewer的get_surrounding_ply_files一致
+DEFAULT_WINDOW = 15
+
+# uint16深度图的比例（KITTI约定）：像素值 = 深度(米) * 256，0表示没有数据，最大约256米
+DEPTH_PNG_SCALE = 256.0
+
+# 叠加图按距离着色的范围（米），超出范围的点取两端颜色
+DEFAULT_MIN_RANGE = 0.5
+DEFAULT_MAX_RANGE = 40.0
+
+# 叠加图中每个点绘制的半径（像素）
+DEFAULT_DOT_RADIUS = 1
+
+# 叠加图JPEG质量
+DEFAULT_JPEG_QUALITY = 90
+
+# 输出目录（与 pictures / pictures_lidar 并列），其下分 depth/ 和 overlay/ 两个子目录
+DEFAULT_OUTPUT_DIR = "pictures_depth"
+
+
+def sparse_depth(u, v, depth, visible, width, height):
+    """由可见点生成稀疏深度图（米），每个像素取最近的点，没有点的像素为0"""
+    zbuf = depth_buffer(u[visible], v[visible], depth[visible], width, height)
+    zbuf[np.isinf(zbuf)] = 0
+    return zbuf
+
+
+def save_depth(depth_image, output_path):
+    """按扩展名把深度图保存为uint16 PNG（深度 * 256）或npz（float32米）"""
+    if output_path.endswith('.npz'):
+        np.savez_compressed(output_path, depth=depth_image.astype(np.float32))
+        return
+    import cv2
+    scaled = np.clip(np.round(depth_image * DEPTH_PNG_SCALE), 0, np.iinfo(np.uint16).max).astype(np.uint16)
+    if not cv2.imwrite(output_path, scaled):
+        raise IOError(f"无法写出深度图: {output_path}")
+
+
+def range_overlay(image, u, v, ranges, visible, min_range=DEFAULT_MIN_RANGE, max_range=DEFAULT_MAX_RANGE,
+                  dot_radius=DEFAULT_DOT_RADIUS):
+    """
+    在图像上按距离着色绘制可见点，近处为红色、远处为蓝色（turbo色表）
+
+    每个点画成边长 2 * dot_radius + 1 的方块，方块重叠时距离近的点在上面
+
+    参数:
+        image: (H, W, 3) uint8 BGR图像，直接在其上绘制
+        ranges: 每个点到相机的距离（米）
+    """
+    import cv2
+    height, width = image.shape[:2]
+    rbuf = depth_buffer(u[visible], v[visible], ranges[visible], width, height, dot_radius)
+    covered = np.isfinite(rbuf)
+    scale = np.clip((rbuf[covered] - min_range) / (max_range - min_range), 0, 1)
+    levels = np.round(255 * (1 - scale)).astype(np.uint8)
+    lut = cv2.applyColorMap(np.arange(256, dtype=np.uint8).reshape(-1, 1), cv2.COLORMAP_TURBO).reshape(256, 3)
+    image[covered] = lut[levels]
+    return image
+
+
+def render_chunk(pairs, output_dir):
+    """
+    为一组相邻的文件对渲染深度图和距离叠加图（在工作进程中调用）
+
+    返回:
+        [(rgb索引, 可见点数)]
+    """
+    import cv2
+
+    settings = pair_worker['settings']
+    calib = pair_worker['calib']
+    width, height = calib['width'], calib['height']
+    results = []
+    for rgb_idx, ply_idx in pairs:
+        points, _ = pair_worker['lidar'].points(ply_idx)
+        with stage('project', frames=1, points=len(points)):
+            u, v, depth, valid = project_points(points, calib)
+            visible = visible_mask(u, v, depth, valid, width, height,
+                                   settings['occlusion_radius'], settings['depth_tolerance'])
+
+        with stage('write_depth', frames=1):
+            depth_path = os.path.join(output_dir, "depth", f"frame_{rgb_idx}.{settings['depth_format']}")
+            save_depth(sparse_depth(u, v, depth, visible, width, height), depth_path)
+
+        with stage('render', frames=1, points=int(visible.sum())):
+            img_data = pair_worker['camera'].read(rgb_idx)['img']
+            image = cv2.imdecode(np.frombuffer(img_data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if image is None or image.shape[:2] != (height, width):
+                raise ValueError(f"第{rgb_idx}帧图像无法解码或尺寸与标定不一致")
+            ranges = np.zeros(len(points), dtype=np.float32)
+            ranges[visible] = np.linalg.norm(transform_points(points[visible], calib['T']), axis=1)
+            range_overlay(image, u, v, ranges, visible, settings['min_range'], settings['max_range'],
+                          settings['dot_radius'])
+            overlay_path = os.path.join(output_dir, "overlay", f"frame_{rgb_idx}.jpg")
+            cv2.imwrite(overlay_path, image, [cv2.IMWRITE_JPEG_QUALITY, settings['jpeg_quality']])
+        results.append((int(rgb_idx), int(visible.sum())))
+    return results
+
+
+def render_session(camera_msg, lidar_msg, calibration_file, output_dir=DEFAULT_OUTPUT_DIR, pairs=None,
+                   window=DEFAULT_WINDOW, poses=None, depth_format='png', min_range=DEFAULT_MIN_RANGE,
+                   max_range=DEFAULT_MAX_RANGE, dot_radius=DEFAULT_DOT_RADIUS,
+                   occlusion_radius=DEFAULT_OCCLUSION_RADIUS, depth_tolerance=DEFAULT_DEPTH_TOLERANCE,
+                   jpeg_quality=DEFAULT_JPEG_QUALITY, workers=None, chunk_pairs=DEFAULT_CHUNK_PAIRS):
+    """
+    为每个同步的相机帧渲染稀疏深度图和按距离着色的叠加图
+
+    输出 <output_dir>/depth/frame_N.png（或.npz）和 <output_dir>/overlay/frame_N.jpg，N为相机帧序号，
+    叠加图目录可以直接交给 video_process.save_images_as_video 生成视频
+
+    参数:
+        camera_msg, lidar_msg: 相机和雷达录制文件
+        calibration_file: 相机标定JSON（见utils.projection.load_calibration）
+        pairs: (M, 2) 的 (rgb索引, ply索引) 数组，None表示按时间戳匹配
+        window: 合并中心雷达帧前后各window帧
+        poses: (F, 4, 4) 雷达帧位姿（lidar_odometry.load_poses），用于对齐窗口内各帧
+        depth_format: 'png'（uint16，深度 * 256）或 'npz'（float32米）
+        min_range, max_range: 叠加图着色的距离范围（米）
+        dot_radius: 叠加图中每个点的半径（像素）
+        workers: 进程数，None表示CPU核数，1表示在当前进程中处理
+
+    返回:
+        叠加图目录
+    """
+    if depth_format not in ('png', 'npz'):
+        raise ValueError(f"不支持的深度图格式: {depth_format}")
+    if pairs is None:
+        pairs = load_pairs(camera_msg, lidar_msg)
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    if window > 0 and poses is None:
+        print("警告: 未提供位姿，合并窗口内的帧将直接叠加（运动时点会错位）")
+    for sub_dir in ("depth", "overlay"):
+        os.makedirs(os.path.join(output_dir, sub_dir), exist_ok=True)
+
+    settings = {
+        'window': window,
+        'depth_format': depth_format,
+        'min_range': min_range,
+        'max_range': max_range,
+        'dot_radius': dot_radius,
+        'occlusion_radius': occlusion_radius,
+        'depth_tolerance': depth_tolerance,
+        'jpeg_quality': jpeg_quality,
+    }
+    init_args = (camera_msg, lidar_msg, calibration_file, poses, settings)
+    chunks = [pairs[i:i + chunk_pairs].tolist() for i in range(0, len(pairs), chunk_pairs)]
+
+    num_visible = 0
+    progress = Progress("渲染深度图", total=len(pairs))
+
+    def on_result(chunk, results):
+        nonlocal num_visible
+        num_visible += sum(n for _, n in results)
+        progress.update(len(results))
+
+    run_chunks(functools.partial(render_chunk, output_dir=output_dir), chunks, workers, init_pair_worker, init_args,
+               on_result)
+    progress.close()
+
+    overlay_dir = os.path.join(output_dir, "overlay")
+    print(f"渲染完成: {len(pairs)} 帧, 平均每帧 {num_visible / max(len(pairs), 1):.0f} 个可见点, 已保存到 {output_dir}")
+    return overlay_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description='为每个同步的相机帧渲染稀疏深度图和按距离着色的雷达叠加图')
+    parser.add_argument('--camera', type=str, required=True, help='相机录制文件（camera.msg）')
+    parser.add_argument('--lidar', type=str, required=True, help='雷达录制文件（rt_utlidar_cloud_deskewed.msg）')
+    parser.add_argument('--calibration', type=str, required=True, help='相机内参、畸变和雷达到相机外参的JSON文件')
+    parser.add_argument('--output', type=str, default=DEFAULT_OUTPUT_DIR, help='输出目录')
+    parser.add_argument('--sync', type=str, default=None, help='pipeline.py生成的sync.json，默认按时间戳重新匹配')
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW, help='合并中心雷达帧前后各多少帧')
+    parser.add_argument('--odometry', action='store_true', help='按lidar_odometry估计的位姿对齐窗口内各帧')
+    parser.add_argument('--depth-format', type=str, choices=['png', 'npz'], default='png',
+                        help='深度图格式：png为uint16（深度*256），npz为float32米')
+    parser.add_argument('--max-range', type=float, default=DEFAULT_MAX_RANGE, help='叠加图着色的最大距离（米）')
+    parser.add_argument('--dot', type=int, default=DEFAULT_DOT_RADIUS, help='叠加图中每个点的半径（像素）')
+    parser.add_argument('--workers', type=int, default=None, help='进程数，默认CPU核数')
+    parser.add_argument('--video', type=str, default='', help='把叠加图直接保存为视频文件，例如 overlay.mp4')
+    parser.add_argument('--fps', type=float, default=None, help='视频帧率，默认按相机时间戳估计')
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    enable_from_args(args)
+
+    poses = None
+    if args.odometry:
+        from lidar_odometry import load_poses
+        poses = load_poses(args.lidar)
+
+    pairs = load_pairs(args.camera, args.lidar, args.sync)
+    overlay_dir = render_session(args.camera, args.lidar, args.calibration, args.output, pairs, args.window, poses,
+                                 args.depth_format, max_range=args.max_range, dot_radius=args.dot,
+                                 workers=args.workers)
+
+    if args.video:
+        from video_process import save_images_as_video, estimate_fps
+        from utils.sync import load_msg_stamps
+        fps = args.fps or estimate_fps(load_msg_stamps(args.camera)) or 10
+        save_images_as_video(overlay_dir, args.video, fps, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import os
+import time
+import argparse
+
+import numpy as np
+import open3d as o3d
+
+from voxel_merge import iter_source_frames
+from utils.file_order import natural_sort_key
+
+# 体素金字塔（米），由粗到细依次配准，上一层的结果作为下一层的初值
+DEFAULT_VOXEL_LEVELS = (1.0, 0.5, 0.25)
+
+# 每层ICP的最大迭代次数
+DEFAULT_MAX_ITERATIONS = (20, 15, 10)
+
+# 对应点最大距离 = 体素边长 * CORRESPONDENCE_FACTOR
+CORRESPONDENCE_FACTOR = 2.5
+
+# 每层至少需要的点数，点数更少时跳过该层
+MIN_LEVEL_POINTS = 50
+
+# 位姿缓存文件后缀（录制文件旁）或文件名（目录内）
+POSES_SUFFIX = ".poses.npz"
+POSES_FILE_NAME = "poses.npz"
+
+
+def poses_path_for(source):
+    """返回位姿缓存文件路径：录制文件为 <文件>.poses.npz，目录为 <目录>/poses.npz"""
+    if os.path.isdir(source):
+        return os.path.join(source, POSES_FILE_NAME)
+    return source + POSES_SUFFIX
+
+
+def _source_signature(source):
+    """数据源的 (帧文件数, 总字节数, 最新修改时间)，用于判断位姿缓存是否过期"""
+    if os.path.isdir(source):
+        if os.path.exists(os.path.join(source, "meta.json")):
+            names = ["meta.json"]
+        else:
+            names = sorted([f for f in os.listdir(source) if f.lower().endswith('.ply')], key=natural_sort_key)
+        stats = [os.stat(os.path.join(source, name)) for name in names]
+        return np.array([len(stats), sum(s.st_size for s in stats),
+                         max((s.st_mtime_ns for s in stats), default=0)], dtype=np.int64)
+    stat = os.stat(source)
+    return np.array([1, stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+def build_pyramid(points, voxel_levels=DEFAULT_VOXEL_LEVELS):
+    """
+    为一帧建立体素金字塔，每层为带法向量的Open3D点云
+
+    每帧只建立一次：作为源点云与前一帧配准，再作为目标点云与后一帧配准
+    """
+    pcd = o3d.geometry.PointCloud()
+    pcd.points = o3d.utility.Vector3dVector(np.asarray(points, dtype=np.float64).reshape(-1, 3))
+    pyramid = []
+    for voxel in voxel_levels:
+        level = pcd.voxel_down_sample(voxel)
+        if len(level.points) >= MIN_LEVEL_POINTS:
+            level.estimate_normals(o3d.geometry.KDTreeSearchParamHybrid(radius=voxel * 2, max_nn=20))
+        pyramid.append(level)
+    return pyramid
+
+
+def register_pair(source_pyramid, target_pyramid, init=None, voxel_levels=DEFAULT_VOXEL_LEVELS,
+                  max_iterations=DEFAULT_MAX_ITERATIONS):
+    """
+    由粗到细的点到面ICP，估计把源帧变换到目标帧坐标系的4x4矩阵
+
+    返回:
+        (transform, fitness, rmse)，fitness为最细一层的重叠比例，所有层都无法配准时为0
+    """
+    transform = np.eye(4) if init is None else np.asarray(init, dtype=np.float64)
+    fitness, rmse = 0.0, 0.0
+    estimation = o3d.pipelines.registration.TransformationEstimationPointToPlane()
+    for source, target, voxel, iterations in zip(source_pyramid, target_pyramid, voxel_levels, max_iterations):
+        if len(source.points) < MIN_LEVEL_POINTS or len(target.points) < MIN_LEVEL_POINTS:
+            continue
+        result = o3d.pipelines.registration.registration_icp(
+            source, target, voxel * CORRESPONDENCE_FACTOR, transform, estimation,
+            o3d.pipelines.registration.ICPConvergenceCriteria(max_iteration=iterations))
+        if result.fitness > 0:
+            transform = result.transformation
+            fitness, rmse = result.fitness, result.inlier_rmse
+    return transform, fitness, rmse
+
+
+def estimate_poses(source, voxel_levels=DEFAULT_VOXEL_LEVELS, max_iterations=DEFAULT_MAX_ITERATIONS):
+    """
+    逐帧估计相邻帧的相对位姿并串联为各帧到第0帧坐标系的位姿
+
+    以上一对的相对运动作为下一对的初值（匀速模型），配准失败的帧沿用匀速预测
+
+    返回:
+        字典，包含 poses (F, 4, 4)、fitness (F,)、rmse (F,)，第0帧为单位矩阵
+    """
+    poses, fitness, rmse = [], [], []
+    previous = None
+    motion = np.eye(4)
+    failed = 0
+    start_time = time.time()
+    for i, (points, _) in enumerate(iter_source_frames(source)):
+        pyramid = build_pyramid(points, voxel_levels)
+        if previous is None:
+            poses.append(np.eye(4))
+            fitness.append(1.0)
+            rmse.append(0.0)
+        else:
+            transform, fit, err = register_pair(pyramid, previous, motion, voxel_levels, max_iterations)
+            if fit == 0:
+                failed += 1
+                transform = motion
+            motion = transform
+            poses.append(poses[-1] @ transform)
+            fitness.append(fit)
+            rmse.append(err)
+        previous = pyramid
+        if (i + 1) % 100 == 0:
+            print(f"已配准 {i + 1} 帧, {(i + 1) / (time.time() - start_time):.1f} 帧/秒")
+
+    elapsed = time.time() - start_time
+    print(f"里程计完成: {len(poses)} 帧, 耗时 {elapsed:.1f} 秒 ({len(poses) / max(elapsed, 1e-9):.1f} 帧/秒), "
+          f"配准失败 {failed} 帧")
+    return {
+        'poses': np.asarray(poses, dtype=np.float64).reshape(-1, 4, 4),
+        'fitness': np.asarray(fitness, dtype=np.float64),
+        'rmse': np.asarray(rmse, dtype=np.float64),
+    }
+
+
+def load_poses(source, rebuild=False, voxel_levels=DEFAULT_VOXEL_LEVELS, max_iterations=DEFAULT_MAX_ITERATIONS):
+    """
+    读取数据源的位姿缓存，缓存不存在、数据源或参数发生变化时重新估计并保存
+
+    返回:
+        (F, 4, 4) 位姿数组，第i帧的点经 apply_pose(points, poses[i]) 变换到第0帧坐标系
+    """
+    path = poses_path_for(source)
+    signature = _source_signature(source)
+    params = np.concatenate([voxel_levels, max_iterations]).astype(np.float64)
+    if not rebuild and os.path.exists(path):
+        with np.load(path) as cached:
+            if (np.array_equal(cached['signature'], signature)
+                    and np.array_equal(cached['params'], params)):
+                return cached['poses']
+        print(f"位姿缓存已过期，重新估计: {path}")
+
+    result = estimate_poses(source, voxel_levels, max_iterations)
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, signature=signature, params=params, **result)
+    os.replace(tmp_path, path)
+    print(f"位姿已保存到 {path}")
+    return result['poses']
+
+
+def apply_pose(points, pose):
+    """把 (N, 3) 点变换到位姿pose所表示的坐标系，返回float32"""
+    points = np.asarray(points, dtype=np.float32).reshape(-1, 3)
+    rotation = pose[:3, :3].astype(np.float32)
+    translation = pose[:3, 3].astype(np.float32)
+    return points @ rotation.T + translation
+
+
+def main():
+    parser = argparse.ArgumentParser(description='相邻帧点到面ICP里程计，估计并缓存每帧位姿')
+    parser.add_argument('source', type=str, help='雷达msgpack录制文件、帧存储目录或PLY目录')
+    parser.add_argument('--rebuild', action='store_true', help='忽略已有缓存，重新估计位姿')
+    parser.add_argument('--voxels', type=float, nargs='+', default=list(DEFAULT_VOXEL_LEVELS),
+                        help='由粗到细的体素金字塔（米）')
+    parser.add_argument('--iterations', type=int, nargs='+', default=list(DEFAULT_MAX_ITERATIONS),
+                        help='每层ICP最大迭代次数，个数与--voxels相同')
+    args = parser.parse_args()
+    if len(args.voxels) != len(args.iterations):
+        parser.error("--voxels 与 --iterations 的个数必须相同")
+
+    poses = load_poses(args.source, args.rebuild, tuple(args.voxels), tuple(args.iterations))
+    distance = np.sum(np.linalg.norm(np.diff(poses[:, :3, 3], axis=0), axis=1)) if len(poses) > 1 else 0.0
+    print(f"共 {len(poses)} 帧位姿, 轨迹长度 {distance:.2f} 米")
+
+
+if __name__ == "__main__":
+    main()
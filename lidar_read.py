@@ -2,6 +2,47 @@ import msgpack
 import numpy as np
 import os
 
+from utils.pointcloud2 import decode_point_cloud2, frame_timestamp
+from utils.msg_index import MsgFrameReader
+from utils.instrument import stage, Progress, add_profile_argument, enable_from_args
+
+def iter_lidar_frames(file_name, frames=None):
+    """
+    流式读取雷达录制文件，逐帧产出解码后的NumPy数组，不再经过txt中间文件
+    
+    参数:
+        file_name: rt_utlidar_cloud_deskewed.msg 文件路径
+        frames: 只读取这些帧序号（通过索引直接定位，不解包前面的帧），None表示全部
+        
+    返回:
+        生成器，每次产出 (帧序号, 结构化点数组, 时间戳)
+        结构化点数组的字段与消息中的 fields 一致（x/y/z/intensity/...）
+    """
+    if frames is not None:
+        with MsgFrameReader(file_name) as reader:
+            for frame_count, unpacked_dict in reader.iter_frames(frames):
+                with stage('parse') as stats:
+                    cloud = decode_point_cloud2(unpacked_dict)
+                    stats.add(frames=1, points=len(cloud))
+                yield frame_count, cloud, frame_timestamp(unpacked_dict)
+        return
+    
+    with open(file_name, "rb") as f:
+        unpacker = msgpack.Unpacker(f, raw=False)
+        frame_count = 0
+        while True:
+            with stage('unpack') as stats:
+                pos = f.tell()
+                unpacked_dict = next(unpacker, None)
+                stats.add(frames=int(unpacked_dict is not None), bytes_read=f.tell() - pos)
+            if unpacked_dict is None:
+                break
+            with stage('parse') as stats:
+                cloud = decode_point_cloud2(unpacked_dict)
+                stats.add(frames=1, points=len(cloud))
+            yield frame_count, cloud, frame_timestamp(unpacked_dict)
+            frame_count += 1
+
 def read_msg_file(file_name, output_dir=None):
     # 创建输出目录（如果不存在）
     if output_dir and not os.path.exists(output_dir):
@@ -14,8 +55,9 @@ def read_msg_file(file_name, output_dir=None):
         
         # 处理所有帧数据
         frame_count = 0
+        progress = Progress("读取雷达帧")
         for unpacked_dict in unpacker:
-            print(f"读取到第{frame_count}帧数据")
+            progress.update()
             
             # 将数据保存为txt文件
             if output_dir:
@@ -24,6 +66,7 @@ def read_msg_file(file_name, output_dir=None):
             
             frame_count += 1
     
+    progress.close()
     print(f"总共处理了{frame_count}帧数据")
     return frame_count
 
@@ -61,5 +104,15 @@ def save_to_txt(data, output_file):
             # 其他未知格式，直接写入
             f.write(str(points))
 
-# 读取雷达数据并保存所有帧到frames_lidar目录
-read_msg_file(r"D:\code\dog_data\3.31\rt_utlidar_cloud_deskewed.msg", "frames_lidar")
\ No newline at end of file
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='读取雷达录制文件并把每帧保存为txt')
+    parser.add_argument('--msg', type=str, default=r"D:\code\dog_data\3.31\rt_utlidar_cloud_deskewed.msg",
+                        help='rt_utlidar_cloud_deskewed.msg文件路径')
+    parser.add_argument('--output', type=str, default="frames_lidar", help='txt输出目录')
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    enable_from_args(args)
+    
+    # 读取雷达数据并保存所有帧到frames_lidar目录
+    read_msg_file(args.msg, args.output)
@@ -0,0 +1,428 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import contextlib
+
+from utils.instrument import stage, add_profile_argument, enable_from_args
+from utils.projection import DEFAULT_OCCLUSION_RADIUS, DEFAULT_DEPTH_TOLERANCE
+
+# 会话目录中的录制文件名
+CAMERA_MSG_NAME = "camera.msg"
+LIDAR_MSG_NAME = "rt_utlidar_cloud_deskewed.msg"
+
+# 流水线状态目录：state.json 记录输入文件哈希和各阶段的键，tmp/ 存放未完成阶段的输出
+STATE_DIR_NAME = ".pipeline"
+STATE_FILE_NAME = "state.json"
+STATE_VERSION = 1
+
+# 计算文件内容哈希时每次读取的字节数
+HASH_CHUNK_SIZE = 1 << 20
+
+# 影响输出内容的参数默认值（改变后相关阶段及其下游会重新运行）
+DEFAULT_PARAMS = {
+    'overlay': True,
+    'legacy_ply': False,
+    'sync_tolerance': 0.05,
+    'sync_offset': 0.0,
+    'voxel': 0.05,
+    'odometry': False,
+    'fps': None,
+    'color_window': 0,
+    'depth_window': 15,
+    'depth_format': 'png',
+    'occlusion_radius': DEFAULT_OCCLUSION_RADIUS,
+    'depth_tolerance': DEFAULT_DEPTH_TOLERANCE,
+}
+
+
+def session_paths(session, camera_name=CAMERA_MSG_NAME, lidar_name=LIDAR_MSG_NAME):
+    """会话目录下各输入输出的路径，与各脚本原来使用的目录名一致"""
+    return {
+        'camera': os.path.join(session, camera_name),
+        'lidar': os.path.join(session, lidar_name),
+        'calibration': os.path.join(session, "calibration.json"),
+        'pictures': os.path.join(session, "pictures"),
+        'pictures_lidar': os.path.join(session, "pictures_lidar"),
+        'sync': os.path.join(session, "sync.json"),
+        'colored': os.path.join(session, "pictures_colored"),
+        'depth': os.path.join(session, "pictures_depth"),
+        'final': os.path.join(session, "final.ply"),
+        'video': os.path.join(session, "video.mp4"),
+    }
+
+
+def run_extract(paths, params, options, out):
+    from rgb_read import extract_frames
+    return {'frames': extract_frames(paths['camera'], out['pictures'], overlay=params['overlay'])}
+
+
+def run_convert(paths, params, options, out):
+    from cloud_to_ply_open3d import convert_msg_file
+    return {'frames': convert_msg_file(paths['lidar'], out['pictures_lidar'], legacy=params['legacy_ply'])}
+
+
+def run_sync(paths, params, options, out):
+    from utils.sync import match_timestamps, print_sync_report, load_msg_stamps
+
+    result = match_timestamps(load_msg_stamps(paths['camera']), load_msg_stamps(paths['lidar']),
+                              tolerance=params['sync_tolerance'], offset=params['sync_offset'])
+    print_sync_report(result)
+    with open(out['sync'], 'w', encoding='utf-8') as f:
+        json.dump({
+            'pairs': result['pairs'].tolist(),
+            'time_diff': result['time_diff'].tolist(),
+            'unmatched_camera': result['unmatched_camera'].tolist(),
+            'duplicated_lidar': result['duplicated_lidar'].tolist(),
+            'unused_lidar': result['unused_lidar'].tolist(),
+        }, f)
+    return {'pairs': len(result['pairs'])}
+
+
+def run_colorize(paths, params, options, out):
+    from colorize import load_pairs, colorize_session
+
+    poses = None
+    if params['odometry'] and params['color_window'] > 0:
+        from lidar_odometry import load_poses
+        poses = load_poses(paths['lidar'])
+    num_colored = colorize_session(paths['camera'], paths['lidar'], paths['calibration'], out['colored'],
+                                   load_pairs(paths['camera'], paths['lidar'], paths['sync']),
+                                   params['color_window'], poses, params['occlusion_radius'],
+                                   params['depth_tolerance'], workers=options.get('workers'))
+    return {'colored_points': num_colored}
+
+
+def run_depth(paths, params, options, out):
+    from colorize import load_pairs
+    from depth_overlay import render_session
+
+    poses = None
+    if params['odometry'] and params['depth_window'] > 0:
+        from lidar_odometry import load_poses
+        poses = load_poses(paths['lidar'])
+    pairs = load_pairs(paths['camera'], paths['lidar'], paths['sync'])
+    render_session(paths['camera'], paths['lidar'], paths['calibration'], out['depth'], pairs,
+                   params['depth_window'], poses, params['depth_format'],
+                   occlusion_radius=params['occlusion_radius'], depth_tolerance=params['depth_tolerance'],
+                   workers=options.get('workers'))
+    return {'frames': len(pairs)}
+
+
+def run_merge(paths, params, options, out):
+    from voxel_merge import voxel_merge
+
+    poses = None
+    if params['odometry']:
+        from lidar_odometry import load_poses
+        # 与colorize/depth共用录制文件旁的位姿缓存，不在convert阶段的输出目录中写文件
+        poses = load_poses(paths['lidar'])
+    return {'voxels': voxel_merge(paths['pictures_lidar'], out['final'], params['voxel'], poses=poses)}
+
+
+def run_video(paths, params, options, out):
+    from video_process import save_images_as_video, estimate_fps
+    from utils.sync import load_msg_stamps
+
+    fps = params['fps'] or estimate_fps(load_msg_stamps(paths['camera'])) or 10
+    if not save_images_as_video(paths['pictures'], out['video'], fps,
+                                workers=options.get('workers'), segments=options.get('segments', 1)):
+        raise RuntimeError("视频生成失败")
+    return {'fps': fps}
+
+
+# 阶段依赖图（按拓扑顺序排列）:
+#   inputs: 直接读取的录制文件，按内容哈希参与键的计算
+#   deps: 上游阶段，上游的键参与本阶段键的计算，上游重新运行后本阶段也会重新运行
+#   outputs: 阶段的输出（文件或目录），先写到临时位置，阶段完成后整体替换
+#   params: 影响输出内容的参数
+STAGES = {
+    'extract': {'inputs': ['camera'], 'deps': [], 'outputs': ['pictures'],
+                'params': ['overlay'], 'run': run_extract},
+    'convert': {'inputs': ['lidar'], 'deps': [], 'outputs': ['pictures_lidar'],
+                'params': ['legacy_ply'], 'run': run_convert},
+    'sync': {'inputs': ['camera', 'lidar'], 'deps': [], 'outputs': ['sync'],
+             'params': ['sync_tolerance', 'sync_offset'], 'run': run_sync},
+    'colorize': {'inputs': ['camera', 'lidar', 'calibration'], 'deps': ['sync'], 'outputs': ['colored'],
+                 'params': ['color_window', 'odometry', 'occlusion_radius', 'depth_tolerance'],
+                 'run': run_colorize},
+    'depth': {'inputs': ['camera', 'lidar', 'calibration'], 'deps': ['sync'], 'outputs': ['depth'],
+              'params': ['depth_window', 'depth_format', 'odometry', 'occlusion_radius', 'depth_tolerance'],
+              'run': run_depth},
+    'merge': {'inputs': [], 'deps': ['convert'], 'outputs': ['final'],
+              'params': ['voxel', 'odometry'], 'run': run_merge},
+    'video': {'inputs': ['camera'], 'deps': ['extract'], 'outputs': ['video'],
+              'params': ['fps'], 'run': run_video},
+}
+
+
+def file_digest(path, cache=None):
+    """
+    文件内容的blake2b哈希
+
+    参数:
+        cache: 以路径为键的字典，记录 size/mtime_ns/hash；大小和修改时间都没变时直接返回记录的哈希，
+            避免每次运行都重新读取整个录制文件
+    """
+    stat = os.stat(path)
+    entry = cache.get(path) if cache is not None else None
+    if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        return entry['hash']
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    result = digest.hexdigest()
+    if cache is not None:
+        cache[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': result}
+    return result
+
+
+def stage_key(name, input_hashes, dep_keys, params):
+    """由输入内容哈希、上游阶段的键和参数计算阶段的键"""
+    payload = json.dumps({'stage': name, 'inputs': input_hashes, 'deps': dep_keys, 'params': params},
+                         sort_keys=True)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def with_dependencies(names):
+    """返回names及其全部上游阶段，按拓扑顺序排列"""
+    wanted = set()
+    stack = list(names)
+    while stack:
+        name = stack.pop()
+        if name not in wanted:
+            wanted.add(name)
+            stack.extend(STAGES[name]['deps'])
+    return [name for name in STAGES if name in wanted]
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+class _OutputPathWriter:
+    """把阶段运行时打印的临时输出路径替换为正式输出路径（各脚本的汇总信息只知道 .pipeline/tmp 下的路径）"""
+
+    def __init__(self, stream, replacements):
+        self.stream = stream
+        self.replacements = replacements
+
+    def write(self, text):
+        for tmp_path, final_path in self.replacements:
+            text = text.replace(tmp_path, final_path)
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+class Pipeline:
+    """
+    会话处理流水线：按依赖图运行 extract → convert → sync → colorize/depth → merge → video
+
+    每个阶段完成后把它的键写入 <会话>/.pipeline/state.json。再次运行时，键未变且输出仍存在的阶段直接跳过；
+    运行中断时已完成的阶段保持有效，未完成阶段的临时输出在下次运行时清除后重做
+
+    用法:
+        pipeline = Pipeline("D:/code/dog_data/3.31", params={'voxel': 0.1})
+        pipeline.run(['merge', 'video'])
+    """
+
+    def __init__(self, session, params=None, options=None, camera_name=CAMERA_MSG_NAME, lidar_name=LIDAR_MSG_NAME):
+        if not os.path.isdir(session):
+            raise ValueError(f"会话目录不存在: {session}")
+        self.session = session
+        self.paths = session_paths(session, camera_name, lidar_name)
+        self.params = dict(DEFAULT_PARAMS, **(params or {}))
+        self.options = options or {}
+        self.state_dir = os.path.join(session, STATE_DIR_NAME)
+        self.state_path = os.path.join(self.state_dir, STATE_FILE_NAME)
+        self.state = self._load_state()
+
+    def _load_state(self):
+        if os.path.exists(self.state_path):
+            try:
+                with open(self.state_path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                if state.get('version') == STATE_VERSION:
+                    return state
+            except (OSError, ValueError) as e:
+                print(f"流水线状态文件无法读取，将重新运行全部阶段: {e}")
+        return {'version': STATE_VERSION, 'files': {}, 'stages': {}}
+
+    def _save_state(self):
+        os.makedirs(self.state_dir, exist_ok=True)
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.state_path)
+
+    def key_for(self, name, keys):
+        """计算阶段的键；输入文件缺失或上游无法运行时返回None"""
+        spec = STAGES[name]
+        input_hashes = {}
+        for input_name in spec['inputs']:
+            path = self.paths[input_name]
+            if not os.path.exists(path):
+                return None
+            input_hashes[input_name] = file_digest(path, self.state['files'])
+        dep_keys = {dep: keys.get(dep) for dep in spec['deps']}
+        if any(key is None for key in dep_keys.values()):
+            return None
+        return stage_key(name, input_hashes, dep_keys, {p: self.params[p] for p in spec['params']})
+
+    def is_up_to_date(self, name, key):
+        record = self.state['stages'].get(name)
+        return (record is not None and record['key'] == key
+                and all(os.path.exists(self.paths[o]) for o in STAGES[name]['outputs']))
+
+    def plan(self, names=None, force=()):
+        """
+        返回 [(阶段名, 键, 动作)]，动作为 'run'、'skip'（已是最新）或 'missing'（输入不存在）
+        """
+        keys = {}
+        plan = []
+        for name in with_dependencies(names or list(STAGES)):
+            key = self.key_for(name, keys)
+            keys[name] = key
+            if key is None:
+                action = 'missing'
+            elif name in force or not self.is_up_to_date(name, key):
+                action = 'run'
+            else:
+                action = 'skip'
+            plan.append((name, key, action))
+        return plan
+
+    def run_stage(self, name, key):
+        """运行单个阶段：输出先写到 .pipeline/tmp/<阶段>/，成功后替换正式输出并记录状态"""
+        spec = STAGES[name]
+        tmp_dir = os.path.join(self.state_dir, "tmp", name)
+        _remove(tmp_dir)
+        os.makedirs(tmp_dir)
+        out = {o: os.path.join(tmp_dir, os.path.basename(self.paths[o])) for o in spec['outputs']}
+
+        # 先作废旧记录，替换输出的过程中被中断时下次会重新运行
+        self.state['stages'].pop(name, None)
+        self._save_state()
+
+        start = time.time()
+        writer = _OutputPathWriter(sys.stdout, [(out[o], self.paths[o]) for o in spec['outputs']])
+        with stage(f'pipeline.{name}'), contextlib.redirect_stdout(writer):
+            summary = spec['run'](self.paths, self.params, self.options, out) or {}
+        for o in spec['outputs']:
+            _remove(self.paths[o])
+            os.replace(out[o], self.paths[o])
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        self.state['stages'][name] = {
+            'key': key,
+            'params': {p: self.params[p] for p in spec['params']},
+            'finished_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'seconds': round(time.time() - start, 3),
+            'summary': summary,
+        }
+        self._save_state()
+
+    def run(self, names=None, force=(), dry_run=False):
+        """
+        运行names中的阶段（None表示全部）及其上游阶段，跳过已是最新的阶段
+
+        返回:
+            实际运行的阶段名列表
+        """
+        plan = self.plan(names, force)
+        # 哈希缓存可能已更新，先保存，下次不必重新计算
+        self._save_state()
+
+        ran = []
+        for name, key, action in plan:
+            if action == 'missing':
+                missing = [self.paths[i] for i in STAGES[name]['inputs'] if not os.path.exists(self.paths[i])]
+                reason = f"缺少输入 {', '.join(missing)}" if missing else "上游阶段无法运行"
+                print(f"[{name}] 跳过: {reason}")
+            elif action == 'skip':
+                print(f"[{name}] 已是最新")
+            elif dry_run:
+                print(f"[{name}] 需要运行")
+            else:
+                print(f"[{name}] 开始运行")
+                self.run_stage(name, key)
+                outputs = ', '.join(self.paths[o] for o in STAGES[name]['outputs'])
+                print(f"[{name}] 完成，耗时 {self.state['stages'][name]['seconds']:.1f} 秒，输出: {outputs}")
+                ran.append(name)
+        return ran
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='按依赖图处理整个会话目录（extract → convert → sync → colorize/depth → merge → video），只重新运行输入或参数变化的阶段')
+    parser.add_argument('session', type=str, help=f'会话目录，包含 {CAMERA_MSG_NAME} 和 {LIDAR_MSG_NAME}')
+    parser.add_argument('--stages', type=str, default=','.join(STAGES),
+                        help='要运行的阶段（逗号分隔），会自动包含上游阶段')
+    parser.add_argument('--force', type=str, default='', help='强制重新运行的阶段（逗号分隔），all表示全部')
+    parser.add_argument('--dry-run', action='store_true', help='只列出需要运行的阶段')
+    parser.add_argument('--camera', type=str, default=CAMERA_MSG_NAME, help='会话目录中的相机录制文件名')
+    parser.add_argument('--lidar', type=str, default=LIDAR_MSG_NAME, help='会话目录中的雷达录制文件名')
+    parser.add_argument('--no-overlay', action='store_true', help='提取图片时不绘制帧号和时间')
+    parser.add_argument('--legacy-ply', action='store_true', help='使用旧的Open3D灰度颜色PLY格式')
+    parser.add_argument('--sync-tolerance', type=float, default=DEFAULT_PARAMS['sync_tolerance'],
+                        help='相机与雷达帧匹配的最大时间差（秒）')
+    parser.add_argument('--sync-offset', type=float, default=DEFAULT_PARAMS['sync_offset'],
+                        help='雷达时钟相对相机时钟的偏移（秒）')
+    parser.add_argument('--voxel', type=float, default=DEFAULT_PARAMS['voxel'], help='合并时的体素边长（米）')
+    parser.add_argument('--odometry', action='store_true', help='合并（以及着色窗口）前按lidar_odometry估计的位姿变换每帧')
+    parser.add_argument('--color-window', type=int, default=DEFAULT_PARAMS['color_window'],
+                        help='着色时合并中心雷达帧前后各多少帧（需要会话目录中的calibration.json）')
+    parser.add_argument('--depth-window', type=int, default=DEFAULT_PARAMS['depth_window'],
+                        help='渲染深度图和叠加图时合并中心雷达帧前后各多少帧（需要calibration.json）')
+    parser.add_argument('--depth-format', type=str, choices=['png', 'npz'], default=DEFAULT_PARAMS['depth_format'],
+                        help='深度图格式')
+    parser.add_argument('--fps', type=float, default=None, help='视频帧率，默认按相机时间戳估计')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='colorize/depth阶段的进程数和视频解码线程数（不影响输出），默认CPU核数')
+    parser.add_argument('--segments', type=int, default=1, help='视频分段并行编码的段数（不影响输出）')
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    enable_from_args(args)
+
+    def stage_list(text):
+        names = [name.strip() for name in text.split(',') if name.strip()]
+        if names == ['all']:
+            return list(STAGES)
+        unknown = [name for name in names if name not in STAGES]
+        if unknown:
+            parser.error(f"未知阶段: {', '.join(unknown)}，可选: {', '.join(STAGES)}")
+        return names
+
+    params = {
+        'overlay': not args.no_overlay,
+        'legacy_ply': args.legacy_ply,
+        'sync_tolerance': args.sync_tolerance,
+        'sync_offset': args.sync_offset,
+        'voxel': args.voxel,
+        'odometry': args.odometry,
+        'fps': args.fps,
+        'color_window': args.color_window,
+        'depth_window': args.depth_window,
+        'depth_format': args.depth_format,
+        'occlusion_radius': DEFAULT_PARAMS['occlusion_radius'],
+        'depth_tolerance': DEFAULT_PARAMS['depth_tolerance'],
+    }
+    options = {'workers': args.workers, 'segments': args.segments}
+    pipeline = Pipeline(args.session, params, options, args.camera, args.lidar)
+    ran = pipeline.run(stage_list(args.stages), force=stage_list(args.force), dry_run=args.dry_run)
+    if not args.dry_run:
+        print(f"流水线完成，运行了 {len(ran)} 个阶段" + (f": {', '.join(ran)}" if ran else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,62 +2,131 @@ import os
 import open3d as o3d
 import numpy as np
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.frame_store import FrameStore
+from utils.file_order import natural_sort_key
+from utils.ply_io import load_point_cloud, write_ply
+from lidar_odometry import load_poses
+from utils.instrument import stage
 
 # 直接在代码中定义配置
 CONFIG = {
     "folder_path":r"D:\code\dog_data\3.31\pictures_lidar",
-    "max_files": 20
+    "max_files": 20,
+    # 帧步长，2表示隔帧读取
+    "frame_step": 1,
+    # 分块帧存储目录（utils/frame_store.py），设置后代替folder_path，从存储中切片读取
+    "store_path": None,
+    # 按lidar_odometry估计的位姿把各帧变换到第0帧坐标系后再叠加；首次开启时要先对整个目录做ICP，
+    # 并把位姿缓存（poses.npz）写入数据目录
+    "use_odometry": False
 }
 
-def read_ply_files_in_folder(folder_path, max_files=-1):
+def read_point_clouds_from_store(store_path, max_files=-1):
+    """
+    从分块帧存储中读取点云，不需要逐个列出和打开PLY文件
+    
+    参数:
+        store_path: 帧存储目录
+        max_files: 最大读取帧数，-1表示读取全部
+        
+    返回:
+        point_clouds: 包含所有点云的列表
+        file_names: 对应的帧名列表
+    """
+    store = FrameStore(store_path)
+    num_frames = len(store)
+    if max_files > 0 and max_files < num_frames:
+        num_frames = max_files
+    
+    with stage('read_ply') as stats:
+        # 一次切出所需的全部帧，再按帧偏移拆分
+        points, _, offsets = store.frames(0, num_frames)
+        points = np.asarray(points, dtype=np.float64)
+        
+        point_clouds = []
+        file_names = []
+        for i in range(num_frames):
+            pcd = o3d.geometry.PointCloud()
+            pcd.points = o3d.utility.Vector3dVector(points[offsets[i]:offsets[i + 1]])
+            point_clouds.append(pcd)
+            file_names.append(f"{i}.ply")
+        stats.add(frames=num_frames, points=len(points))
+    
+    print(f"共从帧存储读取了 {len(point_clouds)} 帧，{len(points)} 个点")
+    return point_clouds, file_names
+
+def read_ply_files_in_folder(folder_path, max_files=-1, start=0, stop=None, step=1, workers=None):
     """
-    读取指定文件夹中的PLY文件
+    按文件名中的数字顺序并行读取指定文件夹中的PLY文件
     
     参数:
         folder_path: 包含PLY文件的文件夹路径
         max_files: 最大读取文件数，-1表示读取全部
+        start, stop, step: 在排序后的文件列表上选择帧范围和步长，例如 step=2 表示隔帧读取
+        workers: 读取线程数，None表示由线程池自动决定（Open3D读取文件时会释放GIL）
         
     返回:
-        point_clouds: 包含所有点云的列表
+        point_clouds: 包含所有点云的列表（与文件顺序一致）
         file_names: 对应的文件名列表
     """
-    point_clouds = []
-    file_names = []
-    
     # 确保文件夹路径存在
     if not os.path.exists(folder_path):
         raise ValueError(f"文件夹路径不存在: {folder_path}")
     
-    # 遍历文件夹中的所有文件
+    # 遍历文件夹中的所有文件，按自然数字顺序排序后选择帧范围
     ply_files = [f for f in os.listdir(folder_path) if f.lower().endswith('.ply')]
+    ply_files.sort(key=natural_sort_key)
+    ply_files = ply_files[start:stop:step]
     
     # 限制文件数量
     if max_files > 0 and max_files < len(ply_files):
         ply_files = ply_files[:max_files]
     
-    for file_name in ply_files:
+    def load(file_name):
         file_path = os.path.join(folder_path, file_name)
-        print(f"正在读取: {file_path}")
-        
         try:
-            # 使用Open3D读取PLY文件
-            pcd = o3d.io.read_point_cloud(file_path)
-            point_clouds.append(pcd)
-            file_names.append(file_name)
-            
-            # 打印点云的基本信息
-            print(f"点数量: {len(pcd.points)}")
-            if pcd.has_colors():
-                print(f"包含颜色信息")
-            if pcd.has_normals():
-                print(f"包含法线信息")
-            
+            # 读取PLY文件（带intensity属性时按强度生成灰度颜色）
+            return load_point_cloud(file_path)
         except Exception as e:
             print(f"读取文件 {file_path} 时出错: {str(e)}")
+            return None
     
-    print(f"共读取了 {len(point_clouds)} 个PLY文件")
+    start_time = time.time()
+    with stage('read_ply') as stats:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # map按提交顺序返回结果
+            results = list(executor.map(load, ply_files))
+        
+        point_clouds = []
+        file_names = []
+        for file_name, pcd in zip(ply_files, results):
+            if pcd is not None:
+                point_clouds.append(pcd)
+                file_names.append(file_name)
+        
+        total_points = sum(len(pcd.points) for pcd in point_clouds)
+        stats.add(frames=len(point_clouds), points=total_points,
+                  bytes_read=sum(os.path.getsize(os.path.join(folder_path, f)) for f in file_names))
+    elapsed = time.time() - start_time
+    print(f"共读取了 {len(point_clouds)} 个PLY文件，{total_points} 个点，耗时 {elapsed:.2f} 秒")
+    if len(point_clouds) < len(ply_files):
+        print(f"有 {len(ply_files) - len(point_clouds)} 个文件读取失败")
     return point_clouds, file_names
 
+def apply_poses(point_clouds, poses, frame_indices):
+    """
+    按位姿原地变换每帧点云
+    
+    参数:
+        point_clouds: 点云对象的列表
+        poses: (F, 4, 4) 位姿数组（lidar_odometry.load_poses）
+        frame_indices: 每个点云对应的帧序号
+    """
+    for pcd, frame_idx in zip(point_clouds, frame_indices):
+        pcd.transform(poses[frame_idx])
+
 def visualize_point_clouds(point_clouds, file_names=None):
     """
     可视化点云数据
@@ -92,6 +161,9 @@ def visualize_point_clouds_animation(point_clouds, file_names=None, delay_time=0
     """
     以动画方式逐步显示点云叠加过程
     
+    所有帧依次追加到同一个点云几何体中并通过update_geometry刷新，
+    内存占用与总点数成正比，不需要预先生成每一步的累积点云副本
+    
     参数:
         point_clouds: 点云对象的列表
         file_names: 对应的文件名列表(可选)
@@ -100,41 +172,24 @@ def visualize_point_clouds_animation(point_clouds, file_names=None, delay_time=0
     if not point_clouds or len(point_clouds) == 0:
         print("没有点云可以显示")
         return
-        
-    # 创建累积点云系列（不添加颜色）
-    cumulative_pcds = []
-    current_combined = o3d.geometry.PointCloud()
-    
-    for i, pcd in enumerate(point_clouds):
-        # 创建新点云
-        temp_pcd = o3d.geometry.PointCloud()
-        temp_pcd.points = o3d.utility.Vector3dVector(np.asarray(pcd.points))
-        
-        # 添加到当前累积点云
-        current_combined += temp_pcd
-        
-        # 创建当前累积点云的副本
-        current_copy = o3d.geometry.PointCloud()
-        current_copy.points = o3d.utility.Vector3dVector(np.asarray(current_combined.points))
-        
-        # 添加到序列
-        cumulative_pcds.append(current_copy)
-        
-        if file_names:
-            print(f"准备点云: {file_names[i]}")
     
-    print(f"已准备 {len(cumulative_pcds)} 个累积点云")
+    # 累积点云（不添加颜色），起始只包含第一个点云
+    accumulated = o3d.geometry.PointCloud()
+    accumulated.points.extend(point_clouds[0].points)
     
     # 创建自定义动画回调函数
     global current_frame, is_paused
-    current_frame = 0
+    current_frame = 1
     is_paused = False
     
+    if file_names:
+        print(f"添加点云: {file_names[0]}")
+    
     # 添加控制台控制暂停功能的线程
     def pause_control_thread():
         global is_paused
         print("动画已开始，按Enter键暂停/继续动画")
-        while current_frame < len(cumulative_pcds):
+        while current_frame < len(point_clouds):
             try:
                 input()  # 等待用户按Enter键
                 is_paused = not is_paused
@@ -161,12 +216,10 @@ def visualize_point_clouds_animation(point_clouds, file_names=None, delay_time=0
             time.sleep(0.1)  # 短暂休眠，避免CPU占用过高
             return True
             
-        if current_frame < len(cumulative_pcds):
-            # 删除之前的几何体
-            vis.clear_geometries()
-            
-            # 添加当前帧的累积点云
-            vis.add_geometry(cumulative_pcds[current_frame], reset_bounding_box=False)
+        if current_frame < len(point_clouds):
+            # 把当前帧的点追加到累积点云末尾，只复制这一帧的数据
+            accumulated.points.extend(point_clouds[current_frame].points)
+            vis.update_geometry(accumulated)
             
             if file_names and current_frame < len(file_names):
                 print(f"添加点云: {file_names[current_frame]}")
@@ -174,7 +227,7 @@ def visualize_point_clouds_animation(point_clouds, file_names=None, delay_time=0
             current_frame += 1
             
             # 如果是最后一帧，暂停更长时间
-            time_to_wait = delay_time * 3 if current_frame == len(cumulative_pcds) else delay_time
+            time_to_wait = delay_time * 3 if current_frame == len(point_clouds) else delay_time
             time.sleep(time_to_wait)
             
             return True
@@ -185,42 +238,38 @@ def visualize_point_clouds_animation(point_clouds, file_names=None, delay_time=0
     try:
         print("开始动画显示，请等待...")
         custom_draw_geometries_with_animation_callback(
-            [cumulative_pcds[0]],  # 起始只显示第一个点云
+            [accumulated],
             animation_callback,
             window_name="点云动画显示",
             width=1024,
             height=768
         )
-        
-        # 保存最终的叠加结果为final.ply
-        if len(cumulative_pcds) > 0:
-            final_pcd = cumulative_pcds[-1]
-            output_path = "final.ply"
-            try:
-                o3d.io.write_point_cloud(output_path, final_pcd)
-                print(f"最终点云已保存为: {output_path}")
-            except Exception as save_error:
-                print(f"保存点云文件失败: {str(save_error)}")
-                
     except Exception as e:
         print(f"动画显示失败: {str(e)}")
         # 作为备选，显示最终合并的点云
         try:
-            o3d.visualization.draw_geometries([cumulative_pcds[-1]], 
+            for pcd in point_clouds[current_frame:]:
+                accumulated.points.extend(pcd.points)
+            current_frame = len(point_clouds)
+            o3d.visualization.draw_geometries([accumulated], 
                                            window_name="合并点云显示",
                                            width=1024,
                                            height=768)
-            
-            # 即使动画显示失败，仍尝试保存最终点云
-            output_path = "final.ply"
-            try:
-                o3d.io.write_point_cloud(output_path, cumulative_pcds[-1])
-                print(f"最终点云已保存为: {output_path}")
-            except Exception as save_error:
-                print(f"保存点云文件失败: {str(save_error)}")
-                
         except Exception as e2:
             print(f"备选显示方法也失败: {str(e2)}")
+    
+    # 保存最终的叠加结果为final.ply（即使动画提前关闭，也保存全部帧）
+    with stage('merge', frames=len(point_clouds) - current_frame):
+        for pcd in point_clouds[current_frame:]:
+            accumulated.points.extend(pcd.points)
+    output_path = "final.ply"
+    try:
+        with stage('write_ply') as stats:
+            write_ply(output_path, np.asarray(accumulated.points, dtype=np.float32))
+            stats.add(frames=1, points=len(accumulated.points), bytes_written=os.path.getsize(output_path))
+        print(f"最终点云已保存为: {output_path}")
+    except Exception as save_error:
+        print(f"保存点云文件失败: {str(save_error)}")
 
 # 自定义函数，修改自Open3D的draw_geometries_with_animation_callback
 def custom_draw_geometries_with_animation_callback(
@@ -259,11 +308,29 @@ if __name__ == "__main__":
     # 使用内部配置
     folder_path = CONFIG["folder_path"]
     max_files = CONFIG["max_files"]
+    store_path = CONFIG["store_path"]
     
-    print(f"使用内部配置: 文件夹路径={folder_path}, 最大文件数={max_files}")
+    if store_path:
+        print(f"使用内部配置: 帧存储={store_path}, 最大文件数={max_files}")
+        point_clouds, file_names = read_point_clouds_from_store(store_path, max_files)
+    else:
+        print(f"使用内部配置: 文件夹路径={folder_path}, 最大文件数={max_files}")
+        
+        # 读取PLY文件
+        point_clouds, file_names = read_ply_files_in_folder(folder_path, max_files, step=CONFIG["frame_step"])
     
-    # 读取PLY文件
-    point_clouds, file_names = read_ply_files_in_folder(folder_path, max_files)
+    # 按位姿变换到同一坐标系，帧序号为文件在自然排序后完整列表中的位置
+    if point_clouds and CONFIG["use_odometry"]:
+        source = store_path or folder_path
+        poses = load_poses(source)
+        if store_path:
+            frame_indices = range(len(point_clouds))
+        else:
+            all_files = sorted([f for f in os.listdir(folder_path) if f.lower().endswith('.ply')],
+                               key=natural_sort_key)
+            positions = {name: i for i, name in enumerate(all_files)}
+            frame_indices = [positions[name] for name in file_names]
+        apply_poses(point_clouds, poses, frame_indices)
     
     # 可视化点云 - 使用动画方式
     if point_clouds:
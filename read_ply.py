@@ -1,9 +1,19 @@
 import open3d as o3d
 
+from utils.ply_io import load_point_cloud
+from utils.octree_lod import OctreeLOD, find_lod, lod_to_point_cloud, DEFAULT_PREVIEW_POINTS
+
 # 读取PLY文件
-def read_ply(file_path):
-    # 加载点云
-    point_cloud = o3d.io.read_point_cloud(file_path)
+def read_ply(file_path, max_points=DEFAULT_PREVIEW_POINTS):
+    # 存在LOD存储（python -m utils.octree_lod final.ply）时只读取粗略预览，max_points为预览点数
+    lod_path = find_lod(file_path)
+    if lod_path:
+        lod = OctreeLOD(lod_path)
+        point_cloud = lod_to_point_cloud(*lod.preview(max_points))
+        print(f"从LOD存储 {lod_path} 读取预览: {len(point_cloud.points)}/{len(lod)} 个点")
+    else:
+        # 加载点云
+        point_cloud = load_point_cloud(file_path)
     
     # 显示点云基本信息
     print(f"点云中点的数量: {len(point_cloud.points)}")
@@ -5,9 +5,16 @@ import os
 import tkinter as tk
 from tkinter import filedialog, simpledialog, messagebox
 
+from utils.ply_io import load_point_cloud
+from utils.octree_lod import OctreeLOD, find_lod, lod_to_point_cloud
+
 # 配置文件路径
 CONFIG_FILE = "view_config.json"
 
+# 存在LOD存储（python -m utils.octree_lod final.ply）时启动只读取预览，按F键按当前视野细化
+LOD_PREVIEW_POINTS = 200_000
+LOD_REFINE_POINTS = 2_000_000
+
 # 加载配置文件
 def load_config(filename=None):
     if filename is None:
@@ -195,11 +202,39 @@ def apply_view_config(view_control, config):
         print(f"应用视图配置时出错: {e}")
         return False
 
+# 当前视野内的点的包围盒
+def visible_bbox(points, params):
+    """
+    用针孔相机参数投影点，返回落在画面内的点的包围盒 (min, max)，没有可见点时返回None
+    """
+    points = np.asarray(points)
+    if len(points) == 0:
+        return None
+    extrinsic = np.asarray(params.extrinsic)
+    intrinsic = np.asarray(params.intrinsic.intrinsic_matrix)
+    cam = points @ extrinsic[:3, :3].T + extrinsic[:3, 3]
+    in_front = cam[:, 2] > 1e-6
+    cam = cam[in_front]
+    u = intrinsic[0, 0] * cam[:, 0] / cam[:, 2] + intrinsic[0, 2]
+    v = intrinsic[1, 1] * cam[:, 1] / cam[:, 2] + intrinsic[1, 2]
+    inside = (u >= 0) & (u < params.intrinsic.width) & (v >= 0) & (v < params.intrinsic.height)
+    if not np.any(inside):
+        return None
+    visible = points[in_front][inside]
+    return visible.min(axis=0), visible.max(axis=0)
+
 def main():
-    # 读取点云文件
+    # 读取点云文件（有LOD存储时只读取粗略预览）
+    lod = None
     try:
-        point_cloud = o3d.io.read_point_cloud("final.ply")
-        print("成功读取点云文件 point_cloud.ply")
+        lod_path = find_lod("final.ply")
+        if lod_path:
+            lod = OctreeLOD(lod_path)
+            point_cloud = lod_to_point_cloud(*lod.preview(LOD_PREVIEW_POINTS))
+            print(f"成功读取LOD存储 {lod_path} 的预览: {len(point_cloud.points)}/{len(lod)} 个点")
+        else:
+            point_cloud = load_point_cloud("final.ply")
+            print("成功读取点云文件 point_cloud.ply")
     except Exception as e:
         print(f"读取点云文件失败: {e}")
         print("创建一个空点云以便继续")
@@ -379,6 +414,39 @@ def main():
             print(f"加载相机参数失败: {e}")
             return False
     
+    def set_points(vis, points, intensity):
+        """替换显示的点，不改变当前视角"""
+        refined = lod_to_point_cloud(points, intensity)
+        point_cloud.points = refined.points
+        point_cloud.colors = refined.colors
+        vis.update_geometry(point_cloud)
+    
+    def refine_callback(vis):
+        """按当前视野从LOD存储中读取更精细的点"""
+        if lod is None:
+            print("没有LOD存储，无法细化")
+            return False
+        params = vis.get_view_control().convert_to_pinhole_camera_parameters()
+        bbox = visible_bbox(point_cloud.points, params)
+        if bbox is None:
+            print("当前视野内没有点")
+            return False
+        points, intensity = lod.query(bbox[0], bbox[1], max_points=LOD_REFINE_POINTS)
+        set_points(vis, points, intensity)
+        print(f"已按视野细化: {len(points)} 个点")
+        return True
+    
+    def preview_callback(vis):
+        """恢复整体预览"""
+        if lod is None:
+            return False
+        set_points(vis, *lod.preview(LOD_PREVIEW_POINTS))
+        print(f"已恢复预览: {len(point_cloud.points)} 个点")
+        return True
+    
+    vis.register_key_callback(ord('F'), refine_callback)  # F键按视野细化
+    vis.register_key_callback(ord('G'), preview_callback)  # G键恢复预览（P是Open3D自带的截图键）
+    
     # 添加视点JSON保存和加载功能
     vis.register_key_callback(ord('V'), lambda vis: save_viewpoint_json(vis))
     vis.register_key_callback(ord('C'), lambda vis: load_viewpoint_json(vis))
@@ -416,6 +484,8 @@ def main():
     print("按R键重置到默认视图")
     print("按V键直接保存相机JSON文件 (更可靠)")
     print("按C键从相机JSON文件加载视图 (更可靠)")
+    if lod is not None:
+        print("按F键按当前视野从LOD存储细化，按G键恢复整体预览")
     print("=============================================")
     
     # 渲染点云
@@ -0,0 +1,375 @@
+import os
+import json
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+from utils.projection import project_points, nearest_index_buffer
+from utils.instrument import stage, Progress, add_profile_argument, enable_from_args
+from utils.parallel import run_chunks
+
+# 没有内参时的默认图像尺寸和视场角（与Open3D可视化窗口的默认视场角一致）
+DEFAULT_WIDTH = 1280
+DEFAULT_HEIGHT = 720
+DEFAULT_FOV = 60.0
+
+# 与read_point_cloud.load_config的默认视图一致
+DEFAULT_VIEW = {"zoom": 0.8, "front": [0, 0, -1], "up": [0, 1, 0], "lookat": [0, 0, 0]}
+
+# 每个点绘制的半径（像素）
+DEFAULT_POINT_SIZE = 1
+
+# 近裁剪面（米）
+NEAR_PLANE = 0.05
+
+# 飞行轨迹中相邻关键帧之间的默认时长（秒）和默认帧率
+DEFAULT_SECONDS_PER_KEY = 2.0
+DEFAULT_FPS = 30
+
+# 渲染时最多使用的点数，超过时均匀抽稀（有LOD存储时读取对应点数的预览）
+DEFAULT_MAX_POINTS = 5_000_000
+
+
+def load_cloud(file_path, max_points=DEFAULT_MAX_POINTS):
+    """
+    读取点云并生成每个点的颜色
+
+    颜色优先使用PLY中的RGB属性（colorize.py的输出），其次按强度生成灰度（与查看器一致），
+    都没有时按高度着色
+
+    返回:
+        (points (N, 3) float32, colors (N, 3) uint8 RGB)
+    """
+    from utils.ply_io import read_ply_vertices, vertices_xyz, vertices_intensity, vertices_colors
+    from utils.pointcloud2 import intensity_to_gray
+    from utils.octree_lod import OctreeLOD, find_lod
+
+    lod_path = find_lod(file_path)
+    if lod_path:
+        points, intensity = OctreeLOD(lod_path).preview(max_points)
+        points = np.asarray(points, dtype=np.float32)
+        colors = None
+    else:
+        vertices = read_ply_vertices(file_path, mmap=True)
+        step = max(1, -(-len(vertices) // max_points)) if max_points else 1
+        vertices = np.asarray(vertices[::step])
+        points = vertices_xyz(vertices)
+        intensity = vertices_intensity(vertices)
+        colors = vertices_colors(vertices)
+
+    if colors is None and intensity is not None:
+        colors = np.round(intensity_to_gray(intensity) * 255).astype(np.uint8)
+    if colors is None:
+        import cv2
+        z = points[:, 2]
+        scale = (z - z.min()) / max(float(z.max() - z.min()), 1e-6) if len(z) else z
+        lut = cv2.applyColorMap(np.arange(256, dtype=np.uint8).reshape(-1, 1), cv2.COLORMAP_TURBO).reshape(256, 3)
+        colors = lut[np.round(scale * 255).astype(np.uint8)][:, ::-1]
+    return points, np.ascontiguousarray(colors)
+
+
+def _normalize(v):
+    v = np.asarray(v, dtype=np.float64)
+    return v / max(np.linalg.norm(v), 1e-12)
+
+
+def intrinsic_from_fov(width, height, fov=DEFAULT_FOV):
+    """按垂直视场角生成内参矩阵，与Open3D ViewControl的换算一致"""
+    focal = height / np.tan(np.deg2rad(fov) / 2) / 2
+    return np.array([[focal, 0, width / 2 - 0.5], [0, focal, height / 2 - 0.5], [0, 0, 1]])
+
+
+def extrinsic_from_look(eye, lookat, up):
+    """由相机位置、观察点和上方向生成世界到相机的4x4外参（相机坐标系 x向右、y向下、z向前）"""
+    front = _normalize(np.asarray(eye, dtype=np.float64) - lookat)
+    right = _normalize(np.cross(up, front))
+    up = _normalize(np.cross(front, right))
+    T = np.eye(4)
+    T[0, :3] = right
+    T[1, :3] = -up
+    T[2, :3] = -front
+    T[:3, 3] = -T[:3, :3] @ eye
+    return T
+
+
+def load_view(config, bounds=None, width=None, height=None):
+    """
+    把保存的视图转换为相机参数
+
+    参数:
+        config: JSON文件路径或已读取的字典，支持三种格式:
+            1. Open3D相机参数JSON（V键保存，o3d.io.write_pinhole_camera_parameters），矩阵按列存储
+            2. view_config.json中的 extrinsic（按行存储的4x4）和 intrinsic（fx/fy/cx/cy/width/height）
+            3. view_config.json中的 zoom/front/up/lookat（按Open3D ViewControl的规则由点云包围盒换算距离）
+        bounds: 点云包围盒 (min, max)，格式3需要
+        width, height: 输出图像尺寸，None表示使用视图中保存的尺寸；与保存的尺寸不同时按比例缩放内参
+
+    返回:
+        {'K': (3, 3), 'T': (4, 4), 'width', 'height'}
+    """
+    if isinstance(config, str):
+        with open(config, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+
+    intrinsic = config.get('intrinsic')
+    if isinstance(intrinsic, dict) and 'intrinsic_matrix' in intrinsic:
+        # Open3D相机参数JSON，矩阵按列存储
+        T = np.asarray(config['extrinsic'], dtype=np.float64).reshape(4, 4).T
+        K = np.asarray(intrinsic['intrinsic_matrix'], dtype=np.float64).reshape(3, 3).T
+        saved_size = (intrinsic['width'], intrinsic['height'])
+    elif 'extrinsic' in config:
+        T = np.asarray(config['extrinsic'], dtype=np.float64).reshape(4, 4)
+        if isinstance(intrinsic, dict):
+            K = np.array([[intrinsic['fx'], 0, intrinsic['cx']], [0, intrinsic['fy'], intrinsic['cy']], [0, 0, 1]],
+                         dtype=np.float64)
+            saved_size = (intrinsic['width'], intrinsic['height'])
+        else:
+            saved_size = (width or DEFAULT_WIDTH, height or DEFAULT_HEIGHT)
+            K = intrinsic_from_fov(*saved_size, config.get('fov', DEFAULT_FOV))
+    else:
+        if bounds is None:
+            raise ValueError("按zoom/front/up/lookat设置的视图需要点云包围盒")
+        view = dict(DEFAULT_VIEW, **config)
+        fov = config.get('fov', DEFAULT_FOV)
+        extent = float(np.max(np.asarray(bounds[1]) - np.asarray(bounds[0])))
+        distance = view['zoom'] * extent / np.tan(np.deg2rad(fov) / 2)
+        lookat = np.asarray(view['lookat'], dtype=np.float64)
+        eye = lookat + _normalize(view['front']) * distance
+        T = extrinsic_from_look(eye, lookat, view['up'])
+        saved_size = (width or DEFAULT_WIDTH, height or DEFAULT_HEIGHT)
+        K = intrinsic_from_fov(*saved_size, fov)
+
+    width, height = int(width or saved_size[0]), int(height or saved_size[1])
+    if (width, height) != tuple(saved_size):
+        K = K.copy()
+        K[0] *= width / saved_size[0]
+        K[1] *= height / saved_size[1]
+    return {'K': K, 'T': T, 'width': width, 'height': height}
+
+
+def render_points(points, colors, camera, point_size=DEFAULT_POINT_SIZE, background=(0, 0, 0)):
+    """
+    用NumPy光栅化点云：投影、深度缓冲（每个像素保留最近的点）、填色
+
+    参数:
+        points: (N, 3) 点
+        colors: (N, 3) uint8 RGB颜色
+        camera: load_view的返回值
+        point_size: 每个点绘制的半径（像素），方块重叠时近处的点在上面
+
+    返回:
+        (H, W, 3) uint8 RGB图像
+    """
+    width, height = camera['width'], camera['height']
+    calib = {'K': camera['K'], 'T': camera['T'], 'dist': np.zeros(8), 'width': width, 'height': height,
+             'max_r2': np.inf}
+    u, v, depth, valid = project_points(points, calib, NEAR_PLANE)
+    idx = np.nonzero(valid)[0]
+    nearest = nearest_index_buffer(u[idx], v[idx], depth[idx], width, height, point_size)
+
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[:] = background
+    covered = nearest >= 0
+    image[covered] = colors[idx[nearest[covered]]]
+    return image
+
+
+def save_image(image, output_path):
+    """保存RGB图像（PNG/JPEG按扩展名）"""
+    import cv2
+    if not cv2.imwrite(output_path, np.ascontiguousarray(image[:, :, ::-1])):
+        raise IOError(f"无法写出图像: {output_path}")
+
+
+def _rotation_to_quaternion(R):
+    """3x3旋转矩阵转换为单位四元数 (w, x, y, z)"""
+    w = np.sqrt(max(0.0, 1 + R[0, 0] + R[1, 1] + R[2, 2])) / 2
+    x = np.copysign(np.sqrt(max(0.0, 1 + R[0, 0] - R[1, 1] - R[2, 2])) / 2, R[2, 1] - R[1, 2])
+    y = np.copysign(np.sqrt(max(0.0, 1 - R[0, 0] + R[1, 1] - R[2, 2])) / 2, R[0, 2] - R[2, 0])
+    z = np.copysign(np.sqrt(max(0.0, 1 - R[0, 0] - R[1, 1] + R[2, 2])) / 2, R[1, 0] - R[0, 1])
+    return _normalize([w, x, y, z])
+
+
+def _quaternion_to_rotation(q):
+    w, x, y, z = q
+    return np.array([
+        [1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)],
+        [2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)],
+        [2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)],
+    ])
+
+
+def _slerp(q0, q1, t):
+    dot = float(np.dot(q0, q1))
+    if dot < 0:
+        q1, dot = -q1, -dot
+    if dot > 0.9995:
+        return _normalize(q0 + t * (q1 - q0))
+    theta = np.arccos(dot)
+    return (np.sin((1 - t) * theta) * q0 + np.sin(t * theta) * q1) / np.sin(theta)
+
+
+def interpolate_trajectory(keyframes, frames_per_key):
+    """
+    在关键帧视图之间插值出平滑的飞行轨迹
+
+    相机位置用经过全部关键帧的Catmull-Rom样条插值，朝向用四元数球面插值，内参线性插值；
+    所有关键帧的图像尺寸必须相同
+
+    参数:
+        keyframes: load_view返回的相机参数列表（至少2个）
+        frames_per_key: 相邻关键帧之间的帧数
+
+    返回:
+        相机参数列表，共 (len(keyframes) - 1) * frames_per_key + 1 个
+    """
+    if len(keyframes) < 2:
+        raise ValueError("飞行轨迹至少需要2个关键帧")
+    sizes = {(k['width'], k['height']) for k in keyframes}
+    if len(sizes) > 1:
+        raise ValueError(f"关键帧的图像尺寸不一致: {sorted(sizes)}")
+    width, height = sizes.pop()
+
+    eyes = [-k['T'][:3, :3].T @ k['T'][:3, 3] for k in keyframes]
+    quats = [_rotation_to_quaternion(k['T'][:3, :3]) for k in keyframes]
+    # 首尾补一个控制点，使样条经过第一个和最后一个关键帧
+    controls = [2 * eyes[0] - eyes[1]] + eyes + [2 * eyes[-1] - eyes[-2]]
+
+    cameras = []
+    for seg in range(len(keyframes) - 1):
+        p0, p1, p2, p3 = controls[seg:seg + 4]
+        last = seg == len(keyframes) - 2
+        for step in range(frames_per_key + (1 if last else 0)):
+            t = step / frames_per_key
+            eye = 0.5 * ((2 * p1) + (-p0 + p2) * t + (2 * p0 - 5 * p1 + 4 * p2 - p3) * t * t
+                         + (-p0 + 3 * p1 - 3 * p2 + p3) * t * t * t)
+            R = _quaternion_to_rotation(_slerp(quats[seg], quats[seg + 1], t))
+            T = np.eye(4)
+            T[:3, :3] = R
+            T[:3, 3] = -R @ eye
+            K = (1 - t) * keyframes[seg]['K'] + t * keyframes[seg + 1]['K']
+            cameras.append({'K': K, 'T': T, 'width': width, 'height': height})
+    return cameras
+
+
+# 工作进程中的点云和渲染参数，由_init_worker在每个进程中读取一次
+_worker = {}
+
+
+def _init_worker(cloud_file, max_points, settings):
+    _worker['points'], _worker['colors'] = load_cloud(cloud_file, max_points)
+    _worker['settings'] = settings
+
+
+def render_chunk(tasks):
+    """渲染一组 (相机参数, 输出路径)（在工作进程中调用），返回渲染的帧数"""
+    settings = _worker['settings']
+    for camera, output_path in tasks:
+        with stage('render', frames=1, points=len(_worker['points'])):
+            image = render_points(_worker['points'], _worker['colors'], camera,
+                                  settings['point_size'], settings['background'])
+        with stage('write_image', frames=1):
+            save_image(image, output_path)
+    return len(tasks)
+
+
+def render_views(cloud_file, cameras, output_paths, point_size=DEFAULT_POINT_SIZE, background=(0, 0, 0),
+                 max_points=DEFAULT_MAX_POINTS, workers=None, chunk_frames=8):
+    """
+    并行渲染多个视角，每个相机参数对应一个输出图像
+
+    参数:
+        workers: 进程数，None表示CPU核数，1表示在当前进程中渲染
+        chunk_frames: 每个任务渲染的帧数
+    """
+    settings = {'point_size': point_size, 'background': tuple(background)}
+    tasks = list(zip(cameras, output_paths))
+    chunks = [tasks[i:i + chunk_frames] for i in range(0, len(tasks), chunk_frames)]
+    workers = min(workers or os.cpu_count() or 1, max(1, len(chunks)))
+
+    progress = Progress("渲染", total=len(tasks))
+    run_chunks(render_chunk, chunks, workers, _init_worker, (cloud_file, max_points, settings),
+               on_result=lambda chunk, count: progress.update(count))
+    progress.close()
+
+
+def render_fly_through(cloud_file, keyframes, output_file, fps=DEFAULT_FPS, seconds_per_key=DEFAULT_SECONDS_PER_KEY,
+                       frames_dir=None, point_size=DEFAULT_POINT_SIZE, background=(0, 0, 0),
+                       max_points=DEFAULT_MAX_POINTS, workers=None):
+    """
+    在关键帧视图之间插值并渲染飞行视频
+
+    参数:
+        keyframes: load_view返回的相机参数列表
+        output_file: 输出视频路径
+        frames_dir: 保存逐帧PNG的目录，None表示使用临时目录并在生成视频后删除
+    """
+    from video_process import save_images_as_video
+
+    cameras = interpolate_trajectory(keyframes, max(1, int(round(fps * seconds_per_key))))
+    own_dir = frames_dir is None
+    frames_dir = frames_dir or tempfile.mkdtemp(prefix="fly_through_",
+                                                dir=os.path.dirname(os.path.abspath(output_file)))
+    os.makedirs(frames_dir, exist_ok=True)
+    try:
+        paths = [os.path.join(frames_dir, f"frame_{i}.png") for i in range(len(cameras))]
+        render_views(cloud_file, cameras, paths, point_size, background, max_points, workers)
+        save_images_as_video(frames_dir, output_file, fps, workers=workers)
+    finally:
+        if own_dir:
+            shutil.rmtree(frames_dir, ignore_errors=True)
+    return len(cameras)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='无需显示器和GPU，按保存的视图渲染点云图片或关键帧飞行视频')
+    parser.add_argument('cloud', type=str, help='PLY文件（有LOD存储时读取预览）')
+    parser.add_argument('--view', type=str, nargs='*', default=[],
+                        help='视图文件（view_config.json或V键保存的相机JSON），每个视图渲染一张图片')
+    parser.add_argument('--trajectory', type=str, nargs='*', default=[],
+                        help='按顺序给出的关键帧视图文件，插值后渲染飞行视频')
+    parser.add_argument('--output', type=str, default='render',
+                        help='图片输出目录，或飞行视频文件（--trajectory时，例如 fly.mp4）')
+    parser.add_argument('--width', type=int, default=None, help='图像宽度，默认使用视图中保存的尺寸')
+    parser.add_argument('--height', type=int, default=None, help='图像高度，默认使用视图中保存的尺寸')
+    parser.add_argument('--point-size', type=int, default=DEFAULT_POINT_SIZE, help='每个点的半径（像素）')
+    parser.add_argument('--background', type=str, default='0,0,0', help='背景颜色 R,G,B')
+    parser.add_argument('--max-points', type=int, default=DEFAULT_MAX_POINTS, help='最多渲染的点数')
+    parser.add_argument('--fps', type=float, default=DEFAULT_FPS, help='飞行视频帧率')
+    parser.add_argument('--seconds-per-key', type=float, default=DEFAULT_SECONDS_PER_KEY,
+                        help='相邻关键帧之间的时长（秒）')
+    parser.add_argument('--frames-dir', type=str, default=None, help='保留飞行视频的逐帧PNG到该目录')
+    parser.add_argument('--workers', type=int, default=None, help='渲染进程数，默认CPU核数')
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    enable_from_args(args)
+
+    background = [int(c) for c in args.background.split(',')]
+    # zoom/front/up/lookat格式的视图需要包围盒换算相机距离
+    points, _ = load_cloud(args.cloud, args.max_points)
+    bounds = (points.min(axis=0), points.max(axis=0)) if len(points) else (np.zeros(3), np.ones(3))
+    del points
+
+    if args.trajectory:
+        keyframes = [load_view(path, bounds, args.width, args.height) for path in args.trajectory]
+        num_frames = render_fly_through(args.cloud, keyframes, args.output, args.fps, args.seconds_per_key,
+                                        args.frames_dir, args.point_size, background, args.max_points, args.workers)
+        print(f"飞行视频已保存到 {args.output}（{num_frames} 帧）")
+        return
+
+    # 没有给出视图时以包围盒中心为观察点
+    views = args.view or [None]
+    default_view = dict(DEFAULT_VIEW, lookat=((bounds[0] + bounds[1]) / 2).tolist())
+    cameras = [load_view(path or default_view, bounds, args.width, args.height) for path in views]
+    os.makedirs(args.output, exist_ok=True)
+    names = [os.path.splitext(os.path.basename(path))[0] if path else "default" for path in views]
+    paths = [os.path.join(args.output, f"{name}.png") for name in names]
+    render_views(args.cloud, cameras, paths, args.point_size, background, args.max_points, args.workers)
+    for path in paths:
+        print(f"已保存 {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,15 +4,26 @@ import matplotlib.pyplot as plt
 from PIL import Image, ImageDraw, ImageFont
 import open3d as o3d
 import sys
-import re
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import matplotlib
 from matplotlib.font_manager import FontProperties
 
+from utils.file_order import extract_number
+from utils.frame_store import FrameStore
+from utils.pointcloud2 import intensity_to_gray
+from utils.ply_io import load_point_cloud
+from utils.frame_cache import FrameCache
+from utils.window_accumulator import WindowAccumulator
+from lidar_odometry import load_poses, apply_pose
+from utils.instrument import stage
+
 # 假设这些是您项目中的模块
 sys.path.append('dog_data')
 try:
-    from utils.map import get_mapping_relationship  # 导入您的映射关系函数
-    from utils.datetrans import convert_time  # 如果需要时间转换
+    from utils.map import generate_mapping  # 没有时间戳时使用的线性映射
+    from utils.sync import match_timestamps, print_sync_report, load_msg_stamps
 except ImportError:
     print("无法导入映射模块，请确保路径正确")
 
@@ -61,75 +72,127 @@ last_view_params = {
     'zlim': None
 }
 
+# 时间同步配置：相机/雷达录制文件路径（用于读取每帧时间戳）、匹配容差和雷达时钟偏移（秒）
+CAMERA_MSG_PATH = None
+LIDAR_MSG_PATH = None
+SYNC_TOLERANCE = 0.05
+SYNC_OFFSET = 0.0
+
+# 分块帧存储路径（utils/frame_store.py），设置后从存储中切片读取点云，不再逐个打开PLY文件
+FRAME_STORE_PATH = None
+frame_store = None
+
+def list_frame_files(rgb_dir, ply_dir):
+    """
+    获取按数字排序的RGB文件列表和PLY文件列表
+    使用帧存储时PLY文件名为虚拟的 "<帧序号>.ply"，与cloud_to_ply_open3d的输出命名一致
+    """
+    rgb_files = [f for f in os.listdir(rgb_dir) if f.endswith(('.jpg', '.png', '.jpeg'))]
+    if frame_store is not None:
+        ply_files = [f"{i}.ply" for i in range(len(frame_store))]
+    else:
+        ply_files = [f for f in os.listdir(ply_dir) if f.endswith('.ply')]
+    
+    rgb_files = sorted(rgb_files, key=extract_number)
+    ply_files = sorted(ply_files, key=extract_number)
+    return rgb_files, ply_files
+
+# 已解码帧的缓存上限（字节），相邻文件对共享大部分窗口帧，切换时只需加载新进入窗口的帧
+FRAME_CACHE_MAX_BYTES = 1 << 30
+frame_cache = FrameCache(max_bytes=FRAME_CACHE_MAX_BYTES)
+
 # 直接定义PLY读取函数，不再从外部模块导入
 def read_ply(ply_path):
-    """读取PLY文件并返回点云数据"""
-    pcd = o3d.io.read_point_cloud(ply_path)
+    """读取PLY文件并返回点云数据，带intensity属性的文件按强度生成灰度颜色"""
+    pcd = load_point_cloud(ply_path)
     return pcd
 
-def find_corresponding_files(rgb_dir, ply_dir):
+def load_frame_arrays(ply_path):
+    """读取PLY文件并转换为紧凑的 (points, colors) float32 数组，便于缓存"""
+    pcd = read_ply(ply_path)
+    points = np.asarray(pcd.points, dtype=np.float32)
+    colors = np.asarray(pcd.colors, dtype=np.float32) if pcd.has_colors() else None
+    return points, colors
+
+# 合并窗口的范围：固定前后帧数，或设置点数预算后自动伸缩窗口（不超过前后WINDOW_MAX_RADIUS帧）
+WINDOW_RANGE_BEFORE = 15
+WINDOW_RANGE_AFTER = 15
+WINDOW_POINT_BUDGET = None
+WINDOW_MAX_RADIUS = 60
+
+# 合并窗口累加器，相邻文件对之间只压入/弹出进出窗口的帧
+window_accumulator = WindowAccumulator(with_colors=True)
+
+# 按lidar_odometry估计的位姿把窗口内各帧变换到同一坐标系再合并，False时直接拼接；
+# 首次开启时要先对整段录制做ICP，并把位姿缓存（poses.npz）写入数据目录
+USE_ODOMETRY = False
+frame_poses = None
+
+def make_frame_loader(ply_dir, ply_files):
+    """返回按帧序号加载 (points, colors) 的函数，数据来自帧存储或经帧缓存读取的PLY文件"""
+    def loader(frame_idx):
+        if frame_store is not None:
+            points, intensity = frame_store.frame(frame_idx)
+            colors = intensity_to_gray(intensity)
+        else:
+            points, colors = frame_cache.get(os.path.join(ply_dir, ply_files[frame_idx]), load_frame_arrays)
+        # 窗口中保存第0帧坐标系下的点，缓存中仍是原始坐标
+        if frame_poses is not None:
+            points = apply_pose(points, frame_poses[frame_idx])
+        return points, colors
+    return loader
+
+def update_window(ply_dir, ply_files, current_idx):
     """
-    根据特定的映射关系找到对应的RGB图像和PLY文件
+    把合并窗口移动到current_idx附近
+    
+    返回:
+        窗口的帧范围 (start, stop)
     """
-    # 定义精确的映射关系 - (rgb索引, ply索引)
-    index_mapping = [
-        (0, 0), (1, 1), (2, 3), (3, 4), (4, 6), (5, 7), (6, 9), (7, 10), (8, 12), (9, 13), 
-        (10, 14), (11, 16), (12, 17), (13, 19), (14, 20), (15, 22), (16, 23), (17, 25), 
-        (18, 26), (19, 27), (20, 29), (21, 30), (22, 32), (23, 33), (24, 35), (25, 36), 
-        (26, 38), (27, 39), (28, 40), (29, 42), (30, 43), (31, 45), (32, 46), (33, 48), 
-        (34, 49), (35, 51), (36, 52), (37, 53), (38, 55), (39, 56), (40, 58), (41, 59), 
-        (42, 61), (43, 62), (44, 63), (45, 65), (46, 66), (47, 68), (48, 69), (49, 71), 
-        (50, 72), (51, 74), (52, 75), (53, 76), (54, 78), (55, 79), (56, 81), (57, 82), 
-        (58, 84), (59, 85), (60, 87), (61, 88), (62, 89), (63, 91), (64, 92), (65, 94), 
-        (66, 95), (67, 97), (68, 98), (69, 100), (70, 101), (71, 102), (72, 104), (73, 105), 
-        (74, 107), (75, 108), (76, 110), (77, 111), (78, 113), (79, 114), (80, 115), (81, 117), 
-        (82, 118), (83, 120), (84, 121), (85, 123), (86, 124), (87, 126), (88, 127), (89, 128), 
-        (90, 130), (91, 131), (92, 133), (93, 134), (94, 136), (95, 137), (96, 139), (97, 140), 
-        (98, 141), (99, 143), (100, 144), (101, 146), (102, 147), (103, 149), (104, 150), 
-        (105, 152), (106, 153), (107, 154), (108, 156), (109, 157), (110, 159), (111, 160), 
-        (112, 162), (113, 163), (114, 164), (115, 166), (116, 167), (117, 169), (118, 170), 
-        (119, 172), (120, 173), (121, 175), (122, 176), (123, 177), (124, 179), (125, 180),
-        (126, 182), (127, 183), (128, 185), (129, 186), (130, 188), (131, 189), (132, 190), 
-        (133, 192), (134, 193), (135, 195), (136, 196), (137, 198), (138, 199), (139, 201), 
-        (140, 202), (141, 203), (142, 205), (143, 206), (144, 208), (145, 209), (146, 211), 
-        (147, 212), (148, 214), (149, 215), (150, 216), (151, 218), (152, 219), (153, 221), 
-        (154, 222), (155, 224), (156, 225), (157, 227), (158, 228), (159, 229), (160, 231), 
-        (161, 232), (162, 234), (163, 235), (164, 237), (165, 238), (166, 240), (167, 241), 
-        (168, 242), (169, 244), (170, 245), (171, 247), (172, 248), (173, 250), (174, 251), 
-        (175, 253), (176, 254), (177, 255), (178, 257), (179, 258), (180, 260), (181, 261), 
-        (182, 263), (183, 264), (184, 265), (185, 267), (186, 268), (187, 270), (188, 271), 
-        (189, 273), (190, 274), (191, 276), (192, 277), (193, 278), (194, 280), (195, 281), 
-        (196, 283), (197, 284), (198, 286), (199, 287), (200, 289), (201, 290), (202, 291), 
-        (203, 293), (204, 294), (205, 296), (206, 297), (207, 299), (208, 300), (209, 302), 
-        (210, 303), (211, 304), (212, 306), (213, 307), (214, 309), (215, 310), (216, 312), 
-        (217, 313), (218, 315), (219, 316), (220, 317), (221, 319), (222, 320), (223, 322), 
-        (224, 323), (225, 325), (226, 326), (227, 328), (228, 329), (229, 330), (230, 332), 
-        (231, 333), (232, 335), (233, 336), (234, 338), (235, 339), (236, 341), (237, 342), 
-        (238, 343), (239, 345), (240, 346), (241, 348), (242, 349), (243, 351), (244, 352), 
-        (245, 354), (246, 355), (247, 356), (248, 358), (249, 359), (250, 361), (251, 362), 
-        (252, 364), (253, 365), (254, 366), (255, 368), (256, 369), (257, 371), (258, 372), 
-        (259, 374), (260, 375), (261, 377), (262, 378), (263, 379), (264, 381), (265, 382), 
-        (266, 384), (267, 385), (268, 387), (269, 388), (270, 390), (271, 391), (272, 392), 
-        (273, 394), (274, 395), (275, 397), (276, 398), (277, 400), (278, 401), (279, 403), 
-        (280, 404), (281, 405), (282, 407), (283, 408), (284, 410), (285, 411), (286, 413), 
-        (287, 414), (288, 416), (289, 417)
-    ]
+    loader = make_frame_loader(ply_dir, ply_files)
+    if WINDOW_POINT_BUDGET:
+        return window_accumulator.slide_to_budget(current_idx, loader, len(ply_files), WINDOW_POINT_BUDGET,
+                                                  max_radius=WINDOW_MAX_RADIUS)
+    window_accumulator.slide_to(current_idx, loader, len(ply_files), WINDOW_RANGE_BEFORE, WINDOW_RANGE_AFTER)
+    return window_accumulator.first_frame, window_accumulator.last_frame + 1
+
+def compute_index_mapping(rgb_files, ply_files):
+    """
+    计算RGB帧与PLY帧的对应关系
     
-    # 获取文件列表
-    rgb_files = [f for f in os.listdir(rgb_dir) if f.endswith(('.jpg', '.png', '.jpeg'))]
-    ply_files = [f for f in os.listdir(ply_dir) if f.endswith('.ply')]
+    配置了录制文件（或帧存储中带有时间戳）时按时间戳最近邻匹配；
+    否则按帧数线性拉伸（3.31会话的290张图片/418个PLY正好得到原来手工整理的映射表）
+    """
+    camera_stamps = load_msg_stamps(CAMERA_MSG_PATH) if CAMERA_MSG_PATH else None
+    lidar_stamps = None
+    if frame_store is not None and not np.all(np.isnan(frame_store.stamps)):
+        lidar_stamps = frame_store.stamps
+    elif LIDAR_MSG_PATH:
+        lidar_stamps = load_msg_stamps(LIDAR_MSG_PATH)
     
-    # 确保文件名按数字顺序排序
-    # 从文件名中提取数字
-    def extract_number(filename):
-        match = re.search(r'(\d+)', filename)
-        if match:
-            return int(match.group(1))
-        return 0
+    if camera_stamps is not None and lidar_stamps is not None:
+        result = match_timestamps(camera_stamps[:len(rgb_files)], lidar_stamps[:len(ply_files)],
+                                  tolerance=SYNC_TOLERANCE, offset=SYNC_OFFSET)
+        print_sync_report(result)
+        return [tuple(pair) for pair in result['pairs'].tolist()]
     
-    # 按数字排序
-    rgb_files = sorted(rgb_files, key=extract_number)
-    ply_files = sorted(ply_files, key=extract_number)
+    print("未配置时间戳来源，按帧数线性映射")
+    if not rgb_files or not ply_files:
+        return []
+    # 只有一张图片时无法拉伸（generate_mapping按 B / A 计算步长）
+    if len(rgb_files) == 1:
+        return [(0, 0)]
+    return generate_mapping(len(rgb_files) - 1, len(ply_files) - 1)
+
+def find_corresponding_files(rgb_dir, ply_dir):
+    """
+    根据时间戳（或帧数线性映射）找到对应的RGB图像和PLY文件
+    """
+    # 获取文件列表（按数字顺序排序）
+    rgb_files, ply_files = list_frame_files(rgb_dir, ply_dir)
+    
+    # 映射关系 - (rgb索引, ply索引)
+    index_mapping = compute_index_mapping(rgb_files, ply_files)
     
     # 创建映射字典
     mapping = {}
@@ -145,10 +208,13 @@ def find_corresponding_files(rgb_dir, ply_dir):
     return mapping, index_mapping
 
 def merge_point_clouds(pcd_list):
-    """合并多个点云数据"""
+    """合并多个点云数据，一次性拼接，避免反复 += 导致的重新分配"""
     merged_pcd = o3d.geometry.PointCloud()
-    for pcd in pcd_list:
-        merged_pcd += pcd
+    if not pcd_list:
+        return merged_pcd
+    merged_pcd.points = o3d.utility.Vector3dVector(np.concatenate([np.asarray(pcd.points) for pcd in pcd_list]))
+    if all(pcd.has_colors() for pcd in pcd_list):
+        merged_pcd.colors = o3d.utility.Vector3dVector(np.concatenate([np.asarray(pcd.colors) for pcd in pcd_list]))
     return merged_pcd
 
 def get_surrounding_ply_files(ply_files, current_idx, range_before=15, range_after=15):
@@ -157,58 +223,54 @@ def get_surrounding_ply_files(ply_files, current_idx, range_before=15, range_aft
     end_idx = min(len(ply_files), current_idx + range_after + 1)
     return ply_files[start_idx:end_idx]
 
-def display_rgb_and_merged_ply(rgb_path, current_ply_path, ply_dir, ply_files, current_ply_idx):
-    """显示RGB图像和合并的PLY点云数据"""
-    global last_view_params  # 使用全局视图参数
-    
-    # 创建一个有两个子图的图形
-    fig = plt.figure(figsize=(15, 7))
-    
-    # 读取RGB图像
+# 后台预取配置：提前准备的文件对数量、工作线程数，以及散点图最多显示的点数（超过时均匀抽稀）
+PREFETCH_PAIRS = 3
+PREFETCH_WORKERS = 2
+DISPLAY_MAX_POINTS = 200000
+
+# 合并窗口累加器不是线程安全的；预取时合并已在单个线程中执行，锁保护其他调用方
+window_lock = threading.Lock()
+
+@functools.lru_cache(maxsize=None)
+def load_title_font(font_size=30):
+    """加载图像标题使用的字体，只加载一次"""
+    # 使用之前找到的中文字体，或尝试使用系统默认字体
+    if chinese_font_path:
+        try:
+            return ImageFont.truetype(chinese_font_path, font_size)
+        except:
+            # 如果加载指定字体失败，尝试系统字体
+            return ImageFont.load_default()
+    # 尝试其他常见位置的字体
+    try:
+        # 再次尝试查找系统字体
+        system_fonts = [
+            'C:/Windows/Fonts/simhei.ttf',  # Windows黑体
+            'C:/Windows/Fonts/simsun.ttc',  # Windows宋体
+            '/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf',  # Linux
+            '/System/Library/Fonts/PingFang.ttc'  # macOS
+        ]
+        for font_path in system_fonts:
+            if os.path.exists(font_path):
+                return ImageFont.truetype(font_path, font_size)
+    except:
+        pass
+    return ImageFont.load_default()
+
+def prepare_rgb_image(rgb_path):
+    """读取RGB图像并在图像顶部绘制标题文本"""
     img = Image.open(rgb_path)
+    img.load()
     
     # 在图像上直接添加标题文本
     try:
         # 准备绘图和字体
         draw = ImageDraw.Draw(img)
-        
-        # 使用之前找到的中文字体，或尝试使用系统默认字体
         font_size = 30
-        if 'chinese_font_path' in locals() and chinese_font_path:
-            try:
-                font = ImageFont.truetype(chinese_font_path, font_size)
-            except:
-                # 如果加载指定字体失败，尝试系统字体
-                font = ImageFont.load_default()
-        else:
-            # 尝试其他常见位置的字体
-            try:
-                # 再次尝试查找系统字体
-                system_fonts = [
-                    'C:/Windows/Fonts/simhei.ttf',  # Windows黑体
-                    'C:/Windows/Fonts/simsun.ttc',  # Windows宋体
-                    '/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf',  # Linux
-                    '/System/Library/Fonts/PingFang.ttc'  # macOS
-                ]
-                
-                font_found = False
-                for font_path in system_fonts:
-                    if os.path.exists(font_path):
-                        font = ImageFont.truetype(font_path, font_size)
-                        font_found = True
-                        break
-                
-                if not font_found:
-                    font = ImageFont.load_default()
-            except:
-                font = ImageFont.load_default()
-        
-        # 提取文件名，用于显示
-        rgb_filename = os.path.basename(rgb_path)
-        ply_filename = os.path.basename(ply_files[current_ply_idx])
+        font = load_title_font(font_size)
         
         # 准备显示的文本
-        title_text = f"RGB图像: {rgb_filename}"
+        title_text = f"RGB图像: {os.path.basename(rgb_path)}"
         
         # 在图像顶部绘制白色背景条
         text_width, text_height = draw.textsize(title_text, font=font) if hasattr(draw, 'textsize') else (font_size * len(title_text) * 0.6, font_size * 1.5)
@@ -220,40 +282,124 @@ def display_rgb_and_merged_ply(rgb_path, current_ply_path, ply_dir, ply_files, c
         draw.text(text_position, title_text, fill=(255, 255, 255), font=font)
     except Exception as e:
         print(f"在图像上添加文本时出错: {e}")
+    return img
+
+def prepare_merged_cloud(ply_dir, ply_files, current_ply_idx, max_points=DISPLAY_MAX_POINTS):
+    """
+    移动合并窗口并取出用于显示的点（超过max_points时均匀抽稀）
     
-    # 显示RGB图像(不使用标题)
-    ax1 = fig.add_subplot(121)
-    ax1.imshow(img)
-    ax1.axis('off')
+    返回:
+        (points, colors, 窗口帧数)，colors为None表示按深度着色
+    """
+    with window_lock, stage('merge') as stats:
+        # 移动合并窗口（默认前后15帧），只加载新进入窗口的帧
+        start_idx, end_idx = update_window(ply_dir, ply_files, current_ply_idx)
+        points, colors = window_accumulator.arrays()
+        has_colors = window_accumulator.has_colors
+        stats.add(frames=end_idx - start_idx, points=len(points))
+        
+        # 在锁内复制出结果，窗口随后会被下一个合并任务移动
+        step = max(1, -(-len(points) // max_points)) if max_points else 1
+        points = np.array(points[::step])
+        colors = np.array(colors[::step]) if has_colors else None
+    # 变换回当前帧坐标系，使视角与不使用位姿时一致
+    if frame_poses is not None:
+        points = apply_pose(points, np.linalg.inv(frame_poses[current_ply_idx]))
+    return points, colors, end_idx - start_idx
+
+def prepare_cloud(ply_dir, ply_files, current_ply_idx):
+    """准备合并点云的显示数据（会移动全局合并窗口）"""
+    points, colors, num_window_frames = prepare_merged_cloud(ply_dir, ply_files, current_ply_idx)
+    return {
+        'points': points,
+        'colors': colors,
+        'ply_filename': os.path.basename(ply_files[current_ply_idx]),
+        'num_window_frames': num_window_frames,
+    }
+
+def prepare_pair(rgb_path, ply_dir, ply_files, current_ply_idx):
+    """准备一对RGB图像和合并点云的显示数据"""
+    return dict(prepare_cloud(ply_dir, ply_files, current_ply_idx), image=prepare_rgb_image(rgb_path))
+
+class PairPrefetcher:
+    """
+    在工作线程中提前准备当前及后续PREFETCH_PAIRS对文件的显示数据
     
-    # 获取前后15帧的PLY文件
-    surrounding_ply_files = get_surrounding_ply_files(ply_files, current_ply_idx)
+    图像在线程池中并行解码；点云合并都在同一个线程中按文件对顺序执行，顺序播放时合并窗口只向前滑动，
+    每次只加载新进入窗口的帧。跳转时取消窗口外尚未开始的任务
+    """
+    
+    def __init__(self, prepare_image, prepare_cloud, num_items, lookahead=PREFETCH_PAIRS,
+                 workers=PREFETCH_WORKERS):
+        self.prepare_image = prepare_image
+        self.prepare_cloud = prepare_cloud
+        self.num_items = num_items
+        self.lookahead = lookahead
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.merge_executor = ThreadPoolExecutor(max_workers=1)
+        self.futures = {}
+    
+    def _schedule(self, idx):
+        wanted = range(idx, min(self.num_items, idx + self.lookahead + 1))
+        # 取消窗口外的任务，正在执行的任务完成后结果直接丢弃
+        for key in list(self.futures):
+            if key not in wanted:
+                for future in self.futures.pop(key):
+                    future.cancel()
+        # 按顺序提交，合并线程依次处理
+        for key in wanted:
+            if key not in self.futures:
+                self.futures[key] = (self.executor.submit(self.prepare_image, key),
+                                     self.merge_executor.submit(self.prepare_cloud, key))
+    
+    def get(self, idx):
+        """返回第idx项的准备结果，必要时等待；同时调度后续项"""
+        self._schedule(idx)
+        image_future, cloud_future = self.futures[idx]
+        return dict(cloud_future.result(), image=image_future.result())
+    
+    def close(self):
+        for futures in self.futures.values():
+            for future in futures:
+                future.cancel()
+        self.executor.shutdown(wait=False)
+        self.merge_executor.shutdown(wait=False)
+
+def show_prepared_pair(prepared):
+    """
+    在GUI线程中绘制已准备好的文件对，等待用户操作
+    
+    返回:
+        'next'、'prev' 或 'quit'；关闭窗口视为 'next'
+    """
+    global last_view_params  # 使用全局视图参数
     
-    # 加载并合并点云
-    pcd_list = []
-    for ply_file in surrounding_ply_files:
-        ply_path = os.path.join(ply_dir, ply_file)
-        pcd = read_ply(ply_path)
-        pcd_list.append(pcd)
+    # 创建一个有两个子图的图形
+    fig = plt.figure(figsize=(15, 7))
     
-    # 合并点云
-    merged_pcd = merge_point_clouds(pcd_list)
+    # 显示RGB图像(不使用标题)
+    ax1 = fig.add_subplot(121)
+    ax1.imshow(prepared['image'])
+    ax1.axis('off')
     
     # 显示合并的PLY数据
     ax2 = fig.add_subplot(122, projection='3d')
-    points = np.asarray(merged_pcd.points)
+    points = prepared['points']
+    colors = prepared['colors']
     
-    # 如果点云有颜色
-    if merged_pcd.has_colors():
-        colors = np.asarray(merged_pcd.colors)
-        ax2.scatter(points[:, 0], points[:, 1], points[:, 2], c=colors, s=1)
-    else:
-        # 否则使用深度作为颜色
-        ax2.scatter(points[:, 0], points[:, 1], points[:, 2], c=points[:, 2], cmap='viridis', s=1)
+    with stage('render', frames=1, points=len(points)):
+        # 如果点云有颜色
+        if colors is not None:
+            ax2.scatter(points[:, 0], points[:, 1], points[:, 2], c=colors, s=1)
+        else:
+            # 否则使用深度作为颜色
+            ax2.scatter(points[:, 0], points[:, 1], points[:, 2], c=points[:, 2], cmap='viridis', s=1)
     
-    title_text = f'合并点云: {ply_filename} (前后共{len(surrounding_ply_files)}帧)'
+    ply_filename = prepared['ply_filename']
+    num_window_frames = prepared['num_window_frames']
+    title_text = f'合并点云: {ply_filename} (前后共{num_window_frames}帧)'
     if use_english_titles:
-        ax2.set_title(f'Merged Cloud: {ply_filename} (Total {len(surrounding_ply_files)} frames)')
+        ax2.set_title(f'Merged Cloud: {ply_filename} (Total {num_window_frames} frames)')
     else:
         ax2.set_title(title_text, fontproperties=chinese_font if 'chinese_font' in locals() else None)
     
@@ -271,26 +417,56 @@ def display_rgb_and_merged_ply(rgb_path, current_ply_path, ply_dir, ply_files, c
     
     plt.tight_layout()
     
+    # 键盘操作: 右方向键/n/空格 下一对，左方向键/p 上一对，Esc/q 退出
+    action = {'value': 'next'}
+    def on_key(event):
+        if event.key in ('right', 'n', ' '):
+            action['value'] = 'next'
+        elif event.key in ('left', 'p'):
+            action['value'] = 'prev'
+        elif event.key in ('escape', 'q'):
+            action['value'] = 'quit'
+        else:
+            return
+        plt.close(fig)
+    fig.canvas.mpl_connect('key_press_event', on_key)
+    
     # 显示图像并保存关闭前的视图参数
     plt.show(block=False)  # 非阻塞显示
     
     # 等待用户调整视图并关闭窗口
     while plt.fignum_exists(fig.number):
-        plt.pause(0.1)  # 短暂暂停以便处理GUI事件
         # 保存当前视图参数
         last_view_params['elev'] = ax2.elev
         last_view_params['azim'] = ax2.azim
         last_view_params['xlim'] = ax2.get_xlim()
         last_view_params['ylim'] = ax2.get_ylim()
         last_view_params['zlim'] = ax2.get_zlim()
+        plt.pause(0.1)  # 短暂暂停以便处理GUI事件
     
     # 用户关闭窗口后继续
+    return action['value']
+
+def display_rgb_and_merged_ply(rgb_path, current_ply_path, ply_dir, ply_files, current_ply_idx):
+    """显示RGB图像和合并的PLY点云数据"""
+    return show_prepared_pair(prepare_pair(rgb_path, ply_dir, ply_files, current_ply_idx))
 
 def main():
     # 设置RGB图像和PLY文件的目录
     rgb_dir = r'D:\code\dog_data\3.31\pictures'  # 请替换为实际的RGB图像目录
     ply_dir = r'D:\code\dog_data\3.31\pictures_lidar'  # 请替换为实际的PLY文件目录
     
+    # 如果配置了帧存储，则从存储中读取点云
+    global frame_store
+    if FRAME_STORE_PATH:
+        frame_store = FrameStore(FRAME_STORE_PATH)
+        print(f"使用帧存储 {FRAME_STORE_PATH}: {len(frame_store)} 帧")
+    
+    # 读取（或首次估计）各帧位姿
+    global frame_poses
+    if USE_ODOMETRY:
+        frame_poses = load_poses(FRAME_STORE_PATH or ply_dir)
+    
     # 找到对应的文件
     mapping, index_mapping = find_corresponding_files(rgb_dir, ply_dir)
     
@@ -299,19 +475,10 @@ def main():
         return
     
     # 获取RGB文件列表和PLY文件列表并按数字排序
-    rgb_files = [f for f in os.listdir(rgb_dir) if f.endswith(('.jpg', '.png', '.jpeg'))]
-    ply_files = [f for f in os.listdir(ply_dir) if f.endswith('.ply')]
-    
-    def extract_number(filename):
-        match = re.search(r'(\d+)', filename)
-        if match:
-            return int(match.group(1))
-        return 0
-    
-    rgb_files = sorted(rgb_files, key=extract_number)
-    ply_files = sorted(ply_files, key=extract_number)
+    rgb_files, ply_files = list_frame_files(rgb_dir, ply_dir)
     
-    # 按照映射关系顺序显示
+    # 按照映射关系顺序整理要显示的文件对
+    pairs = []
     processed_pairs = set()  # 跟踪已处理的文件对
     
     for rgb_idx, ply_idx in index_mapping:
@@ -325,9 +492,6 @@ def main():
                 if pair_key not in processed_pairs:
                     processed_pairs.add(pair_key)
                     
-                    rgb_path = os.path.join(rgb_dir, rgb_file)
-                    current_ply_path = os.path.join(ply_dir, ply_file)
-                    
                     # 获取当前PLY文件在ply_files中的索引
                     try:
                         current_ply_idx = ply_files.index(ply_file)
@@ -335,11 +499,30 @@ def main():
                         print(f"错误：找不到PLY文件 {ply_file} 在文件列表中的索引")
                         continue
                     
-                    print(f"显示: {rgb_file} 和 {ply_file} 及其周围PLY点云")
-                    display_rgb_and_merged_ply(rgb_path, current_ply_path, ply_dir, ply_files, current_ply_idx)
-                    # 当用户关闭窗口后，自动显示下一对图像
+                    pairs.append((rgb_file, ply_file, current_ply_idx))
+    
+    def prepare_image(pair_idx):
+        return prepare_rgb_image(os.path.join(rgb_dir, pairs[pair_idx][0]))
+    
+    def prepare_pair_cloud(pair_idx):
+        return prepare_cloud(ply_dir, ply_files, pairs[pair_idx][2])
+    
+    # 当前文件对显示时，后台线程准备后续的文件对
+    prefetcher = PairPrefetcher(prepare_image, prepare_pair_cloud, len(pairs))
+    print("操作说明: 右方向键/n/空格 下一对，左方向键/p 上一对，Esc/q 退出，关闭窗口显示下一对")
+    try:
+        pos = 0
+        while 0 <= pos < len(pairs):
+            rgb_file, ply_file, _ = pairs[pos]
+            print(f"显示: {rgb_file} 和 {ply_file} 及其周围PLY点云 ({pos + 1}/{len(pairs)})")
+            action = show_prepared_pair(prefetcher.get(pos))
+            if action == 'quit':
+                break
+            pos = max(0, pos - 1) if action == 'prev' else pos + 1
+    finally:
+        prefetcher.close()
                     
     print("所有图像和点云已显示完毕")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
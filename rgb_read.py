@@ -5,6 +5,103 @@ import io
 import os
 from PIL import Image, ImageDraw, ImageFont
 import datetime
+import argparse
+import functools
+
+from utils.msg_index import MsgFrameReader
+from utils.instrument import stage, Progress, add_profile_argument, enable_from_args
+
+def iter_camera_frames(file_name, frames=None):
+    """
+    流式读取相机录制文件，直接从解包结果中取出图像数据和时间戳
+    
+    参数:
+        file_name: camera.msg 文件路径
+        frames: 只读取这些帧序号（通过索引直接定位，不解包前面的帧），None表示全部
+        
+    返回:
+        生成器，每次产出 (帧序号, 原始JPEG字节, my_time_stamp)
+    """
+    if frames is not None:
+        with MsgFrameReader(file_name) as reader:
+            for i, unpacked_dict in reader.iter_frames(frames):
+                yield i, unpacked_dict.get('img'), unpacked_dict.get('my_time_stamp')
+        return
+    
+    with open(file_name, "rb") as f:
+        unpacker = msgpack.Unpacker(f, raw=False)
+        i = 0
+        while True:
+            with stage('unpack') as stats:
+                pos = f.tell()
+                unpacked_dict = next(unpacker, None)
+                stats.add(frames=int(unpacked_dict is not None), bytes_read=f.tell() - pos)
+            if unpacked_dict is None:
+                break
+            yield i, unpacked_dict.get('img'), unpacked_dict.get('my_time_stamp')
+            i += 1
+
+@functools.lru_cache(maxsize=None)
+def load_overlay_font(size=20):
+    """加载叠加文字使用的字体，结果会被缓存，只加载一次"""
+    try:
+        return ImageFont.truetype("arial.ttf", size)
+    except IOError:
+        return ImageFont.load_default()
+
+def format_timestamp(unix_timestamp):
+    """转换Unix时间戳为可读时间，没有时间戳时使用当前时间"""
+    if unix_timestamp:
+        return datetime.datetime.fromtimestamp(unix_timestamp).strftime('%Y-%m-%d %H:%M:%S')
+    return datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+def draw_frame_overlay(image, frame_number, timestamp, font):
+    """在图片顶部绘制时间戳和帧号"""
+    draw = ImageDraw.Draw(image)
+    draw.text((10, 10), f"FRAME: {frame_number} | TIME: {timestamp}", fill=(255, 0, 0), font=font)
+    return image
+
+def extract_frames(file_name, output_dir="pictures", overlay=True):
+    """
+    直接从相机录制文件提取图片，不再经过frames/*.txt中间文件
+    
+    参数:
+        file_name: camera.msg 文件路径
+        output_dir: 图片输出目录
+        overlay: 是否绘制FRAME/TIME文字；为False时原样写出JPEG字节，不做解码和重新编码
+        
+    返回:
+        成功保存的图片数量
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    
+    font = load_overlay_font() if overlay else None
+    saved = 0
+    progress = Progress("提取图片")
+    for i, img_data, unix_timestamp in iter_camera_frames(file_name):
+        if img_data is None:
+            print(f"第{i}帧没有图像数据，已跳过")
+            continue
+        
+        output_path = os.path.join(output_dir, f"frame_{i}.jpg")
+        try:
+            with stage('write_image') as stats:
+                if overlay:
+                    image = Image.open(io.BytesIO(img_data))
+                    draw_frame_overlay(image, i, format_timestamp(unix_timestamp), font)
+                    image.save(output_path)
+                else:
+                    with open(output_path, 'wb') as img_file:
+                        img_file.write(img_data)
+                stats.add(frames=1, bytes_read=len(img_data), bytes_written=os.path.getsize(output_path))
+            saved += 1
+            progress.update()
+        except Exception as e:
+            print(f"处理第{i}帧图像时出错: {e}")
+    
+    progress.close()
+    print(f"处理完成！共保存 {saved} 张图片")
+    return saved
 
 def read_msg_file(file_name):
     # 创建保存帧和图片的目录
@@ -18,16 +115,18 @@ def read_msg_file(file_name):
         # 使用流式解包
         unpacker = msgpack.Unpacker(f, raw=False)
         # 处理所有帧
+        progress = Progress("保存帧和图片")
         for i, unpacked_dict in enumerate(unpacker):
             # 将每帧保存为TXT文件，标题为序号
             frame_file = f"frames/frame_{i}.txt"
             with open(frame_file, 'w', encoding='utf-8') as txt_file:
                 txt_file.write(str(unpacked_dict))
-            print(f"已将第{i}帧保存到 {frame_file}")
             
             # 处理并保存每帧的图像
             process_image(frame_file, i)
+            progress.update()
     
+    progress.close()
     print(f"处理完成！")
     return
 
@@ -43,12 +142,7 @@ def process_image(frame_file, frame_number):
         img_data = data_dict.get('img')
         
         # 获取时间戳并转换为可读格式
-        unix_timestamp = data_dict.get('my_time_stamp')
-        if unix_timestamp:
-            # 转换Unix时间戳为可读时间
-            timestamp = datetime.datetime.fromtimestamp(unix_timestamp).strftime('%Y-%m-%d %H:%M:%S')
-        else:
-            timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        timestamp = format_timestamp(data_dict.get('my_time_stamp'))
     except (SyntaxError, ValueError) as e:
         print(f"解析文件内容时出错: {e}")
         return
@@ -57,26 +151,30 @@ def process_image(frame_file, frame_number):
     try:
         image = Image.open(io.BytesIO(img_data))
         
-        # 创建一个新图像，包含原始图像和标题
-        draw = ImageDraw.Draw(image)
-        
-        # 使用默认字体
-        try:
-            font = ImageFont.truetype("arial.ttf", 20)
-        except IOError:
-            font = ImageFont.load_default()
-        
         # 在图片顶部绘制时间戳和帧号
-        draw.text((10, 10), f"FRAME: {frame_number} | TIME: {timestamp}", fill=(255, 0, 0), font=font)
+        draw_frame_overlay(image, frame_number, timestamp, load_overlay_font())
         
         # 保存图像到pictures目录
         output_path = f"pictures/frame_{frame_number}.jpg"
-        image.save(output_path)
-        print(f"图像已保存为 {output_path}")
+        with stage('write_image') as stats:
+            image.save(output_path)
+            stats.add(frames=1, bytes_written=os.path.getsize(output_path))
         
     except Exception as e:
         print(f"处理图像时出错: {e}")
 
 if __name__ == "__main__":
-    # 读取camera.msg文件的所有帧
-    read_msg_file(r"D:\code\dog_data\3.31\camera.msg")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='从相机录制文件中提取图片')
+    parser.add_argument('--msg', type=str, default=r"D:\code\dog_data\3.31\camera.msg", help='camera.msg文件路径')
+    parser.add_argument('--output', type=str, default='pictures', help='图片输出目录')
+    parser.add_argument('--no-overlay', action='store_true', help='不绘制帧号和时间，直接写出原始JPEG')
+    parser.add_argument('--legacy', action='store_true', help='使用旧流程，先保存frames/*.txt再生成图片')
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    enable_from_args(args)
+    
+    if args.legacy:
+        # 读取camera.msg文件的所有帧
+        read_msg_file(args.msg)
+    else:
+        extract_frames(args.msg, args.output, overlay=not args.no_overlay)
@@ -0,0 +1,59 @@
+import os
+import sys
+import threading
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from video_process import DecodeAheadBuffer
+
+# get() 等待解码的超时（秒），超时视为死锁
+GET_TIMEOUT = 5.0
+
+
+def make_frames(folder, count):
+    """写出count张小PNG，第k张的像素值为k"""
+    paths = []
+    for k in range(count):
+        path = os.path.join(folder, f"frame_{k}.png")
+        cv2.imwrite(path, np.full((4, 4, 3), k, dtype=np.uint8))
+        paths.append(path)
+    return paths
+
+
+def get_with_timeout(buffer, idx):
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(img=buffer.get(idx)), daemon=True)
+    thread.start()
+    thread.join(GET_TIMEOUT)
+    assert not thread.is_alive(), f"get({idx}) 没有返回"
+    return result['img']
+
+
+def test_step_back_then_resume(tmp_path):
+    buffer = DecodeAheadBuffer(make_frames(str(tmp_path), 20), capacity=4)
+    try:
+        for i in range(6):
+            buffer.seek(i)
+            assert get_with_timeout(buffer, i)[0, 0, 0] == i
+        # 跳到尚未解码的位置后单步后退，不重新seek直接请求后面的帧
+        buffer.seek(11, -1)
+        assert get_with_timeout(buffer, 11)[0, 0, 0] == 11
+        assert get_with_timeout(buffer, 12)[0, 0, 0] == 12
+        # 继续播放
+        for i in range(12, 20):
+            buffer.seek(i)
+            assert get_with_timeout(buffer, i)[0, 0, 0] == i
+    finally:
+        buffer.close()
+
+
+def test_sequential_get_beyond_capacity(tmp_path):
+    buffer = DecodeAheadBuffer(make_frames(str(tmp_path), 12), capacity=3)
+    try:
+        for i in range(12):
+            assert get_with_timeout(buffer, i)[0, 0, 0] == i
+    finally:
+        buffer.close()
@@ -0,0 +1,15 @@
+import re
+
+
+def natural_sort_key(file_name):
+    """自然排序的键，使 "2.ply" 排在 "10.ply" 之前"""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', file_name)]
+
+
+def extract_number(file_name):
+    """
+    提取文件名中的第一个数字，没有数字时返回0
+    例如: "image_001.jpg" 将返回 1
+    """
+    match = re.search(r'\d+', file_name)
+    return int(match.group()) if match else 0
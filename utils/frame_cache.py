@@ -0,0 +1,89 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# 默认内存上限：1GB，约可容纳 30k 点的帧数千帧
+DEFAULT_MAX_BYTES = 1 << 30
+
+
+def _nbytes(value):
+    """估算缓存项占用的字节数，支持数组以及数组组成的元组/列表"""
+    if value is None:
+        return 0
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(v) for v in value)
+    return 0
+
+
+class FrameCache:
+    """
+    已解码帧的LRU缓存，按 (文件路径, 修改时间) 作为键，超过内存上限时淘汰最久未使用的帧
+
+    文件被重新生成（修改时间变化）后旧的缓存项自然失效
+
+    用法:
+        cache = FrameCache(max_bytes=512 << 20)
+        points, colors = cache.get(ply_path, load_frame_arrays)
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def _key(self, path):
+        return (os.path.abspath(path), os.stat(path).st_mtime_ns)
+
+    def get(self, path, loader):
+        """
+        返回path对应的已解码帧，未缓存时调用 loader(path) 加载并放入缓存
+        """
+        key = self._key(path)
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            self.misses += 1
+
+        # 在锁外加载，避免阻塞其他线程读取缓存
+        value = loader(path)
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        size = _nbytes(value)
+        with self._lock:
+            if key in self._items:
+                self.current_bytes -= _nbytes(self._items.pop(key))
+            # 单个帧超过上限时不缓存
+            if size > self.max_bytes:
+                return
+            self._items[key] = value
+            self.current_bytes += size
+            self._evict()
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and self._items:
+            _, old = self._items.popitem(last=False)
+            self.current_bytes -= _nbytes(old)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """返回缓存命中情况，便于在控制台输出"""
+        return (f"缓存 {len(self._items)} 帧, {self.current_bytes / (1 << 20):.1f}MB, "
+                f"命中 {self.hits}, 未命中 {self.misses}")
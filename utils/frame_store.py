@@ -0,0 +1,248 @@
+import os
+import json
+import numpy as np
+
+# 存储格式版本，格式变化时递增
+STORE_VERSION = 1
+
+# 每个分块默认容纳的点数，约 8M 点 * 16 字节 = 128MB
+DEFAULT_CHUNK_POINTS = 8_000_000
+
+
+class FrameStoreWriter:
+    """
+    把逐帧点云写入分块列式存储
+
+    目录结构:
+        meta.json          分块信息和总帧数/点数
+        offsets.npy        int64 (帧数+1,)，第i帧的点位于全局 [offsets[i], offsets[i+1])
+        stamps.npy         float64 (帧数,)，每帧时间戳，未知为NaN
+        points_XXXXX.npy   float32 (N, 3)，分块内所有帧拼接的坐标
+        intensity_XXXXX.npy float32 (N,)，对应的强度
+
+    用法:
+        with FrameStoreWriter("session.store") as writer:
+            for points, intensity, stamp in frames:
+                writer.append(points, intensity, stamp)
+    """
+
+    def __init__(self, path, chunk_points=DEFAULT_CHUNK_POINTS):
+        self.path = path
+        self.chunk_points = chunk_points
+        os.makedirs(path, exist_ok=True)
+        self._offsets = [0]
+        self._stamps = []
+        self._chunks = []
+        self._pending_points = []
+        self._pending_intensity = []
+        self._pending_count = 0
+        self._chunk_first_frame = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def num_frames(self):
+        return len(self._offsets) - 1
+
+    @property
+    def num_points(self):
+        return self._offsets[-1]
+
+    def append(self, points, intensity=None, stamp=None):
+        """追加一帧，points为 (N, 3)，intensity为 (N,)"""
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 3)
+        if intensity is None:
+            intensity = np.zeros(len(points), dtype=np.float32)
+        intensity = np.asarray(intensity, dtype=np.float32).reshape(-1)
+
+        self._pending_points.append(points)
+        self._pending_intensity.append(intensity)
+        self._pending_count += len(points)
+        self._offsets.append(self._offsets[-1] + len(points))
+        self._stamps.append(np.nan if stamp is None else stamp)
+
+        if self._pending_count >= self.chunk_points:
+            self._flush_chunk()
+
+    def _flush_chunk(self):
+        if not self._pending_points:
+            return
+        chunk_id = len(self._chunks)
+        points_file = f"points_{chunk_id:05d}.npy"
+        intensity_file = f"intensity_{chunk_id:05d}.npy"
+        np.save(os.path.join(self.path, points_file), np.concatenate(self._pending_points))
+        np.save(os.path.join(self.path, intensity_file), np.concatenate(self._pending_intensity))
+
+        num_frames = len(self._offsets) - 1 - self._chunk_first_frame
+        self._chunks.append({
+            'points': points_file,
+            'intensity': intensity_file,
+            'first_frame': self._chunk_first_frame,
+            'num_frames': num_frames,
+            'first_point': self._offsets[self._chunk_first_frame],
+            'num_points': self._pending_count,
+        })
+        self._chunk_first_frame += num_frames
+        self._pending_points = []
+        self._pending_intensity = []
+        self._pending_count = 0
+
+    def close(self):
+        """写出剩余数据和元信息，meta.json最后写入，存在即表示存储完整"""
+        self._flush_chunk()
+        np.save(os.path.join(self.path, "offsets.npy"), np.asarray(self._offsets, dtype=np.int64))
+        np.save(os.path.join(self.path, "stamps.npy"), np.asarray(self._stamps, dtype=np.float64))
+        meta = {
+            'version': STORE_VERSION,
+            'num_frames': len(self._offsets) - 1,
+            'num_points': int(self._offsets[-1]),
+            'chunks': self._chunks,
+        }
+        with open(os.path.join(self.path, "meta.json"), 'w') as f:
+            json.dump(meta, f, indent=2)
+
+
+class FrameStore:
+    """
+    以内存映射方式读取分块列式存储，按帧或帧范围切片，不需要逐个打开文件
+
+    用法:
+        store = FrameStore("session.store")
+        points, intensity = store.frame(10)
+        points, intensity, offsets = store.frames(0, 31)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        meta_path = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_path):
+            raise ValueError(f"帧存储不存在或不完整: {path}")
+        with open(meta_path, 'r') as f:
+            self.meta = json.load(f)
+        if self.meta.get('version') != STORE_VERSION:
+            raise ValueError(f"不支持的帧存储版本: {self.meta.get('version')}")
+
+        self.offsets = np.load(os.path.join(path, "offsets.npy"))
+        self.stamps = np.load(os.path.join(path, "stamps.npy"))
+        self.chunks = self.meta['chunks']
+        self._chunk_first_frames = np.array([c['first_frame'] for c in self.chunks], dtype=np.int64)
+        self._loaded = {}
+
+    def __len__(self):
+        return self.meta['num_frames']
+
+    @property
+    def num_points(self):
+        return self.meta['num_points']
+
+    def _chunk_arrays(self, chunk_id):
+        """内存映射方式打开分块，只在第一次访问时打开"""
+        if chunk_id not in self._loaded:
+            chunk = self.chunks[chunk_id]
+            self._loaded[chunk_id] = (
+                np.load(os.path.join(self.path, chunk['points']), mmap_mode='r'),
+                np.load(os.path.join(self.path, chunk['intensity']), mmap_mode='r'),
+            )
+        return self._loaded[chunk_id]
+
+    def _chunk_of(self, frame_idx):
+        return int(np.searchsorted(self._chunk_first_frames, frame_idx, side='right') - 1)
+
+    def frame_size(self, frame_idx):
+        """返回第frame_idx帧的点数"""
+        return int(self.offsets[frame_idx + 1] - self.offsets[frame_idx])
+
+    def frame(self, frame_idx):
+        """
+        返回单帧的 (points, intensity)，是分块上的只读视图，不复制数据
+        """
+        if not 0 <= frame_idx < len(self):
+            raise IndexError(f"帧序号超出范围: {frame_idx}")
+        chunk_id = self._chunk_of(frame_idx)
+        points, intensity = self._chunk_arrays(chunk_id)
+        base = self.chunks[chunk_id]['first_point']
+        start = int(self.offsets[frame_idx]) - base
+        stop = int(self.offsets[frame_idx + 1]) - base
+        return points[start:stop], intensity[start:stop]
+
+    def frames(self, start, stop):
+        """
+        返回 [start, stop) 范围内所有帧拼接后的点
+
+        返回:
+            (points, intensity, offsets)
+            offsets为 (帧数+1,) 的数组，第k帧的点位于 [offsets[k], offsets[k+1])
+            范围在同一个分块内时返回视图，否则只拼接一次
+        """
+        start = max(0, start)
+        stop = min(len(self), stop)
+        offsets = self.offsets[start:stop + 1] - self.offsets[start]
+        if stop <= start:
+            return (np.zeros((0, 3), dtype=np.float32), np.zeros(0, dtype=np.float32),
+                    np.zeros(1, dtype=np.int64))
+
+        first_chunk = self._chunk_of(start)
+        last_chunk = self._chunk_of(stop - 1)
+        points_parts, intensity_parts = [], []
+        for chunk_id in range(first_chunk, last_chunk + 1):
+            chunk = self.chunks[chunk_id]
+            points, intensity = self._chunk_arrays(chunk_id)
+            lo_frame = max(start, chunk['first_frame'])
+            hi_frame = min(stop, chunk['first_frame'] + chunk['num_frames'])
+            lo = int(self.offsets[lo_frame]) - chunk['first_point']
+            hi = int(self.offsets[hi_frame]) - chunk['first_point']
+            points_parts.append(points[lo:hi])
+            intensity_parts.append(intensity[lo:hi])
+
+        if len(points_parts) == 1:
+            return points_parts[0], intensity_parts[0], offsets
+        return np.concatenate(points_parts), np.concatenate(intensity_parts), offsets
+
+
+def build_from_msg(msg_file, store_path, chunk_points=DEFAULT_CHUNK_POINTS):
+    """从雷达msgpack录制文件建立帧存储"""
+    from lidar_read import iter_lidar_frames
+    from utils.pointcloud2 import cloud_xyz, cloud_intensity
+
+    with FrameStoreWriter(store_path, chunk_points) as writer:
+        for i, cloud, stamp in iter_lidar_frames(msg_file):
+            writer.append(cloud_xyz(cloud), cloud_intensity(cloud), stamp)
+    print(f"已建立帧存储 {store_path}: {writer.num_frames} 帧, {writer.num_points} 个点")
+    return store_path
+
+
+def build_from_ply_dir(ply_dir, store_path, chunk_points=DEFAULT_CHUNK_POINTS):
+    """
+    从按帧序号命名的PLY目录建立帧存储
+
+    带intensity属性的PLY直接读取强度；旧PLY只保存了灰度颜色，强度按 灰度 * 255 还原（超过255的强度已被截断）
+    """
+    from utils.file_order import extract_number
+    from utils.ply_io import read_ply_vertices, vertices_xyz, vertices_intensity
+
+    ply_files = sorted([f for f in os.listdir(ply_dir) if f.lower().endswith('.ply')], key=extract_number)
+    with FrameStoreWriter(store_path, chunk_points) as writer:
+        for ply_file in ply_files:
+            vertices = read_ply_vertices(os.path.join(ply_dir, ply_file))
+            writer.append(vertices_xyz(vertices), vertices_intensity(vertices))
+    print(f"已建立帧存储 {store_path}: {writer.num_frames} 帧, {writer.num_points} 个点")
+    return store_path
+
+
+if __name__ == "__main__":
+    # 用法: python -m utils.frame_store <rt_utlidar_cloud_deskewed.msg 或 PLY目录> <输出存储目录>
+    import argparse
+    parser = argparse.ArgumentParser(description='建立分块列式帧存储')
+    parser.add_argument('source', type=str, help='雷达msgpack录制文件或PLY目录')
+    parser.add_argument('store', type=str, help='输出的帧存储目录')
+    parser.add_argument('--chunk-points', type=int, default=DEFAULT_CHUNK_POINTS, help='每个分块的点数')
+    args = parser.parse_args()
+
+    if os.path.isdir(args.source):
+        build_from_ply_dir(args.source, args.store, args.chunk_points)
+    else:
+        build_from_msg(args.source, args.store, args.chunk_points)
@@ -0,0 +1,263 @@
+import os
+import csv
+import sys
+import json
+import time
+import atexit
+import threading
+import contextlib
+
+# 设置为报告文件路径（.json 或 .csv）时启用各阶段计时，例如 RGB_POINT_PROFILE=profile.json
+ENV_VAR = "RGB_POINT_PROFILE"
+
+# 节流进度输出的默认间隔（秒）
+DEFAULT_PROGRESS_INTERVAL = 2.0
+
+
+def peak_rss_bytes():
+    """
+    进程的峰值常驻内存（字节），优先使用标准库resource，其次psutil，都不可用时返回None
+    """
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux以KB为单位，macOS以字节为单位
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        # Windows提供峰值工作集，其他平台只能取当前值
+        return getattr(info, 'peak_wset', info.rss)
+    except ImportError:
+        return None
+
+
+class StageStats:
+    """单个阶段的累计统计：调用次数、耗时、帧数、点数、读写字节数和阶段结束时的峰值内存"""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self.frames = 0
+        self.points = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.peak_rss = None
+
+    def add(self, frames=0, points=0, bytes_read=0, bytes_written=0):
+        self.frames += frames
+        self.points += points
+        self.bytes_read += bytes_read
+        self.bytes_written += bytes_written
+
+    def to_dict(self):
+        seconds = self.seconds or 1e-12
+        return {
+            'stage': self.name,
+            'calls': self.calls,
+            'seconds': round(self.seconds, 6),
+            'frames': self.frames,
+            'points': self.points,
+            'bytes_read': self.bytes_read,
+            'bytes_written': self.bytes_written,
+            'frames_per_sec': round(self.frames / seconds, 3) if self.frames else None,
+            'points_per_sec': round(self.points / seconds, 1) if self.points else None,
+            'read_mb_per_sec': round(self.bytes_read / seconds / (1 << 20), 3) if self.bytes_read else None,
+            'write_mb_per_sec': round(self.bytes_written / seconds / (1 << 20), 3) if self.bytes_written else None,
+            'peak_rss_mb': round(self.peak_rss / (1 << 20), 1) if self.peak_rss is not None else None,
+        }
+
+
+class _NullStats:
+    """未启用计时时stage()返回的占位对象，add()不做任何事"""
+
+    def add(self, frames=0, points=0, bytes_read=0, bytes_written=0):
+        pass
+
+
+_NULL_STATS = _NullStats()
+
+
+class Instrument:
+    """
+    按阶段累计耗时和吞吐量，线程安全
+
+    用法:
+        instrument = Instrument()
+        with instrument.stage('write_ply') as stats:
+            write_cloud_ply(path, cloud)
+            stats.add(frames=1, points=len(cloud), bytes_written=os.path.getsize(path))
+        instrument.write_report('profile.json')
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.start_time = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def _get(self, name):
+        with self._lock:
+            if name not in self.stages:
+                self.stages[name] = StageStats(name)
+            return self.stages[name]
+
+    @contextlib.contextmanager
+    def stage(self, name, **counts):
+        stats = self._get(name)
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            elapsed = time.perf_counter() - start
+            peak = peak_rss_bytes()
+            with self._lock:
+                stats.calls += 1
+                stats.seconds += elapsed
+                stats.add(**counts)
+                if peak is not None:
+                    stats.peak_rss = max(stats.peak_rss or 0, peak)
+
+    def report(self):
+        """返回各阶段统计的字典列表，按首次出现的顺序"""
+        with self._lock:
+            return [stats.to_dict() for stats in self.stages.values()]
+
+    def write_report(self, path):
+        """按扩展名写出JSON或CSV报告"""
+        rows = self.report()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if path.lower().endswith('.csv'):
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=list(StageStats('').to_dict()))
+                writer.writeheader()
+                writer.writerows(rows)
+        else:
+            peak = peak_rss_bytes()
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'command': ' '.join(sys.argv),
+                    'total_seconds': round(time.perf_counter() - self.start_time, 3),
+                    'peak_rss_mb': round(peak / (1 << 20), 1) if peak is not None else None,
+                    'stages': rows,
+                }, f, indent=2, ensure_ascii=False)
+
+    def print_summary(self):
+        print("各阶段耗时:")
+        for row in self.report():
+            parts = [f"  {row['stage']}: {row['seconds']:.2f}s, {row['calls']} 次"]
+            if row['frames_per_sec']:
+                parts.append(f"{row['frames_per_sec']:.1f} 帧/秒")
+            if row['points_per_sec']:
+                parts.append(f"{row['points_per_sec'] / 1e6:.2f}M 点/秒")
+            if row['read_mb_per_sec']:
+                parts.append(f"读 {row['read_mb_per_sec']:.1f} MB/秒")
+            if row['write_mb_per_sec']:
+                parts.append(f"写 {row['write_mb_per_sec']:.1f} MB/秒")
+            if row['peak_rss_mb'] is not None:
+                parts.append(f"峰值内存 {row['peak_rss_mb']:.0f}MB")
+            print(", ".join(parts))
+
+
+_instrument = None
+
+
+def enable(report_path=None):
+    """
+    启用全局计时；report_path不为空时在进程退出时写出报告并输出摘要
+
+    返回:
+        全局Instrument对象
+    """
+    global _instrument
+    if _instrument is None:
+        _instrument = Instrument()
+        if report_path:
+            def finish():
+                _instrument.write_report(report_path)
+                _instrument.print_summary()
+                print(f"性能报告已保存到 {report_path}")
+            atexit.register(finish)
+    return _instrument
+
+
+def enabled():
+    return _instrument is not None
+
+
+def stage(name, **counts):
+    """
+    记录一个阶段的耗时，未启用时几乎没有开销
+
+    用法:
+        with stage('parse') as stats:
+            cloud = decode_point_cloud2(data)
+            stats.add(frames=1, points=len(cloud))
+    """
+    if _instrument is None:
+        return contextlib.nullcontext(_NULL_STATS)
+    return _instrument.stage(name, **counts)
+
+
+def add_profile_argument(parser):
+    """给命令行解析器添加 --profile REPORT 参数"""
+    parser.add_argument('--profile', type=str, default=None, metavar='REPORT',
+                        help=f'记录各阶段耗时并在结束时写出报告（.json 或 .csv），也可用环境变量 {ENV_VAR} 指定')
+
+
+def enable_from_args(args):
+    """根据 --profile 参数启用计时（环境变量已启用时忽略）"""
+    if getattr(args, 'profile', None):
+        enable(args.profile)
+
+
+class Progress:
+    """
+    节流的进度输出，最多每interval秒输出一次，代替逐帧print
+
+    用法:
+        with Progress("转换", total=len(files)) as progress:
+            for f in files:
+                ...
+                progress.update()
+    """
+
+    def __init__(self, label, total=None, unit="帧", interval=DEFAULT_PROGRESS_INTERVAL):
+        self.label = label
+        self.total = total
+        self.unit = unit
+        self.interval = interval
+        self.count = 0
+        self.start_time = time.perf_counter()
+        self._last_print = self.start_time
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _rate(self, now):
+        return self.count / max(now - self.start_time, 1e-9)
+
+    def update(self, n=1):
+        self.count += n
+        now = time.perf_counter()
+        if now - self._last_print >= self.interval:
+            self._last_print = now
+            done = f"{self.count}/{self.total}" if self.total else f"{self.count}"
+            print(f"{self.label}: {done} {self.unit} ({self._rate(now):.1f} {self.unit}/秒)")
+
+    def close(self):
+        now = time.perf_counter()
+        print(f"{self.label}: 完成 {self.count} {self.unit}, 耗时 {now - self.start_time:.1f} 秒 "
+              f"({self._rate(now):.1f} {self.unit}/秒)")
+
+
+# 环境变量指定了报告路径时自动启用
+if os.environ.get(ENV_VAR):
+    enable(os.environ[ENV_VAR])
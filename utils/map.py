@@ -5,8 +5,9 @@ def generate_mapping(A, B):
     mapping = [(i, round(i * step)) for i in range(A + 1)]
     return mapping
 
-# 示例用法
-A = 289
-B = 417
-mapping = generate_mapping(A, B)
-print(mapping)  # 输出: [(0, 0), (1, 3), (2, 5), (3, 8), (4, 10)]
\ No newline at end of file
+if __name__ == "__main__":
+    # 示例用法
+    A = 289
+    B = 417
+    mapping = generate_mapping(A, B)
+    print(mapping)  # 输出: [(0, 0), (1, 1), (2, 3), (3, 4), (4, 6)]
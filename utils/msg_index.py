@@ -0,0 +1,247 @@
+import os
+import mmap
+import struct
+import msgpack
+import numpy as np
+
+from utils.pointcloud2 import frame_timestamp
+
+# 索引文件的后缀，例如 camera.msg -> camera.msg.idx.npz
+INDEX_SUFFIX = ".idx.npz"
+
+# 建索引时需要真正解码的键，其余值（图像、点云等大块数据）只按长度跳过
+_TIMESTAMP_KEYS = ('my_time_stamp', 'header')
+
+
+def _read_header(buf, pos):
+    """
+    解析一个msgpack对象的头部
+
+    返回:
+        (负载开始位置, 负载字节数, 子对象数量)
+        数组的子对象数量为元素个数，字典为键值对数量的2倍
+    """
+    b = buf[pos]
+    pos += 1
+    if b <= 0x7f or b >= 0xe0:  # positive/negative fixint
+        return pos, 0, 0
+    if b <= 0x8f:  # fixmap
+        return pos, 0, 2 * (b & 0x0f)
+    if b <= 0x9f:  # fixarray
+        return pos, 0, b & 0x0f
+    if b <= 0xbf:  # fixstr
+        return pos, b & 0x1f, 0
+    if b in (0xc0, 0xc2, 0xc3):  # nil/false/true
+        return pos, 0, 0
+    if b in (0xc4, 0xd9):  # bin8/str8
+        return pos + 1, buf[pos], 0
+    if b in (0xc5, 0xda):  # bin16/str16
+        return pos + 2, struct.unpack_from('>H', buf, pos)[0], 0
+    if b in (0xc6, 0xdb):  # bin32/str32
+        return pos + 4, struct.unpack_from('>I', buf, pos)[0], 0
+    if b == 0xc7:  # ext8
+        return pos + 2, buf[pos], 0
+    if b == 0xc8:  # ext16
+        return pos + 3, struct.unpack_from('>H', buf, pos)[0], 0
+    if b == 0xc9:  # ext32
+        return pos + 5, struct.unpack_from('>I', buf, pos)[0], 0
+    if b in (0xca, 0xce, 0xd2):  # float32/uint32/int32
+        return pos, 4, 0
+    if b in (0xcb, 0xcf, 0xd3):  # float64/uint64/int64
+        return pos, 8, 0
+    if b in (0xcc, 0xd0):  # uint8/int8
+        return pos, 1, 0
+    if b in (0xcd, 0xd1):  # uint16/int16
+        return pos, 2, 0
+    if 0xd4 <= b <= 0xd8:  # fixext 1/2/4/8/16
+        return pos, 1 + (1 << (b - 0xd4)), 0
+    if b == 0xdc:  # array16
+        return pos + 2, 0, struct.unpack_from('>H', buf, pos)[0]
+    if b == 0xdd:  # array32
+        return pos + 4, 0, struct.unpack_from('>I', buf, pos)[0]
+    if b == 0xde:  # map16
+        return pos + 2, 0, 2 * struct.unpack_from('>H', buf, pos)[0]
+    if b == 0xdf:  # map32
+        return pos + 4, 0, 2 * struct.unpack_from('>I', buf, pos)[0]
+    raise ValueError(f"无法识别的msgpack类型字节 0x{b:02x}，位置 {pos - 1}")
+
+
+def skip_object(buf, pos):
+    """跳过从pos开始的一个完整msgpack对象，返回其结束位置，不解码任何数据"""
+    pending = 1
+    while pending:
+        pos, size, children = _read_header(buf, pos)
+        pos += size
+        pending += children - 1
+    return pos
+
+
+def _scan_frame(buf, pos):
+    """
+    扫描一帧（顶层字典），只解码时间戳相关的小字段
+
+    返回:
+        (帧结束位置, 时间戳或None)
+    """
+    b = buf[pos]
+    if b not in (0xde, 0xdf) and not 0x80 <= b <= 0x8f:
+        # 顶层不是字典，整个跳过
+        return skip_object(buf, pos), None
+
+    pos, _, children = _read_header(buf, pos)
+    small = {}
+    for _ in range(children // 2):
+        key_end = skip_object(buf, pos)
+        try:
+            key = msgpack.unpackb(buf[pos:key_end], raw=False)
+        except Exception:
+            key = None
+        value_end = skip_object(buf, key_end)
+        if key in _TIMESTAMP_KEYS:
+            small[key] = msgpack.unpackb(buf[key_end:value_end], raw=False)
+        pos = value_end
+    return pos, frame_timestamp(small)
+
+
+def index_path_for(file_name):
+    """返回录制文件对应的索引文件路径"""
+    return file_name + INDEX_SUFFIX
+
+
+def build_index(file_name, save=True):
+    """
+    单遍扫描录制文件，记录每帧的字节偏移、长度和时间戳
+
+    图像、点云等大块数据只按长度跳过，不会被解码或复制
+
+    参数:
+        file_name: .msg 录制文件路径
+        save: 是否写出 <file_name>.idx.npz 索引文件
+
+    返回:
+        包含 offsets/lengths/stamps 数组的字典
+    """
+    offsets, lengths, stamps = [], [], []
+    size = os.path.getsize(file_name)
+    if size > 0:
+        with open(file_name, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = 0
+            while pos < size:
+                try:
+                    end, stamp = _scan_frame(mm, pos)
+                except (IndexError, struct.error, ValueError) as e:
+                    end, stamp = size + 1, None
+                    print(f"解析第{len(offsets)}帧时出错: {e}")
+                if end > size:
+                    # 录制中断时最后一帧可能不完整，忽略它
+                    print(f"第{len(offsets)}帧数据不完整，已忽略（偏移 {pos}）")
+                    break
+                offsets.append(pos)
+                lengths.append(end - pos)
+                stamps.append(np.nan if stamp is None else stamp)
+                pos = end
+
+    index = {
+        'offsets': np.asarray(offsets, dtype=np.uint64),
+        'lengths': np.asarray(lengths, dtype=np.uint64),
+        'stamps': np.asarray(stamps, dtype=np.float64),
+        'source_size': np.int64(size),
+        'source_mtime': np.float64(os.path.getmtime(file_name)),
+    }
+    if save:
+        # 先写临时文件再替换，避免中断时留下损坏的索引
+        tmp_path = index_path_for(file_name) + ".tmp.npz"
+        try:
+            np.savez(tmp_path, **index)
+            os.replace(tmp_path, index_path_for(file_name))
+        except OSError as e:
+            # 数据目录只读时只在内存中使用索引
+            print(f"警告: 无法保存索引文件 {index_path_for(file_name)}（{e}），本次只在内存中使用")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return index
+
+
+def load_index(file_name, rebuild=False):
+    """
+    加载录制文件的索引；索引不存在或与录制文件不一致（大小/修改时间变化）时重新建立
+    """
+    idx_path = index_path_for(file_name)
+    if not rebuild and os.path.exists(idx_path):
+        with np.load(idx_path) as data:
+            index = {key: data[key] for key in data.files}
+        if (int(index['source_size']) == os.path.getsize(file_name)
+                and float(index['source_mtime']) == os.path.getmtime(file_name)):
+            return index
+        print(f"索引 {idx_path} 已过期，重新建立")
+    return build_index(file_name)
+
+
+class MsgFrameReader:
+    """
+    基于索引和内存映射随机访问录制文件中的任意帧
+
+    用法:
+        with MsgFrameReader("camera.msg") as reader:
+            frame = reader.read(100)
+            for i, frame in reader.iter_frames(reader.time_range(t0, t1)):
+                ...
+    """
+
+    def __init__(self, file_name, rebuild_index=False):
+        self.file_name = file_name
+        index = load_index(file_name, rebuild=rebuild_index)
+        self.offsets = index['offsets']
+        self.lengths = index['lengths']
+        self.stamps = index['stamps']
+        self._file = open(file_name, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if len(self.offsets) else None
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def read_raw(self, i):
+        """返回第i帧的原始msgpack字节视图（不复制）"""
+        start = int(self.offsets[i])
+        return memoryview(self._mm)[start:start + int(self.lengths[i])]
+
+    def read(self, i):
+        """解码并返回第i帧的字典"""
+        raw = self.read_raw(i)
+        try:
+            return msgpack.unpackb(raw, raw=False)
+        finally:
+            raw.release()
+
+    def iter_frames(self, indices=None):
+        """按给定顺序逐帧产出 (帧序号, 字典)，indices为None时遍历全部帧"""
+        if indices is None:
+            indices = range(len(self))
+        for i in indices:
+            yield int(i), self.read(i)
+
+    def time_range(self, start_time, end_time):
+        """返回时间戳落在 [start_time, end_time] 内的帧序号"""
+        stamps = self.stamps
+        if np.all(np.diff(stamps) >= 0):
+            lo = np.searchsorted(stamps, start_time, side='left')
+            hi = np.searchsorted(stamps, end_time, side='right')
+            return np.arange(lo, hi)
+        # 时间戳不单调时退回到逐个比较
+        return np.nonzero((stamps >= start_time) & (stamps <= end_time))[0]
+
+    def nearest(self, timestamp):
+        """返回时间戳最接近给定时间的帧序号"""
+        return int(np.nanargmin(np.abs(self.stamps - timestamp)))
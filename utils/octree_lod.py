@@ -0,0 +1,322 @@
+import os
+import json
+import shutil
+import numpy as np
+
+# 存储格式版本，格式变化时递增
+LOD_VERSION = 1
+
+# 每个节点（瓦片）最多保存的点数，叶子节点除外
+DEFAULT_NODE_POINTS = 20_000
+
+# 最大深度，到达后剩余的点全部放入叶子节点
+MAX_DEPTH = 12
+
+# 默认预览点数
+DEFAULT_PREVIEW_POINTS = 200_000
+
+# 节点表：层级、该层的格网坐标、在points.npy中的起始位置和点数
+NODE_DTYPE = np.dtype([
+    ('level', '<i4'),
+    ('ix', '<i4'), ('iy', '<i4'), ('iz', '<i4'),
+    ('start', '<i8'),
+    ('count', '<i8'),
+])
+
+_KEY_BITS = 21
+
+
+def _cell_coords(points, origin, size, level):
+    """点在第level层格网中的坐标 (N, 3)，根节点立方体边长为size"""
+    cells = 1 << level
+    coords = np.floor((points - origin) * (cells / size)).astype(np.int64)
+    np.clip(coords, 0, cells - 1, out=coords)
+    return coords
+
+
+def _pack(coords):
+    return (coords[:, 0] << (2 * _KEY_BITS)) | (coords[:, 1] << _KEY_BITS) | coords[:, 2]
+
+
+def _unpack(keys):
+    mask = (1 << _KEY_BITS) - 1
+    return np.stack([keys >> (2 * _KEY_BITS), (keys >> _KEY_BITS) & mask, keys & mask], axis=1)
+
+
+def build_lod(points, intensity, lod_path, node_points=DEFAULT_NODE_POINTS, max_depth=MAX_DEPTH, seed=0):
+    """
+    建立分块八叉树LOD存储
+
+    从根节点开始逐层划分，每个节点从尚未分配的点中随机取最多node_points个点，
+    剩余的点留给下一层，直到所有点分配完毕或到达max_depth。
+    点按 (层级, 节点) 顺序连续存放，前若干层正好是文件开头的一段，预览只需读取一段连续数据
+
+    目录结构:
+        meta.json      包围立方体、层数、各层点数等
+        nodes.npy      节点表（NODE_DTYPE），按层级和格网坐标排序
+        points.npy     float32 (N, 3)
+        intensity.npy  float32 (N,)
+
+    参数:
+        points: (N, 3) 坐标
+        intensity: (N,) 强度，None时填0
+        lod_path: 输出目录
+        node_points: 每个非叶子节点的点数上限
+        seed: 随机采样种子，相同输入得到相同结果
+    """
+    points = np.asarray(points, dtype=np.float32).reshape(-1, 3)
+    if intensity is None:
+        intensity = np.zeros(len(points), dtype=np.float32)
+    intensity = np.asarray(intensity, dtype=np.float32).reshape(-1)
+    if len(points) == 0:
+        raise ValueError("点云为空，无法建立LOD存储")
+    max_depth = min(max_depth, _KEY_BITS - 1)
+
+    origin = points.min(axis=0).astype(np.float64)
+    size = float(np.max(points.max(axis=0) - origin))
+    size = max(size, 1e-6) * (1 + 1e-6)
+
+    # 随机顺序保证每个节点取到的是其范围内的均匀抽样
+    remaining = np.random.default_rng(seed).permutation(len(points))
+    order_parts = []
+    node_parts = []
+    level_points = []
+    start = 0
+    for level in range(max_depth + 1):
+        if len(remaining) == 0:
+            break
+        keys = _pack(_cell_coords(points[remaining], origin, size, level))
+        # 稳定排序：同一节点内保持随机顺序（细分后的子节点同样如此）
+        sort = np.argsort(keys, kind='stable')
+        keys = keys[sort]
+        remaining = remaining[sort]
+        node_keys, first, counts = np.unique(keys, return_index=True, return_counts=True)
+
+        if level == max_depth:
+            take = np.ones(len(remaining), dtype=bool)
+            taken_counts = counts
+        else:
+            rank = np.arange(len(remaining)) - np.repeat(first, counts)
+            take = rank < node_points
+            taken_counts = np.minimum(counts, node_points)
+
+        nodes = np.empty(len(node_keys), dtype=NODE_DTYPE)
+        nodes['level'] = level
+        coords = _unpack(node_keys)
+        nodes['ix'], nodes['iy'], nodes['iz'] = coords[:, 0], coords[:, 1], coords[:, 2]
+        nodes['count'] = taken_counts
+        nodes['start'] = start + np.concatenate([[0], np.cumsum(taken_counts)[:-1]])
+        node_parts.append(nodes)
+
+        order_parts.append(remaining[take])
+        remaining = remaining[~take]
+        start += int(taken_counts.sum())
+        level_points.append(int(taken_counts.sum()))
+
+    # 先写到临时目录，完成后替换，meta.json存在即表示存储完整
+    tmp_path = lod_path.rstrip('/\\') + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    order = np.concatenate(order_parts)
+    np.save(os.path.join(tmp_path, "points.npy"), points[order])
+    np.save(os.path.join(tmp_path, "intensity.npy"), intensity[order])
+    np.save(os.path.join(tmp_path, "nodes.npy"), np.concatenate(node_parts))
+    meta = {
+        'format': 'octree_lod',
+        'version': LOD_VERSION,
+        'origin': origin.tolist(),
+        'size': size,
+        'node_points': node_points,
+        'num_points': int(len(points)),
+        'num_levels': len(level_points),
+        'level_points': level_points,
+    }
+    with open(os.path.join(tmp_path, "meta.json"), 'w') as f:
+        json.dump(meta, f, indent=2)
+    shutil.rmtree(lod_path, ignore_errors=True)
+    os.replace(tmp_path, lod_path)
+
+    print(f"已建立LOD存储 {lod_path}: {len(points)} 个点, {len(level_points)} 层, "
+          f"{sum(len(n) for n in node_parts)} 个节点")
+    return lod_path
+
+
+def is_lod(path):
+    """path是否为八叉树LOD存储目录"""
+    meta_path = os.path.join(path, "meta.json")
+    if not os.path.isdir(path) or not os.path.exists(meta_path):
+        return False
+    with open(meta_path, 'r') as f:
+        return json.load(f).get('format') == 'octree_lod'
+
+
+def lod_path_for(ply_path):
+    """PLY文件对应的LOD存储目录，例如 final.ply -> final.lod"""
+    return os.path.splitext(ply_path)[0] + ".lod"
+
+
+def find_lod(path):
+    """
+    path本身是LOD目录时直接返回；否则返回与PLY同名的.lod目录，
+    不存在或比PLY文件旧（PLY已重新生成）时返回None
+    """
+    if is_lod(path):
+        return path
+    lod_path = lod_path_for(path)
+    if not is_lod(lod_path):
+        return None
+    if os.path.exists(path) and os.path.getmtime(path) > os.path.getmtime(os.path.join(lod_path, "meta.json")):
+        return None
+    return lod_path
+
+
+class OctreeLOD:
+    """
+    以内存映射方式读取八叉树LOD存储
+
+    用法:
+        lod = OctreeLOD("final.lod")
+        points, intensity = lod.preview(200_000)
+        points, intensity = lod.query(bbox_min, bbox_max, max_points=2_000_000)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        meta_path = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_path):
+            raise ValueError(f"LOD存储不存在或不完整: {path}")
+        with open(meta_path, 'r') as f:
+            self.meta = json.load(f)
+        if self.meta.get('format') != 'octree_lod' or self.meta.get('version') != LOD_VERSION:
+            raise ValueError(f"不支持的LOD存储: {path}")
+
+        self.nodes = np.load(os.path.join(path, "nodes.npy"))
+        self.points = np.load(os.path.join(path, "points.npy"), mmap_mode='r')
+        self.intensity = np.load(os.path.join(path, "intensity.npy"), mmap_mode='r')
+        self.origin = np.asarray(self.meta['origin'], dtype=np.float64)
+        self.size = self.meta['size']
+        # 每层第一个点的位置，第0~L层的点正好是 [0, level_offsets[L+1])
+        self.level_offsets = np.concatenate([[0], np.cumsum(self.meta['level_points'])]).astype(np.int64)
+
+        node_size = self.size / (1 << self.nodes['level'].astype(np.int64))
+        coords = np.stack([self.nodes['ix'], self.nodes['iy'], self.nodes['iz']], axis=1)
+        self.node_min = self.origin + coords * node_size[:, None]
+        self.node_max = self.node_min + node_size[:, None]
+
+    def __len__(self):
+        return self.meta['num_points']
+
+    @property
+    def num_levels(self):
+        return self.meta['num_levels']
+
+    @property
+    def bounds(self):
+        """所有点的包围立方体 (min, max)"""
+        return self.origin, self.origin + self.size
+
+    def level_for_budget(self, max_points):
+        """在点数预算内最多能完整读取到第几层（至少为第0层）"""
+        fits = np.nonzero(self.level_offsets[1:] <= max_points)[0]
+        return int(fits[-1]) if len(fits) else 0
+
+    def preview(self, max_points=DEFAULT_PREVIEW_POINTS):
+        """
+        返回整体的粗略预览 (points, intensity)
+
+        读取预算内的前若干层，是文件开头的一段连续数据；第0层点数超过预算时截取其前max_points个点
+        """
+        stop = int(self.level_offsets[self.level_for_budget(max_points) + 1])
+        stop = min(stop, max_points)
+        return np.asarray(self.points[:stop]), np.asarray(self.intensity[:stop])
+
+    def nodes_in_bbox(self, bbox_min, bbox_max, max_level=None):
+        """与包围盒相交的节点序号（按层级排序）"""
+        bbox_min = np.asarray(bbox_min, dtype=np.float64)
+        bbox_max = np.asarray(bbox_max, dtype=np.float64)
+        hit = np.all(self.node_min <= bbox_max, axis=1) & np.all(self.node_max >= bbox_min, axis=1)
+        if max_level is not None:
+            hit &= self.nodes['level'] <= max_level
+        return np.nonzero(hit)[0]
+
+    def query(self, bbox_min, bbox_max, max_level=None, max_points=None):
+        """
+        读取包围盒内的点，只访问与包围盒相交的节点
+
+        参数:
+            max_level: 最多读取到第几层，None表示全部
+            max_points: 点数预算，从粗到细逐层加入，再加一层就会超出预算时停止（至少读取第0层）
+
+        返回:
+            (points, intensity)，只包含落在包围盒内的点
+        """
+        bbox_min = np.asarray(bbox_min, dtype=np.float32)
+        bbox_max = np.asarray(bbox_max, dtype=np.float32)
+        node_ids = self.nodes_in_bbox(bbox_min, bbox_max, max_level)
+
+        if max_points is not None and len(node_ids):
+            levels = self.nodes['level'][node_ids]
+            level_counts = np.bincount(levels, weights=self.nodes['count'][node_ids])
+            cumulative = np.cumsum(level_counts)
+            fits = np.nonzero(cumulative <= max_points)[0]
+            last_level = int(fits[-1]) if len(fits) else 0
+            node_ids = node_ids[levels <= last_level]
+
+        points_parts, intensity_parts = [], []
+        for node_id in node_ids:
+            start = int(self.nodes['start'][node_id])
+            stop = start + int(self.nodes['count'][node_id])
+            points = self.points[start:stop]
+            inside = np.all((points >= bbox_min) & (points <= bbox_max), axis=1)
+            points_parts.append(points[inside])
+            intensity_parts.append(self.intensity[start:stop][inside])
+
+        if not points_parts:
+            return np.zeros((0, 3), dtype=np.float32), np.zeros(0, dtype=np.float32)
+        return np.concatenate(points_parts), np.concatenate(intensity_parts)
+
+
+def lod_to_point_cloud(points, intensity):
+    """把LOD读取结果转换为Open3D点云，按强度生成灰度颜色"""
+    import open3d as o3d
+    from utils.pointcloud2 import intensity_to_gray
+
+    pcd = o3d.geometry.PointCloud()
+    pcd.points = o3d.utility.Vector3dVector(np.asarray(points, dtype=np.float64))
+    pcd.colors = o3d.utility.Vector3dVector(intensity_to_gray(intensity))
+    return pcd
+
+
+def build_from_ply(ply_path, lod_path=None, node_points=DEFAULT_NODE_POINTS):
+    """从PLY文件（例如final.ply）建立LOD存储，默认输出到同名的.lod目录"""
+    from utils.ply_io import read_ply_vertices, vertices_xyz, vertices_intensity
+
+    vertices = read_ply_vertices(ply_path, mmap=True)
+    return build_lod(vertices_xyz(vertices), vertices_intensity(vertices),
+                     lod_path or lod_path_for(ply_path), node_points)
+
+
+def build_from_store(store_path, lod_path, node_points=DEFAULT_NODE_POINTS):
+    """从分块帧存储建立LOD存储（所有帧直接拼接）"""
+    from utils.frame_store import FrameStore
+
+    store = FrameStore(store_path)
+    points, intensity, _ = store.frames(0, len(store))
+    return build_lod(points, intensity, lod_path, node_points)
+
+
+if __name__ == "__main__":
+    # 用法: python -m utils.octree_lod <final.ply 或 帧存储目录> [输出LOD目录]
+    import argparse
+    parser = argparse.ArgumentParser(description='建立分块八叉树LOD存储')
+    parser.add_argument('source', type=str, help='PLY文件或帧存储目录')
+    parser.add_argument('lod', type=str, nargs='?', default=None, help='输出的LOD目录，默认与PLY同名的.lod目录')
+    parser.add_argument('--node-points', type=int, default=DEFAULT_NODE_POINTS, help='每个节点的点数上限')
+    args = parser.parse_args()
+
+    if os.path.isdir(args.source):
+        if args.lod is None:
+            parser.error("从帧存储建立时需要指定输出目录")
+        build_from_store(args.source, args.lod, args.node_points)
+    else:
+        build_from_ply(args.source, args.lod, args.node_points)
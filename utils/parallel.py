@@ -0,0 +1,56 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+# 在途任务数默认为进程数的倍数：足够让每个进程都有排队的任务，又不会一次性提交全部任务
+IN_FLIGHT_PER_WORKER = 2
+
+
+def run_chunks(fn, chunks, workers=None, initializer=None, initargs=(), on_result=None, on_error=None,
+               max_in_flight=None):
+    """
+    用进程池逐个处理任务，限制同时提交的任务数
+
+    参数:
+        fn: 在工作进程中执行的函数 fn(chunk)，必须可以被pickle（模块级函数）
+        chunks: 任务参数列表
+        workers: 进程数，None表示CPU核数，1表示在当前进程中依次处理
+        initializer, initargs: 每个工作进程启动时调用一次 initializer(*initargs)（workers为1时在当前进程中调用）
+        on_result: 在当前进程中按完成顺序调用 on_result(chunk, result)
+        on_error: 任务抛出异常时调用 on_error(chunk, exception) 并继续；None时异常直接抛出
+        max_in_flight: 同时提交的最大任务数，默认为进程数的IN_FLIGHT_PER_WORKER倍
+
+    用法:
+        run_chunks(functools.partial(colorize_chunk, output_dir=output_dir), chunks, workers,
+                   init_pair_worker, init_args, on_result=lambda chunk, results: progress.update(len(results)))
+    """
+    workers = workers or os.cpu_count() or 1
+
+    def finish(chunk, call):
+        try:
+            result = call()
+        except Exception as e:
+            if on_error is None:
+                raise
+            on_error(chunk, e)
+            return
+        if on_result is not None:
+            on_result(chunk, result)
+
+    if workers == 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for chunk in chunks:
+            finish(chunk, lambda: fn(chunk))
+        return
+
+    max_in_flight = max_in_flight or workers * IN_FLIGHT_PER_WORKER
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as executor:
+        pending = {}
+        next_chunk = 0
+        while next_chunk < len(chunks) or pending:
+            while next_chunk < len(chunks) and len(pending) < max_in_flight:
+                pending[executor.submit(fn, chunks[next_chunk])] = chunks[next_chunk]
+                next_chunk += 1
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                finish(pending.pop(future), future.result)
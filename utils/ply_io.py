@@ -0,0 +1,268 @@
+import numpy as np
+
+# PLY属性类型与NumPy类型的对应关系（同时支持旧名称和带位宽的名称）
+PLY_TYPES = {
+    'char': 'i1', 'int8': 'i1',
+    'uchar': 'u1', 'uint8': 'u1',
+    'short': 'i2', 'int16': 'i2',
+    'ushort': 'u2', 'uint16': 'u2',
+    'int': 'i4', 'int32': 'i4',
+    'uint': 'u4', 'uint32': 'u4',
+    'float': 'f4', 'float32': 'f4',
+    'double': 'f8', 'float64': 'f8',
+}
+
+# 写文件时NumPy类型对应的PLY属性名
+_NUMPY_TO_PLY = {
+    'i1': 'char', 'u1': 'uchar', 'i2': 'short', 'u2': 'ushort',
+    'i4': 'int', 'u4': 'uint', 'f4': 'float', 'f8': 'double',
+}
+
+# 点云消息中可以一并写出的附加字段
+EXTRA_FIELDS = ('ring', 'time', 'timestamp')
+
+
+# RGB颜色属性，与常见工具（Open3D、CloudCompare、MeshLab）读取的名称和类型一致
+COLOR_FIELDS = (('red', 'u1'), ('green', 'u1'), ('blue', 'u1'))
+
+
+def vertex_dtype(intensity=True, extra=None, colors=False):
+    """构造顶点的结构化类型：float32 x/y/z，可选 float32 intensity、uchar red/green/blue 和附加字段"""
+    fields = [('x', '<f4'), ('y', '<f4'), ('z', '<f4')]
+    if intensity:
+        fields.append(('intensity', '<f4'))
+    if colors:
+        fields.extend(COLOR_FIELDS)
+    for name, values in (extra or {}).items():
+        fields.append((name, np.asarray(values).dtype.newbyteorder('<').str))
+    return np.dtype(fields)
+
+
+def ply_header(dtype, count, count_width=0):
+    """
+    生成 binary_little_endian 格式的PLY文件头
+
+    count_width大于0时顶点数左侧补空格到固定宽度，便于写完数据后原地改写
+    """
+    lines = ["ply", "format binary_little_endian 1.0", "comment Created by rgb-point",
+             f"element vertex {count:>{count_width}}" if count_width else f"element vertex {count}"]
+    for name in dtype.names:
+        lines.append(f"property {_NUMPY_TO_PLY[dtype[name].str[1:]]} {name}")
+    lines.append("end_header")
+    return ("\n".join(lines) + "\n").encode('ascii')
+
+
+def pack_vertices(points, intensity=None, extra=None, colors=None):
+    """把坐标、强度、RGB颜色和附加字段打包成顶点结构化数组"""
+    points = np.asarray(points).reshape(-1, 3)
+    dtype = vertex_dtype(intensity is not None, extra, colors is not None)
+    vertices = np.empty(len(points), dtype=dtype)
+    vertices['x'] = points[:, 0]
+    vertices['y'] = points[:, 1]
+    vertices['z'] = points[:, 2]
+    if intensity is not None:
+        vertices['intensity'] = intensity
+    if colors is not None:
+        colors = np.asarray(colors).reshape(-1, 3)
+        for k, (name, _) in enumerate(COLOR_FIELDS):
+            vertices[name] = colors[:, k]
+    for name, values in (extra or {}).items():
+        vertices[name] = values
+    return vertices
+
+
+def write_ply(file_path, points, intensity=None, extra=None, colors=None):
+    """
+    写出 binary_little_endian PLY，坐标为float32，强度作为标量intensity属性保存
+
+    参数:
+        file_path: 输出文件路径
+        points: (N, 3) 坐标
+        intensity: (N,) 强度，None表示不写强度
+        extra: 附加字段字典，例如 {'ring': ring, 'time': t}，保留原始类型
+        colors: (N, 3) uint8 RGB颜色，写为 red/green/blue 属性，None表示不写颜色
+    """
+    vertices = pack_vertices(points, intensity, extra, colors)
+    with open(file_path, 'wb') as f:
+        f.write(ply_header(vertices.dtype, len(vertices)))
+        f.write(vertices.tobytes())
+
+
+class PlyStreamWriter:
+    """
+    分批写出PLY顶点，适合事先不知道总点数、数据量又放不进内存的情况
+
+    先写出带占位顶点数的文件头，关闭时再原地改写为实际点数
+
+    用法:
+        with PlyStreamWriter("final.ply", vertex_dtype()) as writer:
+            writer.write(vertices)
+    """
+
+    # 顶点数占位宽度，足够容纳uint64
+    COUNT_WIDTH = 20
+
+    def __init__(self, file_path, dtype):
+        self.file_path = file_path
+        self.dtype = np.dtype(dtype)
+        self.count = 0
+        self._file = open(file_path, 'wb')
+        self._file.write(ply_header(self.dtype, 0, self.COUNT_WIDTH))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, vertices):
+        """追加一批顶点，vertices为与dtype字段相同的结构化数组"""
+        vertices = np.asarray(vertices, dtype=self.dtype)
+        self._file.write(vertices.tobytes())
+        self.count += len(vertices)
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.seek(0)
+        self._file.write(ply_header(self.dtype, self.count, self.COUNT_WIDTH))
+        self._file.close()
+
+
+def write_cloud_ply(file_path, cloud):
+    """把解码后的PointCloud2结构化数组写成PLY，保留强度以及ring/time等附加字段"""
+    from utils.pointcloud2 import cloud_xyz, cloud_intensity
+
+    extra = {name: cloud[name] for name in EXTRA_FIELDS
+             if name in cloud.dtype.names and cloud.dtype[name].shape == ()}
+    write_ply(file_path, cloud_xyz(cloud), cloud_intensity(cloud), extra)
+
+
+def _parse_header(f):
+    """解析PLY文件头，返回 (格式, 元素列表, 数据起始偏移)"""
+    if f.readline().strip() != b'ply':
+        raise ValueError("不是有效的PLY文件")
+    fmt = None
+    elements = []
+    while True:
+        line = f.readline()
+        if not line:
+            raise ValueError("PLY文件头不完整")
+        parts = line.decode('ascii', errors='replace').split()
+        if not parts or parts[0] in ('comment', 'obj_info'):
+            continue
+        if parts[0] == 'format':
+            fmt = parts[1]
+        elif parts[0] == 'element':
+            elements.append({'name': parts[1], 'count': int(parts[2]), 'properties': []})
+        elif parts[0] == 'property':
+            if parts[1] == 'list':
+                elements[-1]['properties'].append((parts[-1], None))
+            else:
+                elements[-1]['properties'].append((parts[2], PLY_TYPES[parts[1]]))
+        elif parts[0] == 'end_header':
+            return fmt, elements, f.tell()
+
+
+def read_ply_vertices(file_path, mmap=False):
+    """
+    快速读取PLY文件的顶点数据，返回包含全部顶点属性的结构化数组
+
+    参数:
+        file_path: PLY文件路径
+        mmap: 为True时以内存映射方式返回（仅二进制格式），不把数据读入内存
+    """
+    with open(file_path, 'rb') as f:
+        fmt, elements, data_offset = _parse_header(f)
+
+        byte_order = {'binary_little_endian': '<', 'binary_big_endian': '>', 'ascii': '<'}[fmt]
+        offset = data_offset
+        for element in elements:
+            if any(t is None for _, t in element['properties']):
+                if element['name'] == 'vertex':
+                    raise ValueError("不支持列表类型的顶点属性")
+                if fmt != 'ascii':
+                    raise ValueError(f"顶点之前的元素 {element['name']} 含有列表属性，无法定位顶点数据")
+            dtype = np.dtype([(name, byte_order + t) for name, t in element['properties']
+                              if t is not None])
+            if element['name'] == 'vertex':
+                break
+            offset += dtype.itemsize * element['count']
+        else:
+            raise ValueError("PLY文件中没有顶点元素")
+
+        count = element['count']
+        if fmt == 'ascii':
+            f.seek(data_offset)
+            skip_lines = sum(e['count'] for e in elements[:elements.index(element)])
+            for _ in range(skip_lines):
+                f.readline()
+            rows = np.loadtxt(f, dtype=np.float64, max_rows=count, ndmin=2)
+            vertices = np.empty(count, dtype=dtype.newbyteorder('='))
+            for k, name in enumerate(dtype.names):
+                vertices[name] = rows[:, k]
+            return vertices
+
+    if mmap:
+        return np.memmap(file_path, dtype=dtype, mode='r', offset=offset, shape=(count,))
+    return np.fromfile(file_path, dtype=dtype, count=count, offset=offset)
+
+
+def vertices_xyz(vertices):
+    """从顶点结构化数组中取出 (N, 3) float32 坐标"""
+    points = np.empty((len(vertices), 3), dtype=np.float32)
+    points[:, 0] = vertices['x']
+    points[:, 1] = vertices['y']
+    points[:, 2] = vertices['z']
+    return points
+
+
+def vertices_intensity(vertices):
+    """
+    取出顶点强度；旧文件没有intensity属性时，从灰度颜色还原（颜色为 0~1 的浮点或 0~255 的整数）
+    """
+    names = vertices.dtype.names
+    if 'intensity' in names:
+        return np.asarray(vertices['intensity'], dtype=np.float32)
+    if 'red' in names:
+        red = np.asarray(vertices['red'], dtype=np.float32)
+        return red if vertices.dtype['red'].kind in 'iu' else red * 255.0
+    return None
+
+
+def vertices_colors(vertices):
+    """取出 (N, 3) uint8 RGB颜色，没有 red/green/blue 属性时返回None"""
+    names = vertices.dtype.names
+    if not all(name in names for name, _ in COLOR_FIELDS):
+        return None
+    colors = np.empty((len(vertices), 3), dtype=np.uint8)
+    for k, (name, _) in enumerate(COLOR_FIELDS):
+        values = vertices[name]
+        colors[:, k] = values if vertices.dtype[name].kind in 'iu' else np.clip(values * 255.0, 0, 255)
+    return colors
+
+
+def load_point_cloud(file_path):
+    """
+    读取PLY文件并转换为Open3D点云
+
+    带intensity属性的文件在查看时按强度生成灰度颜色（同时带RGB颜色时使用RGB颜色），其余文件直接交给Open3D读取
+    """
+    import open3d as o3d
+    from utils.pointcloud2 import intensity_to_gray
+
+    try:
+        vertices = read_ply_vertices(file_path)
+    except (ValueError, KeyError):
+        return o3d.io.read_point_cloud(file_path)
+    if 'intensity' not in vertices.dtype.names:
+        return o3d.io.read_point_cloud(file_path)
+
+    pcd = o3d.geometry.PointCloud()
+    pcd.points = o3d.utility.Vector3dVector(vertices_xyz(vertices).astype(np.float64))
+    colors = vertices_colors(vertices)
+    if colors is not None:
+        pcd.colors = o3d.utility.Vector3dVector(colors.astype(np.float64) / 255.0)
+    else:
+        pcd.colors = o3d.utility.Vector3dVector(intensity_to_gray(vertices['intensity']))
+    return pcd
@@ -0,0 +1,127 @@
+import numpy as np
+
+# sensor_msgs/PointField 中 datatype 编号到 NumPy 类型的对应关系
+POINT_FIELD_DATATYPES = {
+    1: 'i1',  # INT8
+    2: 'u1',  # UINT8
+    3: 'i2',  # INT16
+    4: 'u2',  # UINT16
+    5: 'i4',  # INT32
+    6: 'u4',  # UINT32
+    7: 'f4',  # FLOAT32
+    8: 'f8',  # FLOAT64
+}
+
+# 消息中没有 fields 时使用的默认布局：x/y/z/intensity 依次位于偏移 0/4/8/12
+DEFAULT_FIELDS = [
+    {'name': 'x', 'offset': 0, 'datatype': 7, 'count': 1},
+    {'name': 'y', 'offset': 4, 'datatype': 7, 'count': 1},
+    {'name': 'z', 'offset': 8, 'datatype': 7, 'count': 1},
+    {'name': 'intensity', 'offset': 12, 'datatype': 7, 'count': 1},
+]
+
+
+def pointcloud2_dtype(fields, point_step, is_bigendian=False):
+    """
+    根据 PointCloud2 的 fields 描述构造 NumPy 结构化类型
+
+    参数:
+        fields: 字段列表，每项包含 name/offset/datatype/count
+        point_step: 每个点占用的字节数（包含填充）
+        is_bigendian: 数据是否为大端字节序
+
+    返回:
+        itemsize 等于 point_step 的结构化 dtype，填充字节会被自动跳过
+    """
+    byte_order = '>' if is_bigendian else '<'
+    names, formats, offsets = [], [], []
+    for field in fields:
+        datatype = field['datatype']
+        if datatype not in POINT_FIELD_DATATYPES:
+            raise ValueError(f"不支持的点字段类型: {field['name']} (datatype={datatype})")
+        base = np.dtype(byte_order + POINT_FIELD_DATATYPES[datatype])
+        count = field.get('count', 1) or 1
+        names.append(field['name'])
+        formats.append(base if count == 1 else (base, (count,)))
+        offsets.append(field['offset'])
+    return np.dtype({'names': names, 'formats': formats,
+                     'offsets': offsets, 'itemsize': point_step})
+
+
+def _as_buffer(data):
+    """把消息中的 data 字段转换为可以零拷贝访问的缓冲区"""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return data
+    # 旧的 txt 中 data 可能是整数列表
+    return bytes(data)
+
+
+def decode_point_cloud2(data_dict):
+    """
+    一次性把 PointCloud2 风格的字典解码为结构化数组
+
+    参数:
+        data_dict: 包含 fields/point_step/row_step/width/height/data/is_bigendian 的字典
+
+    返回:
+        形状为 (height * width,) 的结构化数组，字段名与消息中的 fields 一致
+    """
+    point_step = data_dict['point_step']
+    width = data_dict['width']
+    height = data_dict['height']
+    row_step = data_dict.get('row_step') or width * point_step
+    fields = data_dict.get('fields') or DEFAULT_FIELDS
+    dtype = pointcloud2_dtype(fields, point_step, data_dict.get('is_bigendian', False))
+
+    buffer = _as_buffer(data_dict['data'])
+    if width * height == 0:
+        return np.zeros(0, dtype=dtype)
+
+    # 用步长直接在原始缓冲区上建立视图，行尾的填充字节通过 row_step 跳过
+    cloud = np.ndarray(shape=(height, width), dtype=dtype, buffer=buffer,
+                       strides=(row_step, point_step))
+    return cloud.reshape(-1)
+
+
+def cloud_xyz(cloud):
+    """从结构化数组中取出连续的 (N, 3) float32 坐标"""
+    points = np.empty((len(cloud), 3), dtype=np.float32)
+    points[:, 0] = cloud['x']
+    points[:, 1] = cloud['y']
+    points[:, 2] = cloud['z']
+    return points
+
+
+def cloud_intensity(cloud):
+    """取出强度字段，没有强度时返回全零"""
+    if 'intensity' in cloud.dtype.names:
+        return np.asarray(cloud['intensity'], dtype=np.float32)
+    return np.zeros(len(cloud), dtype=np.float32)
+
+
+def intensity_to_gray(intensity):
+    """把强度归一化为灰度颜色，与逐点循环 min(intensity / 255.0, 1.0) 的结果一致"""
+    gray = np.minimum(np.asarray(intensity, dtype=np.float64) / 255.0, 1.0).astype(np.float32)
+    return np.repeat(gray[:, None], 3, axis=1)
+
+
+def frame_timestamp(data_dict):
+    """
+    读取一帧消息的时间戳（秒）
+
+    优先使用录制时写入的 my_time_stamp，其次使用 header.stamp，都没有时返回 None
+    """
+    stamp = data_dict.get('my_time_stamp')
+    if stamp is not None:
+        return float(stamp)
+    header = data_dict.get('header')
+    if isinstance(header, dict):
+        stamp = header.get('stamp')
+        if isinstance(stamp, dict):
+            sec = stamp.get('sec', stamp.get('secs'))
+            nanosec = stamp.get('nanosec', stamp.get('nsecs', 0))
+            if sec is not None:
+                return sec + nanosec * 1e-9
+        elif stamp is not None:
+            return float(stamp)
+    return None
@@ -0,0 +1,225 @@
+import json
+
+import numpy as np
+
+# 相机前方的最小深度（米），更近的点不投影
+DEFAULT_MIN_DEPTH = 0.1
+
+# 遮挡判断时每个点在深度缓冲中覆盖的半径（像素）；雷达点稀疏，半径为0时远处的点会从近处物体的点之间漏出来
+DEFAULT_OCCLUSION_RADIUS = 2
+
+# 相对深度容差：深度不超过该像素邻域最小深度的 (1 + tolerance) 倍时认为可见
+DEFAULT_DEPTH_TOLERANCE = 0.05
+
+# 检查径向畸变单调性时采样的最大归一化半径（约对应72度半视场角）
+_MAX_NORMALIZED_RADIUS = 3.0
+
+
+def _max_valid_radius(dist):
+    """
+    径向畸变多项式开始不单调的归一化半径
+
+    超出该半径的点经畸变模型后会折返到图像内部，必须在投影前剔除；多项式在采样范围内单调时返回inf
+    """
+    k = np.zeros(8)
+    k[:len(dist)] = dist[:8]
+    r = np.linspace(0, _MAX_NORMALIZED_RADIUS, 3001)
+    r2 = r * r
+    radial = (1 + r2 * (k[0] + r2 * (k[1] + r2 * k[4]))) / (1 + r2 * (k[5] + r2 * (k[6] + r2 * k[7])))
+    folds = np.nonzero(np.diff(r * radial) <= 0)[0]
+    return float(r[folds[0]]) if len(folds) else np.inf
+
+
+def load_calibration(path):
+    """
+    读取相机标定JSON
+
+    文件格式（内参可以写成K矩阵或fx/fy/cx/cy，外参可以写成4x4矩阵或旋转加平移）:
+        {
+            "width": 1280, "height": 720,
+            "K": [[fx, 0, cx], [0, fy, cy], [0, 0, 1]],
+            "distortion": [k1, k2, p1, p2, k3],
+            "lidar_to_camera": [[r11, r12, r13, tx], ..., [0, 0, 0, 1]]
+        }
+    畸变系数按OpenCV的顺序 (k1, k2, p1, p2[, k3[, k4, k5, k6]])；外参把雷达坐标变换到相机坐标
+    （相机坐标系 x向右、y向下、z向前）
+
+    返回:
+        字典，包含 K (3, 3)、dist (8,)、T (4, 4)、width、height、max_r2
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    if 'K' in data:
+        K = np.asarray(data['K'], dtype=np.float64).reshape(3, 3)
+    else:
+        K = np.array([[data['fx'], 0, data['cx']], [0, data['fy'], data['cy']], [0, 0, 1]], dtype=np.float64)
+
+    dist = np.zeros(8)
+    coeffs = np.asarray(data.get('distortion', []), dtype=np.float64).ravel()
+    if len(coeffs) not in (0, 4, 5, 8):
+        raise ValueError(f"畸变系数应为4、5或8个，实际为 {len(coeffs)} 个")
+    dist[:len(coeffs)] = coeffs
+
+    if 'lidar_to_camera' in data:
+        T = np.asarray(data['lidar_to_camera'], dtype=np.float64).reshape(4, 4)
+    else:
+        T = np.eye(4)
+        T[:3, :3] = np.asarray(data['rotation'], dtype=np.float64).reshape(3, 3)
+        T[:3, 3] = np.asarray(data['translation'], dtype=np.float64).ravel()
+
+    max_r = _max_valid_radius(dist)
+    return {
+        'K': K,
+        'dist': dist,
+        'T': T,
+        'width': int(data['width']),
+        'height': int(data['height']),
+        'max_r2': max_r * max_r,
+    }
+
+
+def transform_points(points, T):
+    """用4x4变换矩阵变换 (N, 3) 点，返回float32"""
+    points = np.asarray(points, dtype=np.float32).reshape(-1, 3)
+    return points @ T[:3, :3].T.astype(np.float32) + T[:3, 3].astype(np.float32)
+
+
+def distort_normalized(x, y, dist):
+    """对归一化坐标应用OpenCV畸变模型（径向k1~k6、切向p1/p2）"""
+    k1, k2, p1, p2, k3, k4, k5, k6 = (float(value) for value in dist)
+    r2 = x * x + y * y
+    radial = (1 + r2 * (k1 + r2 * (k2 + r2 * k3))) / (1 + r2 * (k4 + r2 * (k5 + r2 * k6)))
+    xy = x * y
+    xd = x * radial + 2 * p1 * xy + p2 * (r2 + 2 * x * x)
+    yd = y * radial + p1 * (r2 + 2 * y * y) + 2 * p2 * xy
+    return xd, yd
+
+
+def project_points(points, calib, min_depth=DEFAULT_MIN_DEPTH):
+    """
+    一次向量化地把雷达坐标系下的点投影到图像
+
+    返回:
+        (u, v, depth, valid)，u/v为像素坐标（整数为像素中心），depth为相机坐标系z，
+        valid表示点在相机前方、畸变模型有效且落在图像内
+    """
+    cam = transform_points(points, calib['T'])
+    depth = cam[:, 2]
+    valid = depth > min_depth
+    safe_depth = np.where(valid, depth, 1.0)
+    x = cam[:, 0] / safe_depth
+    y = cam[:, 1] / safe_depth
+    valid &= (x * x + y * y) <= calib['max_r2']
+
+    if np.any(calib['dist']):
+        x, y = distort_normalized(x, y, calib['dist'])
+    # 用Python标量做系数，保持float32计算
+    fx, skew, cx = (float(value) for value in calib['K'][0])
+    fy, cy = float(calib['K'][1, 1]), float(calib['K'][1, 2])
+    u = fx * x + cx if skew == 0 else fx * x + skew * y + cx
+    v = fy * y + cy
+    valid &= (u >= -0.5) & (u < calib['width'] - 0.5) & (v >= -0.5) & (v < calib['height'] - 0.5)
+    return u, v, depth, valid
+
+
+def _min_filter(image, radius):
+    """方形邻域最小值滤波（按行、按列各做一次一维滤波）"""
+    for axis in (0, 1):
+        source = image.copy()
+        for shift in range(1, radius + 1):
+            lead = [slice(None)] * 2
+            lag = [slice(None)] * 2
+            lead[axis] = slice(shift, None)
+            lag[axis] = slice(None, -shift)
+            np.minimum(image[tuple(lead)], source[tuple(lag)], out=image[tuple(lead)])
+            np.minimum(image[tuple(lag)], source[tuple(lead)], out=image[tuple(lag)])
+    return image
+
+
+def depth_buffer(u, v, depth, width, height, radius=0):
+    """
+    生成深度缓冲：每个像素为投影到该像素（radius>0时为其邻域）的点中最小的深度，没有点时为inf
+
+    u/v/depth只应包含图像内的点
+    """
+    pixel = np.floor(v + 0.5).astype(np.int64) * width + np.floor(u + 0.5).astype(np.int64)
+    zbuf = np.full(width * height, np.inf, dtype=np.float32)
+    np.minimum.at(zbuf, pixel, depth.astype(np.float32))
+    zbuf = zbuf.reshape(height, width)
+    if radius > 0:
+        _min_filter(zbuf, radius)
+    return zbuf
+
+
+def nearest_index_buffer(u, v, depth, width, height, radius=0):
+    """
+    每个像素（radius>0时为其邻域）中距离最近的点的序号，没有点时为-1
+
+    深度（正的float32）的位模式按整数比较时与数值顺序一致，把它放在高32位、点序号放在低32位，
+    取最小值即同时得到最近的深度和对应的点，邻域扩展也只需一次最小值滤波
+    """
+    pixel = np.floor(v + 0.5).astype(np.int64) * width + np.floor(u + 0.5).astype(np.int64)
+    keys = (np.asarray(depth, dtype=np.float32).view(np.int32).astype(np.int64) << 32) | np.arange(len(pixel))
+    empty = np.iinfo(np.int64).max
+    kbuf = np.full(width * height, empty, dtype=np.int64)
+    np.minimum.at(kbuf, pixel, keys)
+    kbuf = kbuf.reshape(height, width)
+    if radius > 0:
+        _min_filter(kbuf, radius)
+    return np.where(kbuf == empty, -1, kbuf & 0xFFFFFFFF)
+
+
+def visible_mask(u, v, depth, valid, width, height, radius=DEFAULT_OCCLUSION_RADIUS,
+                 tolerance=DEFAULT_DEPTH_TOLERANCE):
+    """
+    基于深度缓冲的遮挡判断，返回在图像中可见的点的掩码
+    """
+    idx = np.nonzero(valid)[0]
+    visible = np.zeros(len(valid), dtype=bool)
+    if len(idx) == 0:
+        return visible
+    zbuf = depth_buffer(u[idx], v[idx], depth[idx], width, height, radius)
+    ui = np.floor(u[idx] + 0.5).astype(np.int64)
+    vi = np.floor(v[idx] + 0.5).astype(np.int64)
+    visible[idx] = depth[idx] <= zbuf[vi, ui] * (1 + tolerance)
+    return visible
+
+
+def sample_colors(image, u, v):
+    """双线性插值取出 (u, v) 处的像素颜色，image为 (H, W, 3) uint8，返回 (M, 3) uint8"""
+    height, width = image.shape[:2]
+    u = np.clip(u, 0, width - 1)
+    v = np.clip(v, 0, height - 1)
+    x0 = np.minimum(np.floor(u).astype(np.int64), width - 2) if width > 1 else np.zeros(len(u), dtype=np.int64)
+    y0 = np.minimum(np.floor(v).astype(np.int64), height - 2) if height > 1 else np.zeros(len(v), dtype=np.int64)
+    x1 = np.minimum(x0 + 1, width - 1)
+    y1 = np.minimum(y0 + 1, height - 1)
+    fx = (u - x0).astype(np.float32)[:, None]
+    fy = (v - y0).astype(np.float32)[:, None]
+    top = image[y0, x0] * (1 - fx) + image[y0, x1] * fx
+    bottom = image[y1, x0] * (1 - fx) + image[y1, x1] * fx
+    return np.clip(top * (1 - fy) + bottom * fy + 0.5, 0, 255).astype(np.uint8)
+
+
+def colorize_points(points, image, calib, occlusion_radius=DEFAULT_OCCLUSION_RADIUS,
+                    depth_tolerance=DEFAULT_DEPTH_TOLERANCE, min_depth=DEFAULT_MIN_DEPTH):
+    """
+    把雷达点投影到RGB图像上取色
+
+    参数:
+        points: (N, 3) 雷达坐标系下的点
+        image: (H, W, 3) uint8 RGB图像，尺寸应与标定一致
+        calib: load_calibration的返回值
+
+    返回:
+        (colors, mask)，colors为 (N, 3) uint8（不可见的点为0），mask表示点可见并已取色
+    """
+    height, width = image.shape[:2]
+    if (width, height) != (calib['width'], calib['height']):
+        raise ValueError(f"图像尺寸 {width}x{height} 与标定尺寸 {calib['width']}x{calib['height']} 不一致")
+    u, v, depth, valid = project_points(points, calib, min_depth)
+    mask = visible_mask(u, v, depth, valid, width, height, occlusion_radius, depth_tolerance)
+    colors = np.zeros((len(mask), 3), dtype=np.uint8)
+    colors[mask] = sample_colors(image, u[mask], v[mask])
+    return colors, mask
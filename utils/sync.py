@@ -0,0 +1,120 @@
+import numpy as np
+
+# 默认匹配容差（秒），相机约15fps、雷达约10fps时半个雷达周期
+DEFAULT_TOLERANCE = 0.05
+
+
+def stream_report(stamps):
+    """
+    检查单个传感器的时间戳序列，找出丢帧和重复帧
+
+    返回:
+        字典，包含:
+            median_dt: 相邻帧时间间隔的中位数
+            gaps: 间隔超过1.5倍中位数的位置（该帧之前有丢帧）
+            estimated_dropped: 按间隔估计的丢帧总数
+            duplicates: 时间戳与前一帧相同的帧序号
+            non_monotonic: 时间戳比前一帧小的帧序号
+    """
+    stamps = np.asarray(stamps, dtype=np.float64)
+    valid = stamps[~np.isnan(stamps)]
+    if len(valid) < 2:
+        return {'median_dt': float('nan'), 'gaps': np.zeros(0, dtype=np.int64), 'estimated_dropped': 0,
+                'duplicates': np.zeros(0, dtype=np.int64), 'non_monotonic': np.zeros(0, dtype=np.int64)}
+
+    dt = np.diff(stamps)
+    median_dt = float(np.nanmedian(dt[dt > 0])) if np.any(dt > 0) else float('nan')
+    gaps = np.nonzero(dt > 1.5 * median_dt)[0] + 1
+    estimated_dropped = int(np.sum(np.round(dt[gaps - 1] / median_dt) - 1)) if len(gaps) else 0
+    return {
+        'median_dt': median_dt,
+        'gaps': gaps,
+        'estimated_dropped': estimated_dropped,
+        'duplicates': np.nonzero(dt == 0)[0] + 1,
+        'non_monotonic': np.nonzero(dt < 0)[0] + 1,
+    }
+
+
+def match_timestamps(camera_stamps, lidar_stamps, tolerance=DEFAULT_TOLERANCE, offset=0.0):
+    """
+    按时间戳为每个相机帧寻找最近的雷达帧（向量化的searchsorted最近邻搜索）
+
+    参数:
+        camera_stamps: 相机帧时间戳（my_time_stamp），按帧序号排列
+        lidar_stamps: 雷达帧时间戳，按帧序号排列，可以不单调
+        tolerance: 最大允许时间差（秒），超过则认为该相机帧没有对应雷达帧
+        offset: 雷达时钟相对相机时钟的偏移（秒），匹配前从雷达时间戳中减去
+
+    返回:
+        字典，包含:
+            pairs: (M, 2) 的 (rgb索引, ply索引) 数组
+            time_diff: 每对的时间差（雷达 - 相机，已扣除offset）
+            unmatched_camera: 没有在容差内找到雷达帧的相机帧序号
+            duplicated_lidar: 被多个相机帧共用的雷达帧序号
+            unused_lidar: 没有被任何相机帧使用的雷达帧序号
+            camera: 相机时间戳序列的检查结果（见stream_report）
+            lidar: 雷达时间戳序列的检查结果
+    """
+    camera_stamps = np.asarray(camera_stamps, dtype=np.float64)
+    lidar_stamps = np.asarray(lidar_stamps, dtype=np.float64) - offset
+
+    # 只在有效时间戳上搜索，并按时间排序
+    lidar_valid = np.nonzero(~np.isnan(lidar_stamps))[0]
+    order = lidar_valid[np.argsort(lidar_stamps[lidar_valid], kind='stable')]
+    sorted_lidar = lidar_stamps[order]
+
+    camera_valid = np.nonzero(~np.isnan(camera_stamps))[0]
+    query = camera_stamps[camera_valid]
+
+    if len(sorted_lidar) == 0 or len(query) == 0:
+        pairs = np.zeros((0, 2), dtype=np.int64)
+        time_diff = np.zeros(0)
+        unmatched = np.arange(len(camera_stamps))
+    else:
+        # 左右两个候选中取时间差更小的一个
+        right = np.clip(np.searchsorted(sorted_lidar, query), 0, len(sorted_lidar) - 1)
+        left = np.clip(right - 1, 0, len(sorted_lidar) - 1)
+        choose_left = np.abs(query - sorted_lidar[left]) <= np.abs(sorted_lidar[right] - query)
+        nearest = np.where(choose_left, left, right)
+        diff = sorted_lidar[nearest] - query
+
+        ok = np.abs(diff) <= tolerance
+        pairs = np.stack([camera_valid[ok], order[nearest[ok]]], axis=1).astype(np.int64)
+        time_diff = diff[ok]
+        matched_mask = np.zeros(len(camera_stamps), dtype=bool)
+        matched_mask[camera_valid[ok]] = True
+        unmatched = np.nonzero(~matched_mask)[0]
+
+    lidar_use = np.bincount(pairs[:, 1], minlength=len(lidar_stamps)) if len(pairs) else np.zeros(len(lidar_stamps), dtype=np.int64)
+    return {
+        'pairs': pairs,
+        'time_diff': time_diff,
+        'unmatched_camera': unmatched,
+        'duplicated_lidar': np.nonzero(lidar_use > 1)[0],
+        'unused_lidar': np.nonzero(lidar_use == 0)[0],
+        'camera': stream_report(camera_stamps),
+        'lidar': stream_report(lidar_stamps),
+    }
+
+
+def print_sync_report(result):
+    """在控制台输出同步结果摘要"""
+    pairs = result['pairs']
+    print(f"同步完成: {len(pairs)} 对匹配")
+    if len(result['time_diff']):
+        abs_diff = np.abs(result['time_diff'])
+        print(f"  时间差: 平均 {abs_diff.mean() * 1000:.1f}ms, 最大 {abs_diff.max() * 1000:.1f}ms")
+    print(f"  无对应雷达帧的相机帧: {len(result['unmatched_camera'])}")
+    print(f"  被多个相机帧共用的雷达帧: {len(result['duplicated_lidar'])}")
+    print(f"  未被使用的雷达帧: {len(result['unused_lidar'])}")
+    for name, label in (('camera', '相机'), ('lidar', '雷达')):
+        report = result[name]
+        print(f"  {label}: 帧间隔中位数 {report['median_dt'] * 1000:.1f}ms, "
+              f"估计丢帧 {report['estimated_dropped']} (间断 {len(report['gaps'])} 处), "
+              f"重复时间戳 {len(report['duplicates'])}, 时间倒退 {len(report['non_monotonic'])}")
+
+
+def load_msg_stamps(msg_file):
+    """从录制文件的帧索引中读取每帧时间戳（索引不存在时单遍扫描建立）"""
+    from utils.msg_index import load_index
+    return load_index(msg_file)['stamps']
@@ -0,0 +1,204 @@
+from collections import deque
+
+import numpy as np
+
+# 默认初始容量（点数），不够时按2倍扩容
+DEFAULT_CAPACITY = 1 << 20
+
+
+class WindowAccumulator:
+    """
+    基于预分配环形缓冲区的滑动窗口点云累加器
+
+    窗口内的帧序号必须连续，可以在两端以 O(帧大小) 的代价压入或弹出一帧，
+    不需要像 merged_pcd += pcd 那样每次重新分配和复制整个合并点云
+
+    用法:
+        acc = WindowAccumulator(with_colors=True)
+        acc.slide_to(center, loader, num_frames, range_before=15, range_after=15)
+        points, colors = acc.arrays()
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, with_colors=True):
+        self.with_colors = with_colors
+        self._points = np.empty((capacity, 3), dtype=np.float32)
+        self._colors = np.empty((capacity, 3), dtype=np.float32) if with_colors else None
+        self._head = 0  # 第一帧第一个点在缓冲区中的位置
+        self._size = 0  # 窗口内的总点数
+        self._frames = deque()  # 依次保存 (帧序号, 点数, 是否带颜色)
+
+    @property
+    def capacity(self):
+        return len(self._points)
+
+    @property
+    def num_points(self):
+        return self._size
+
+    @property
+    def num_frames(self):
+        return len(self._frames)
+
+    @property
+    def first_frame(self):
+        return self._frames[0][0] if self._frames else None
+
+    @property
+    def last_frame(self):
+        return self._frames[-1][0] if self._frames else None
+
+    @property
+    def has_colors(self):
+        """窗口内的帧是否都带有颜色（没有颜色的帧在缓冲区中以黑色填充）"""
+        return self.with_colors and all(colored for _, _, colored in self._frames)
+
+    def frame_ids(self):
+        return [frame_id for frame_id, _, _ in self._frames]
+
+    def clear(self):
+        self._head = 0
+        self._size = 0
+        self._frames.clear()
+
+    def _reserve(self, extra):
+        """容量不足时扩容，同时把环形数据整理为从0开始的连续数据"""
+        needed = self._size + extra
+        if needed <= self.capacity:
+            return
+        new_capacity = self.capacity
+        while new_capacity < needed:
+            new_capacity *= 2
+        points, colors = self.arrays()
+        self._points = np.empty((new_capacity, 3), dtype=np.float32)
+        self._points[:self._size] = points
+        if self.with_colors:
+            self._colors = np.empty((new_capacity, 3), dtype=np.float32)
+            self._colors[:self._size] = colors
+        self._head = 0
+
+    def _write(self, start, points, colors):
+        """从环形位置start开始写入，必要时分成两段"""
+        n = len(points)
+        first = min(n, self.capacity - start)
+        self._points[start:start + first] = points[:first]
+        self._points[:n - first] = points[first:]
+        if self.with_colors:
+            if colors is None:
+                colors = np.zeros((n, 3), dtype=np.float32)
+            self._colors[start:start + first] = colors[:first]
+            self._colors[:n - first] = colors[first:]
+
+    def push_back(self, frame_id, points, colors=None):
+        """在窗口末尾追加一帧，帧序号应为 last_frame + 1"""
+        n = len(points)
+        self._reserve(n)
+        self._write((self._head + self._size) % self.capacity, points, colors)
+        self._size += n
+        self._frames.append((frame_id, n, colors is not None))
+
+    def push_front(self, frame_id, points, colors=None):
+        """在窗口开头插入一帧，帧序号应为 first_frame - 1"""
+        n = len(points)
+        self._reserve(n)
+        self._head = (self._head - n) % self.capacity
+        self._write(self._head, points, colors)
+        self._size += n
+        self._frames.appendleft((frame_id, n, colors is not None))
+
+    def pop_front(self):
+        """移除窗口开头的一帧，返回其帧序号"""
+        frame_id, n, _ = self._frames.popleft()
+        self._head = (self._head + n) % self.capacity
+        self._size -= n
+        return frame_id
+
+    def pop_back(self):
+        """移除窗口末尾的一帧，返回其帧序号"""
+        frame_id, n, _ = self._frames.pop()
+        self._size -= n
+        return frame_id
+
+    def arrays(self):
+        """
+        返回窗口内所有点的 (points, colors)
+
+        数据在缓冲区中连续时直接返回视图（调用方不要长期持有），跨越缓冲区末尾时拼接一次
+        """
+        end = self._head + self._size
+        if end <= self.capacity:
+            points = self._points[self._head:end]
+            colors = self._colors[self._head:end] if self.with_colors else None
+            return points, colors
+        wrap = end - self.capacity
+        points = np.concatenate([self._points[self._head:], self._points[:wrap]])
+        colors = None
+        if self.with_colors:
+            colors = np.concatenate([self._colors[self._head:], self._colors[:wrap]])
+        return points, colors
+
+    def slide_to_range(self, start, stop, loader):
+        """
+        把窗口调整为帧 [start, stop)，只加载新进入窗口的帧
+
+        参数:
+            loader: loader(frame_id) 返回 (points, colors)，colors可以为None
+        """
+        if stop <= start:
+            self.clear()
+            return
+        # 与当前窗口没有重叠时直接清空重建
+        if not self._frames or stop <= self.first_frame or start > self.last_frame:
+            self.clear()
+            for frame_id in range(start, stop):
+                self.push_back(frame_id, *loader(frame_id))
+            return
+
+        while self._frames and self.first_frame < start:
+            self.pop_front()
+        while self._frames and self.last_frame >= stop:
+            self.pop_back()
+        for frame_id in range(self.first_frame - 1, start - 1, -1):
+            self.push_front(frame_id, *loader(frame_id))
+        for frame_id in range(self.last_frame + 1, stop):
+            self.push_back(frame_id, *loader(frame_id))
+
+    def slide_to(self, center, loader, num_frames, range_before=15, range_after=15):
+        """把窗口调整为以center为中心、前后各range_before/range_after帧（截断到 [0, num_frames)）"""
+        start = max(0, center - range_before)
+        stop = min(num_frames, center + range_after + 1)
+        self.slide_to_range(start, stop, loader)
+
+    def slide_to_budget(self, center, loader, num_frames, point_budget, frame_size=None, max_radius=None):
+        """
+        点数预算模式：从center向两侧交替扩展窗口，直到再加一帧就会超过point_budget
+
+        参数:
+            frame_size: frame_size(frame_id) 返回帧点数，None时通过loader加载得到（配合帧缓存使用）
+            max_radius: 单侧最多扩展的帧数，None表示不限制
+        """
+        if frame_size is None:
+            frame_size = lambda frame_id: len(loader(frame_id)[0])
+
+        start, stop = center, center + 1
+        total = frame_size(center)
+        left_open = right_open = True
+        radius = 0
+        while (left_open or right_open) and (max_radius is None or radius < max_radius):
+            radius += 1
+            # 某一侧一旦超出预算或到达边界就不再扩展，保证窗口连续
+            if right_open:
+                frame_id = center + radius
+                if frame_id < num_frames and total + frame_size(frame_id) <= point_budget:
+                    total += frame_size(frame_id)
+                    stop = frame_id + 1
+                else:
+                    right_open = False
+            if left_open:
+                frame_id = center - radius
+                if frame_id >= 0 and total + frame_size(frame_id) <= point_budget:
+                    total += frame_size(frame_id)
+                    start = frame_id
+                else:
+                    left_open = False
+        self.slide_to_range(start, stop, loader)
+        return start, stop
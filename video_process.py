@@ -2,34 +2,124 @@ import os
 import cv2
 import time
 import numpy as np
-import re
 import argparse
+import shutil
+import tempfile
+import subprocess
+import threading
+import queue
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
-def extract_number(filename):
+from utils.file_order import extract_number
+
+# 支持的图片扩展名
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp']
+
+def list_image_files(folder_path):
+    """返回文件夹中按文件名数字排序的图片文件名列表"""
+    files = [f for f in os.listdir(folder_path) if os.path.splitext(f.lower())[1] in IMAGE_EXTENSIONS]
+    files.sort(key=extract_number)
+    return files
+
+def iter_decoded_images(paths, workers=None, lookahead=None):
     """
-    从文件名中提取数字部分
-    例如: "image_001.jpg" 将返回 1
+    用线程池并行解码图片，按输入顺序逐张产生 (序号, 图像)，无法读取的图片为None
+    
+    已提交的解码任务按顺序排在队列中，队首完成后才产生结果（重排缓冲区），
+    同时在途的任务最多lookahead个，内存占用有上限（cv2.imread解码时会释放GIL）
+    
+    参数:
+        paths: 图片路径列表
+        workers: 解码线程数，None表示CPU核数
+        lookahead: 最多提前解码的图片数，None表示线程数的4倍
     """
-    numbers = re.findall(r'\d+', filename)
-    if numbers:
-        return int(numbers[0])
-    return 0
+    workers = workers or os.cpu_count() or 1
+    lookahead = lookahead or workers * 4
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        next_submit = 0
+        for i in range(len(paths)):
+            while next_submit < len(paths) and len(pending) < lookahead:
+                pending.append(executor.submit(cv2.imread, paths[next_submit]))
+                next_submit += 1
+            yield i, pending.popleft().result()
 
-def save_images_as_video(folder_path, output_file, fps=10):
+def write_frames(video_writer, paths, size, workers=None, progress=True):
+    """
+    把图片按顺序解码、统一尺寸后写入video_writer，返回写入的帧数
+    
+    解码在线程池中并行进行，编码仍由调用线程中唯一的VideoWriter顺序完成
+    """
+    width, height = size
+    written = 0
+    for i, img in iter_decoded_images(paths, workers):
+        if img is None:
+            print(f"无法读取图片: {paths[i]}")
+            continue
+        
+        # 确保所有图片尺寸一致
+        if img.shape[0] != height or img.shape[1] != width:
+            img = cv2.resize(img, (width, height))
+        
+        # 写入视频帧
+        video_writer.write(img)
+        written += 1
+        
+        # 显示进度
+        if progress and ((i+1) % 10 == 0 or i == len(paths)-1):
+            print(f"处理进度: {i+1}/{len(paths)} 图片")
+    return written
+
+def _encode_segment(paths, output_file, fps, size, workers):
+    """在子进程中把一段图片编码为独立的视频文件，返回写入的帧数"""
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    video_writer = cv2.VideoWriter(output_file, fourcc, fps, size)
+    try:
+        return write_frames(video_writer, paths, size, workers, progress=False)
+    finally:
+        video_writer.release()
+
+def concat_videos(segment_files, output_file):
+    """
+    用ffmpeg的concat分离器直接拼接各段视频的码流（-c copy，不重新编码）
+    
+    返回:
+        是否成功
+    """
+    list_file = output_file + ".segments.txt"
+    with open(list_file, 'w', encoding='utf-8') as f:
+        for segment in segment_files:
+            # concat列表中的单引号需要转义
+            f.write("file '" + os.path.abspath(segment).replace("'", "'\\''") + "'\n")
+    try:
+        result = subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0',
+                                 '-i', list_file, '-c', 'copy', output_file],
+                                capture_output=True, text=True)
+    finally:
+        os.remove(list_file)
+    if result.returncode != 0:
+        print(f"ffmpeg拼接失败: {result.stderr.strip()}")
+        return False
+    return True
+
+def save_images_as_video(folder_path, output_file, fps=10, workers=None, segments=1):
     """
     将文件夹中的图片保存为视频文件
     
+    默认使用流水线模式：解码线程池并行读取图片，经重排缓冲区按顺序交给唯一的VideoWriter编码。
+    segments大于1时把图片分成若干段，在多个进程中分别编码后用ffmpeg无损拼接
+    （找不到ffmpeg时退回流水线模式）
+    
     参数:
         folder_path: 包含图片的文件夹路径
         output_file: 输出视频文件的路径
         fps: 视频帧率，默认为10
+        workers: 解码线程数（分段模式下为进程数），None表示CPU核数
+        segments: 分段并行编码的段数，1表示不分段
     """
-    # 获取文件夹中所有图片文件
-    image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp']
-    files = [f for f in os.listdir(folder_path) if os.path.splitext(f.lower())[1] in image_extensions]
-    
-    # 按照文件名中的数字部分排序
-    files.sort(key=extract_number)
+    # 获取文件夹中所有图片文件，按照文件名中的数字部分排序
+    files = list_image_files(folder_path)
     
     if not files:
         print(f"在 {folder_path} 中没有找到图片")
@@ -43,52 +133,146 @@ def save_images_as_video(folder_path, output_file, fps=10):
         return False
     
     height, width, _ = first_img.shape
+    paths = [os.path.join(folder_path, f) for f in files]
+    start_time = time.time()
     
-    # 定义编解码器并创建VideoWriter对象
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # 可以根据需要更改编解码器
-    video_writer = cv2.VideoWriter(output_file, fourcc, fps, (width, height))
-    
-    print(f"开始创建视频文件: {output_file}")
+    if segments > 1 and shutil.which('ffmpeg') is None:
+        print("未找到ffmpeg，无法拼接分段视频，改用流水线模式")
+        segments = 1
     
-    # 遍历所有图片并写入视频
-    for i, file in enumerate(files):
-        img_path = os.path.join(folder_path, file)
-        img = cv2.imread(img_path)
-        
-        if img is None:
-            print(f"无法读取图片: {img_path}")
-            continue
-            
-        # 确保所有图片尺寸一致
-        if img.shape[0] != height or img.shape[1] != width:
-            img = cv2.resize(img, (width, height))
-            
-        # 写入视频帧
-        video_writer.write(img)
+    if segments > 1:
+        print(f"开始分 {segments} 段并行创建视频文件: {output_file}")
+        segment_dir = tempfile.mkdtemp(prefix="video_segments_", dir=os.path.dirname(os.path.abspath(output_file)))
+        bounds = np.linspace(0, len(paths), segments + 1).astype(int)
+        segment_files = [os.path.join(segment_dir, f"segment_{k:03d}.mp4") for k in range(segments)]
+        # 每个进程内再用少量线程解码
+        threads = max(1, (workers or os.cpu_count() or 1) // segments)
+        try:
+            with ProcessPoolExecutor(max_workers=min(segments, workers or os.cpu_count() or 1)) as executor:
+                futures = [executor.submit(_encode_segment, paths[bounds[k]:bounds[k + 1]], segment_files[k],
+                                           fps, (width, height), threads)
+                           for k in range(segments)]
+                written = 0
+                for k, future in enumerate(futures):
+                    written += future.result()
+                    print(f"处理进度: 第 {k+1}/{segments} 段完成")
+            if not concat_videos(segment_files, output_file):
+                return False
+        finally:
+            shutil.rmtree(segment_dir, ignore_errors=True)
+    else:
+        # 定义编解码器并创建VideoWriter对象
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # 可以根据需要更改编解码器
+        video_writer = cv2.VideoWriter(output_file, fourcc, fps, (width, height))
         
-        # 显示进度
-        if (i+1) % 10 == 0 or i == len(files)-1:
-            print(f"处理进度: {i+1}/{len(files)} 图片")
+        print(f"开始创建视频文件: {output_file}")
+        try:
+            written = write_frames(video_writer, paths, (width, height), workers)
+        finally:
+            # 释放资源
+            video_writer.release()
     
-    # 释放资源
-    video_writer.release()
-    print(f"视频已保存到: {output_file}")
+    elapsed = time.time() - start_time
+    print(f"视频已保存到: {output_file}（{written} 帧, 耗时 {elapsed:.1f} 秒, {written / max(elapsed, 1e-9):.1f} 帧/秒）")
     return True
 
-def play_images_as_video(folder_path, fps=10):
+class DecodeAheadBuffer:
+    """
+    后台线程预先解码播放位置之后（倒放时为之前）的若干帧
+    
+    只保留播放位置附近 capacity 帧，跳转时丢弃窗口外的帧，不需要重新读取目录
+    
+    用法:
+        buffer = DecodeAheadBuffer(paths, capacity=32)
+        buffer.seek(i)
+        img = buffer.get(i)
+        buffer.close()
+    """
+    
+    # 播放方向反面保留的帧数，便于单步后退
+    KEEP_BEHIND = 4
+    
+    def __init__(self, paths, capacity=32):
+        self.paths = paths
+        self.capacity = capacity
+        self._frames = {}
+        self._pos = 0
+        self._direction = 1
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def _in_window(self, idx):
+        offset = (idx - self._pos) * self._direction
+        return -self.KEEP_BEHIND <= offset < self.capacity
+    
+    def seek(self, pos, direction=1):
+        """把预读窗口移动到pos，direction为-1时向前（帧序号减小的方向）预读"""
+        with self._cond:
+            self._pos = pos
+            self._direction = direction
+            for idx in [idx for idx in self._frames if not self._in_window(idx)]:
+                del self._frames[idx]
+            self._cond.notify_all()
+    
+    def get(self, idx):
+        """返回第idx帧，尚未解码时等待后台线程（无法读取的图片返回None）"""
+        with self._cond:
+            if not self._in_window(idx):
+                self.seek(idx, self._direction)
+            while idx not in self._frames:
+                self._cond.wait()
+            return self._frames[idx]
+    
+    def _next_target(self):
+        # 先按播放方向预读，再补齐窗口内播放位置后方缺少的帧（get可能请求其中任意一帧）
+        offsets = list(range(self.capacity)) + [-k for k in range(1, self.KEEP_BEHIND + 1)]
+        for k in offsets:
+            idx = self._pos + k * self._direction
+            if 0 <= idx < len(self.paths) and idx not in self._frames:
+                return idx
+        return None
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                target = self._next_target()
+                while target is None and not self._closed:
+                    self._cond.wait()
+                    target = self._next_target()
+                if self._closed:
+                    return
+            # 在锁外解码，cv2.imread会释放GIL
+            img = cv2.imread(self.paths[target])
+            with self._cond:
+                if self._in_window(target):
+                    self._frames[target] = img
+                    self._cond.notify_all()
+    
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+def play_images_as_video(folder_path, fps=10, buffer_size=32):
     """
     按照文件名中的数字顺序播放文件夹中的图片，速度为指定的fps
     
+    图片由后台线程预先解码；每帧按单调时钟计算应显示的时刻，落后时丢弃来不及显示的帧，
+    保证播放速度与fps一致。结束时输出实际帧率、目标帧率和丢帧数
+    
+    按键:
+        q 退出，空格 暂停/继续，d/a 单步前进/后退（进入暂停），l/j 前进/后退5秒
+    
     参数:
         folder_path: 包含图片的文件夹路径
         fps: 每秒显示的图片数量，默认为10
+        buffer_size: 预先解码的帧数
     """
-    # 获取文件夹中所有图片文件
-    image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp']
-    files = [f for f in os.listdir(folder_path) if os.path.splitext(f.lower())[1] in image_extensions]
-    
-    # 按照文件名中的数字部分排序
-    files.sort(key=extract_number)
+    # 获取文件夹中所有图片文件，按照文件名中的数字部分排序
+    files = list_image_files(folder_path)
     
     if not files:
         print(f"在 {folder_path} 中没有找到图片")
@@ -96,72 +280,299 @@ def play_images_as_video(folder_path, fps=10):
     
     # 计算每帧的显示时间（秒）
     frame_time = 1.0 / fps
+    seek_frames = max(1, int(round(fps * 5)))
     
     # 创建窗口
     window_name = "picture series"
     cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
     
     print(f"开始播放 {len(files)} 张图片，速度为每秒 {fps} 张")
-    print("按 'q' 键退出，按空格键暂停/继续")
+    print("按 'q' 键退出，按空格键暂停/继续，d/a 单步前进/后退，l/j 前进/后退5秒")
+    
+    buffer = DecodeAheadBuffer([os.path.join(folder_path, f) for f in files], buffer_size)
+    
+    def show(idx, achieved_fps):
+        img = buffer.get(idx)
+        if img is None:
+            print(f"无法读取图片: {os.path.join(folder_path, files[idx])}")
+            return
+        
+        # 显示当前图片的文件名、进度和实际帧率（在右上角）
+        text_img = img.copy()
+        text = f"{files[idx]} ({idx+1}/{len(files)}) {achieved_fps:.1f}fps"
+        
+        # 获取文本大小以便正确放置在右上角
+        text_size = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 1, 2)[0]
+        text_x = img.shape[1] - text_size[0] - 10  # 右边缘减去文本宽度和边距
+        text_y = 30  # 顶部边距
+        
+        cv2.putText(text_img, text, 
+                    (text_x, text_y), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+        
+        # 显示图片
+        cv2.imshow(window_name, text_img)
     
     paused = False
-    i = 0
+    i = 0            # 下一帧
+    current = -1     # 当前显示的帧
+    shown = 0
+    dropped = 0
+    played_before = 0.0  # 之前各段的播放时长（不含暂停）
+    # 从clock_start起第k帧应在 clock_start + (k - clock_index) * frame_time 显示
+    clock_start = time.monotonic()
+    clock_index = 0
+    
+    def play_time():
+        return played_before + (0.0 if paused else time.monotonic() - clock_start)
     
-    while i < len(files):
+    def stop_clock():
+        """暂停或跳转前累计当前这一段的播放时长"""
+        nonlocal played_before
         if not paused:
-            # 读取图片
-            img_path = os.path.join(folder_path, files[i])
-            img = cv2.imread(img_path)
+            played_before += time.monotonic() - clock_start
+    
+    def restart_clock(idx):
+        nonlocal clock_start, clock_index
+        clock_start = time.monotonic()
+        clock_index = idx
+    
+    try:
+        while paused or i < len(files):
+            if not paused:
+                # 已经落后于时钟时跳过来不及显示的帧
+                due = clock_index + int((time.monotonic() - clock_start) / frame_time)
+                if due > i:
+                    dropped += min(due, len(files)) - i
+                    i = due
+                    if i >= len(files):
+                        break
+                
+                # 预读窗口跟随播放位置移动
+                buffer.seek(i)
+                elapsed = play_time()
+                show(i, shown / elapsed if elapsed > 0 else fps)
+                shown += 1
+                current = i
+                i += 1
+                
+                next_time = clock_start + (i - clock_index) * frame_time
+                wait_ms = max(1, int((next_time - time.monotonic()) * 1000))
+            else:
+                wait_ms = 50
+            
+            # 等待按键，直到下一帧应显示的时刻
+            key = cv2.waitKey(wait_ms) & 0xFF
             
+            # 按 'q' 退出
+            if key == ord('q'):
+                break
+            # 按空格键暂停/继续
+            elif key == 32:  # 空格键的ASCII码
+                stop_clock()
+                paused = not paused
+                print("暂停" if paused else "继续")
+                if not paused:
+                    # 单步后退会把预读方向改为向前，继续播放时恢复
+                    buffer.seek(i)
+                    restart_clock(i)
+            # 单步前进/后退
+            elif key in (ord('d'), ord('a')):
+                stop_clock()
+                paused = True
+                step = 1 if key == ord('d') else -1
+                current = min(max(current + step, 0), len(files) - 1)
+                buffer.seek(current, step)
+                show(current, 0.0)
+                i = current + 1
+            # 前进/后退5秒
+            elif key in (ord('l'), ord('j')):
+                step = seek_frames if key == ord('l') else -seek_frames
+                current = min(max(current + step, 0), len(files) - 1)
+                buffer.seek(current)
+                if paused:
+                    show(current, 0.0)
+                    i = current + 1
+                else:
+                    stop_clock()
+                    i = current
+                    restart_clock(i)
+    finally:
+        buffer.close()
+        cv2.destroyAllWindows()
+    
+    elapsed = play_time()
+    achieved = shown / elapsed if elapsed > 0 else 0.0
+    print(f"播放结束: 显示 {shown} 帧, 丢弃 {dropped} 帧, 实际帧率 {achieved:.1f} fps (目标 {fps} fps)")
+    
+    return files
+
+def decode_camera_frame(img_data, frame_number, unix_timestamp, overlay=True):
+    """
+    把相机帧的JPEG字节解码为BGR图像，可选绘制与rgb_read.extract_frames相同的帧号和时间文字
+    """
+    if not overlay:
+        return cv2.imdecode(np.frombuffer(img_data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    
+    import io
+    from PIL import Image
+    from rgb_read import draw_frame_overlay, format_timestamp, load_overlay_font
+    image = Image.open(io.BytesIO(img_data)).convert('RGB')
+    draw_frame_overlay(image, frame_number, format_timestamp(unix_timestamp), load_overlay_font())
+    return cv2.cvtColor(np.asarray(image), cv2.COLOR_RGB2BGR)
+
+def estimate_fps(stamps):
+    """按相邻时间戳间隔的中位数估计采集帧率，时间戳不足时返回None"""
+    stamps = np.asarray(stamps, dtype=np.float64)
+    dt = np.diff(stamps[~np.isnan(stamps)])
+    dt = dt[dt > 0]
+    if len(dt) == 0:
+        return None
+    return 1.0 / float(np.median(dt))
+
+def save_msg_as_video(msg_file, output_file, fps=None, overlay=True, workers=None, queue_size=64):
+    """
+    直接把相机录制文件（camera.msg）转换为视频，不再经过frames/*.txt和pictures/*.jpg中间文件
+    
+    读取线程流式解包msgpack并把解码任务交给线程池，解码结果按帧顺序经有界队列交给VideoWriter。
+    按my_time_stamp把每帧放到对应的视频帧位置：两帧之间有丢帧时重复上一帧，
+    同一位置有多帧时只保留第一帧，使视频时长与实际采集时长一致
+    
+    参数:
+        msg_file: camera.msg 文件路径
+        output_file: 输出视频文件的路径
+        fps: 视频帧率，None表示按时间戳估计的采集帧率
+        overlay: 是否绘制帧号和时间
+        workers: 解码线程数，None表示CPU核数
+        queue_size: 解码队列长度，限制内存占用
+    """
+    from rgb_read import iter_camera_frames
+    
+    if fps is None:
+        # 只有需要估计帧率时才建立索引读取时间戳
+        from utils.sync import load_msg_stamps
+        fps = estimate_fps(load_msg_stamps(msg_file))
+        if fps is None:
+            fps = 10
+            print(f"录制文件中没有可用的时间戳，使用默认帧率 {fps}")
+        else:
+            print(f"按时间戳估计的采集帧率: {fps:.2f}")
+    
+    frames = queue.Queue(maxsize=queue_size)
+    executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1)
+    stop = threading.Event()
+    
+    def produce():
+        try:
+            for i, img_data, unix_timestamp in iter_camera_frames(msg_file):
+                if stop.is_set():
+                    break
+                if img_data is None:
+                    continue
+                future = executor.submit(decode_camera_frame, img_data, i, unix_timestamp, overlay)
+                frames.put((i, unix_timestamp, future))
+        finally:
+            frames.put(None)
+    
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    
+    video_writer = None
+    size = None
+    first_stamp = None
+    last_slot = -1
+    last_img = None
+    written = duplicated = skipped = 0
+    start_time = time.time()
+    print(f"开始创建视频文件: {output_file}")
+    try:
+        while True:
+            item = frames.get()
+            if item is None:
+                break
+            i, unix_timestamp, future = item
+            try:
+                img = future.result()
+            except Exception as e:
+                print(f"解码第{i}帧图像时出错: {e}")
+                continue
             if img is None:
-                print(f"无法读取图片: {img_path}")
-                i += 1
+                print(f"无法解码第{i}帧图像")
                 continue
             
-            # 显示当前图片的文件名和进度信息（在右上角）
-            text_img = img.copy()
-            text = f"{files[i]} ({i+1}/{len(files)})"
-            
-            # 获取文本大小以便正确放置在右上角
-            text_size = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 1, 2)[0]
-            text_x = img.shape[1] - text_size[0] - 10  # 右边缘减去文本宽度和边距
-            text_y = 30  # 顶部边距
+            if video_writer is None:
+                size = (img.shape[1], img.shape[0])
+                fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+                video_writer = cv2.VideoWriter(output_file, fourcc, fps, size)
+            elif (img.shape[1], img.shape[0]) != size:
+                img = cv2.resize(img, size)
             
-            cv2.putText(text_img, text, 
-                        (text_x, text_y), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+            # 按时间戳计算该帧在视频中的位置
+            if unix_timestamp is None:
+                slot = last_slot + 1
+            else:
+                if first_stamp is None:
+                    first_stamp = unix_timestamp
+                slot = int(round((unix_timestamp - first_stamp) * fps))
+            if slot <= last_slot:
+                skipped += 1
+                continue
+            if last_img is not None:
+                for _ in range(slot - last_slot - 1):
+                    video_writer.write(last_img)
+                    duplicated += 1
+            video_writer.write(img)
+            written += 1
+            last_slot = slot
+            last_img = img
             
-            # 显示图片
-            cv2.imshow(window_name, text_img)
-            i += 1
-        
-        # 等待按键，等待时间为frame_time*1000毫秒
-        key = cv2.waitKey(int(frame_time * 1000))
-        
-        # 按 'q' 退出
-        if key == ord('q'):
-            break
-        # 按空格键暂停/继续
-        elif key == 32:  # 空格键的ASCII码
-            paused = not paused
-            print("暂停" if paused else "继续")
-    
-    cv2.destroyAllWindows()
-    print("播放结束")
+            if written % 100 == 0:
+                print(f"处理进度: 已写入 {written} 帧")
+    finally:
+        stop.set()
+        # 取走剩余任务，保证读取线程不会阻塞在已满的队列上
+        while producer.is_alive() or not frames.empty():
+            try:
+                frames.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        executor.shutdown(wait=True)
+        if video_writer is not None:
+            video_writer.release()
     
-    return files
+    if video_writer is None:
+        print(f"{msg_file} 中没有可用的图像")
+        return False
+    elapsed = time.time() - start_time
+    print(f"视频已保存到: {output_file}（{written} 帧, 补帧 {duplicated}, 丢弃 {skipped}, "
+          f"帧率 {fps:.2f}, 耗时 {elapsed:.1f} 秒）")
+    return True
 
 if __name__ == "__main__":
     # 创建命令行参数解析器
     parser = argparse.ArgumentParser(description='按顺序播放图片文件夹中的图片或保存为视频')
     parser.add_argument('--folder', type=str, default='', help='图片文件夹路径')
-    parser.add_argument('--fps', type=float, default=24, help='播放/视频的帧率')
+    parser.add_argument('--fps', type=float, default=None, help='播放/视频的帧率，默认24；--msg模式下默认按时间戳估计')
     parser.add_argument('--mode', type=str, choices=['play', 'save', 'both', 'interactive'], 
                         default='interactive', help='操作模式: play=仅播放, save=仅保存视频, both=播放并保存, interactive=交互式选择')
     parser.add_argument('--output', type=str, default='', help='保存视频的文件名')
+    parser.add_argument('--workers', type=int, default=None, help='解码线程数（分段模式下为进程数），默认CPU核数')
+    parser.add_argument('--segments', type=int, default=1, help='分段并行编码的段数（需要ffmpeg），1表示不分段')
+    parser.add_argument('--buffer', type=int, default=32, help='播放时预先解码的帧数')
+    parser.add_argument('--msg', type=str, default='', help='相机录制文件（camera.msg），指定后直接转换为视频')
+    parser.add_argument('--no-overlay', action='store_true', help='--msg模式下不绘制帧号和时间')
     
     # 解析命令行参数
     args = parser.parse_args()
     
+    # 直接从录制文件生成视频
+    if args.msg:
+        ok = save_msg_as_video(args.msg, args.output or 'output.mp4', fps=args.fps,
+                               overlay=not args.no_overlay, workers=args.workers)
+        exit(0 if ok else 1)
+    
+    if args.fps is None:
+        args.fps = 24
+    
     # 交互式模式
     if args.mode == 'interactive':
         print("欢迎使用图片序列处理工具")
@@ -253,13 +664,11 @@ if __name__ == "__main__":
     # 根据模式执行操作
     if args.mode == 'play' or args.mode == 'both':
         # 播放图片
-        files = play_images_as_video(args.folder, fps=args.fps)
+        files = play_images_as_video(args.folder, fps=args.fps, buffer_size=args.buffer)
     else:
         # 仅保存模式，获取文件列表
-        image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp']
-        files = [f for f in os.listdir(args.folder) if os.path.splitext(f.lower())[1] in image_extensions]
-        files.sort(key=extract_number)
+        files = list_image_files(args.folder)
         
     # 保存视频
     if args.mode in ['save', 'both'] and files:
-        save_images_as_video(args.folder, output_path, fps=args.fps) 
\ No newline at end of file
+        save_images_as_video(args.folder, output_path, fps=args.fps, workers=args.workers, segments=args.segments) 
\ No newline at end of file
@@ -0,0 +1,274 @@
+import os
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+from utils.file_order import natural_sort_key
+from utils.ply_io import PlyStreamWriter, read_ply_vertices, vertices_xyz, vertices_intensity
+
+# 默认体素边长（米）
+DEFAULT_VOXEL_SIZE = 0.05
+
+# 默认内存上限：512MB，超过后把体素按哈希分区写到磁盘
+DEFAULT_MEMORY_LIMIT = 512 << 20
+
+# 分区数 = 2 ** PARTITION_BITS，合并时每次只把一个分区读入内存
+PARTITION_BITS = 6
+
+# 体素坐标每轴21位，可表示 ±2^20 个体素（5cm体素约 ±52km）
+_AXIS_BITS = 21
+_AXIS_BIAS = 1 << (_AXIS_BITS - 1)
+_AXIS_MAX = (1 << _AXIS_BITS) - 1
+
+# 体素累加记录：打包后的体素键、坐标和与强度和、点数
+VOXEL_RECORD = np.dtype([
+    ('key', '<i8'),
+    ('sx', '<f8'), ('sy', '<f8'), ('sz', '<f8'),
+    ('si', '<f8'),
+    ('count', '<i8'),
+])
+
+# 输出PLY的顶点类型，count为落在该体素内的原始点数
+OUTPUT_VERTEX = np.dtype([
+    ('x', '<f4'), ('y', '<f4'), ('z', '<f4'),
+    ('intensity', '<f4'),
+    ('count', '<u4'),
+])
+
+
+def voxel_keys(points, voxel_size):
+    """把点坐标量化为体素坐标，并把三个轴打包成一个int64键"""
+    grid = np.floor(np.asarray(points, dtype=np.float64) / voxel_size).astype(np.int64) + _AXIS_BIAS
+    np.clip(grid, 0, _AXIS_MAX, out=grid)
+    return (grid[:, 0] << (2 * _AXIS_BITS)) | (grid[:, 1] << _AXIS_BITS) | grid[:, 2]
+
+
+def partition_of(keys, bits=PARTITION_BITS):
+    """按体素键的乘法哈希分区，保证同一体素总落在同一分区"""
+    hashed = keys.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    return (hashed >> np.uint64(64 - bits)).astype(np.int64)
+
+
+def reduce_records(records):
+    """把键相同的记录合并为一条（坐标和、强度和、点数分别相加），结果按键排序"""
+    if len(records) == 0:
+        return records
+    keys, inverse = np.unique(records['key'], return_inverse=True)
+    reduced = np.empty(len(keys), dtype=VOXEL_RECORD)
+    reduced['key'] = keys
+    for name in ('sx', 'sy', 'sz', 'si', 'count'):
+        reduced[name] = np.bincount(inverse, weights=records[name], minlength=len(keys))
+    return reduced
+
+
+class VoxelAccumulator:
+    """
+    内存受限的体素累加器
+
+    每帧先在帧内按体素合并，再放入内存中的待合并列表；超过内存上限时先整体合并一次，
+    合并后仍超过上限的一半就按体素哈希分区追加写到磁盘，最后逐个分区合并输出
+
+    用法:
+        acc = VoxelAccumulator(voxel_size=0.05, memory_limit=512 << 20)
+        for points, intensity in frames:
+            acc.add(points, intensity)
+        for vertices in acc.iter_voxels():
+            writer.write(vertices)
+    """
+
+    def __init__(self, voxel_size=DEFAULT_VOXEL_SIZE, memory_limit=DEFAULT_MEMORY_LIMIT,
+                 spill_dir=None, partition_bits=PARTITION_BITS):
+        self.voxel_size = voxel_size
+        self.memory_limit = memory_limit
+        self.partition_bits = partition_bits
+        self.num_points = 0
+        self.num_spills = 0
+        self._pending = []
+        self._pending_bytes = 0
+        self.spill_root = spill_dir
+        self._spill_dir = None
+
+    def add(self, points, intensity=None):
+        """累加一帧点，points为 (N, 3)，intensity为 (N,)，None时按0处理"""
+        points = np.asarray(points).reshape(-1, 3)
+        if len(points) == 0:
+            return
+        records = np.empty(len(points), dtype=VOXEL_RECORD)
+        records['key'] = voxel_keys(points, self.voxel_size)
+        records['sx'] = points[:, 0]
+        records['sy'] = points[:, 1]
+        records['sz'] = points[:, 2]
+        records['si'] = 0.0 if intensity is None else intensity
+        records['count'] = 1
+        records = reduce_records(records)
+
+        self._pending.append(records)
+        self._pending_bytes += records.nbytes
+        self.num_points += len(points)
+        if self._pending_bytes > self.memory_limit:
+            self._compact()
+            if self._pending_bytes > self.memory_limit // 2:
+                self._spill()
+
+    def _compact(self):
+        """把待合并列表合并成一个数组"""
+        if len(self._pending) > 1:
+            self._pending = [reduce_records(np.concatenate(self._pending))]
+            self._pending_bytes = self._pending[0].nbytes
+
+    def _partition_path(self, part):
+        return os.path.join(self._spill_dir, f"part_{part:03d}.bin")
+
+    def _spill(self):
+        """把内存中的记录按分区追加写到磁盘"""
+        if not self._pending:
+            return
+        if self._spill_dir is None:
+            # 每次合并在spill_dir下新建私有目录，避免把中断的旧运行留下的分区文件合并进来
+            if self.spill_root is not None:
+                os.makedirs(self.spill_root, exist_ok=True)
+            self._spill_dir = tempfile.mkdtemp(prefix="voxel_merge_", dir=self.spill_root)
+
+        records = np.concatenate(self._pending) if len(self._pending) > 1 else self._pending[0]
+        parts = partition_of(records['key'], self.partition_bits)
+        order = np.argsort(parts, kind='stable')
+        bounds = np.searchsorted(parts[order], np.arange((1 << self.partition_bits) + 1))
+        records = records[order]
+        for part in range(1 << self.partition_bits):
+            lo, hi = bounds[part], bounds[part + 1]
+            if hi > lo:
+                with open(self._partition_path(part), 'ab') as f:
+                    f.write(records[lo:hi].tobytes())
+
+        self.num_spills += 1
+        self._pending = []
+        self._pending_bytes = 0
+
+    def iter_voxels(self):
+        """
+        逐批产生合并后的体素，每批为OUTPUT_VERTEX结构化数组（坐标和强度取体素内平均值）
+
+        没有溢出到磁盘时只产生一批；否则每个分区一批，任一时刻只有一个分区在内存中
+        """
+        try:
+            if self.num_spills == 0:
+                self._compact()
+                if self._pending:
+                    yield self._to_vertices(self._pending[0])
+                return
+
+            self._spill()
+            for part in range(1 << self.partition_bits):
+                path = self._partition_path(part)
+                if not os.path.exists(path):
+                    continue
+                records = reduce_records(np.fromfile(path, dtype=VOXEL_RECORD))
+                os.remove(path)
+                yield self._to_vertices(records)
+        finally:
+            self._pending = []
+            self._pending_bytes = 0
+            if self._spill_dir is not None:
+                shutil.rmtree(self._spill_dir, ignore_errors=True)
+                self._spill_dir = None
+
+    @staticmethod
+    def _to_vertices(records):
+        count = records['count']
+        vertices = np.empty(len(records), dtype=OUTPUT_VERTEX)
+        vertices['x'] = records['sx'] / count
+        vertices['y'] = records['sy'] / count
+        vertices['z'] = records['sz'] / count
+        vertices['intensity'] = records['si'] / count
+        vertices['count'] = np.minimum(count, np.iinfo(np.uint32).max)
+        return vertices
+
+
+def iter_source_frames(source):
+    """
+    逐帧产生 (points, intensity)，任一时刻只有一帧在内存中
+
+    参数:
+        source: 雷达msgpack录制文件、分块帧存储目录（含meta.json）或PLY目录
+    """
+    if os.path.isdir(source) and os.path.exists(os.path.join(source, "meta.json")):
+        from utils.frame_store import FrameStore
+        store = FrameStore(source)
+        for i in range(len(store)):
+            yield store.frame(i)
+    elif os.path.isdir(source):
+        ply_files = sorted([f for f in os.listdir(source) if f.lower().endswith('.ply')], key=natural_sort_key)
+        for ply_file in ply_files:
+            vertices = read_ply_vertices(os.path.join(source, ply_file))
+            yield vertices_xyz(vertices), vertices_intensity(vertices)
+    else:
+        from lidar_read import iter_lidar_frames
+        from utils.pointcloud2 import cloud_xyz, cloud_intensity
+        for _, cloud, _ in iter_lidar_frames(source):
+            yield cloud_xyz(cloud), cloud_intensity(cloud)
+
+
+def voxel_merge(source, output_file="final.ply", voxel_size=DEFAULT_VOXEL_SIZE,
+                memory_limit=DEFAULT_MEMORY_LIMIT, spill_dir=None, max_frames=-1, poses=None):
+    """
+    流式体素去重合并整段录制，单遍写出final.ply
+
+    参数:
+        source: 见iter_source_frames
+        output_file: 输出PLY路径，顶点带intensity和count属性
+        voxel_size: 体素边长（米）
+        memory_limit: 累加器的内存上限（字节）
+        spill_dir: 溢出分区的父目录（在其下新建临时子目录，结束后删除），None时使用系统临时目录
+        max_frames: 最多合并的帧数，-1表示全部
+        poses: (F, 4, 4) 每帧位姿（lidar_odometry.load_poses），None表示直接拼接原始坐标
+
+    返回:
+        输出的体素数
+    """
+    acc = VoxelAccumulator(voxel_size, memory_limit, spill_dir)
+    num_frames = 0
+    for points, intensity in iter_source_frames(source):
+        if 0 <= max_frames <= num_frames:
+            break
+        if poses is not None:
+            from lidar_odometry import apply_pose
+            points = apply_pose(points, poses[num_frames])
+        acc.add(points, intensity)
+        num_frames += 1
+        if num_frames % 100 == 0:
+            print(f"已累加 {num_frames} 帧, {acc.num_points} 个点")
+
+    with PlyStreamWriter(output_file, OUTPUT_VERTEX) as writer:
+        for vertices in acc.iter_voxels():
+            writer.write(vertices)
+
+    ratio = writer.count / acc.num_points if acc.num_points else 0
+    print(f"合并完成: {num_frames} 帧, {acc.num_points} 个点 -> {writer.count} 个体素 "
+          f"({ratio:.1%}), 溢出 {acc.num_spills} 次, 已保存到 {output_file}")
+    return writer.count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='流式体素去重合并点云，内存占用有上限')
+    parser.add_argument('source', type=str, help='雷达msgpack录制文件、帧存储目录或PLY目录')
+    parser.add_argument('--output', type=str, default='final.ply', help='输出PLY文件')
+    parser.add_argument('--voxel', type=float, default=DEFAULT_VOXEL_SIZE, help='体素边长（米）')
+    parser.add_argument('--memory-mb', type=int, default=DEFAULT_MEMORY_LIMIT >> 20,
+                        help='内存上限（MB），超过后溢出到磁盘')
+    parser.add_argument('--spill-dir', type=str, default=None, help='溢出分区的父目录（其下新建临时子目录），默认使用系统临时目录')
+    parser.add_argument('--max-frames', type=int, default=-1, help='最多合并的帧数，-1表示全部')
+    parser.add_argument('--odometry', action='store_true', help='按lidar_odometry估计（或缓存）的位姿变换每帧后再合并')
+    args = parser.parse_args()
+
+    poses = None
+    if args.odometry:
+        from lidar_odometry import load_poses
+        poses = load_poses(args.source)
+
+    voxel_merge(args.source, args.output, args.voxel, args.memory_mb << 20, args.spill_dir, args.max_frames, poses)
+
+
+if __name__ == "__main__":
+    main()